@@ -0,0 +1,112 @@
+import os
+import sys
+import argparse
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracer.core import Run, _get_common_root
+from tracer.filters import CodeFilter, FocusFilter
+from tracer.backends import BACKENDS, create_backend, get_available_backends
+from tests.test_proj.main import main as test_proj_main
+
+BENCH_ROOT = os.path.dirname(os.path.abspath(__file__))
+TEST_PROJ_ROOT = os.path.dirname(os.path.abspath(test_proj_main.__wrapped__.__code__.co_filename))
+
+
+def _is_prime(n):
+    if n < 2:
+        return False
+    i = 2
+    while i * i <= n:
+        if n % i == 0:
+            return False
+        i += 1
+    return True
+
+
+def _collatz_len(n):
+    steps = 0
+    while n != 1:
+        n = n // 2 if n % 2 == 0 else 3 * n + 1
+        steps += 1
+    return steps
+
+
+def cpu_heavy(n=2000):
+    primes = [i for i in range(n) if _is_prime(i)]
+    lengths = [_collatz_len(i) for i in range(1, n)]
+    return len(primes), max(lengths)
+
+
+def test_proj(repeat=200):
+    for _ in range(repeat):
+        test_proj_main.__wrapped__(2)
+
+
+WORKLOADS = {
+    'test_proj': (test_proj, TEST_PROJ_ROOT),
+    'cpu_heavy': (cpu_heavy, BENCH_ROOT),
+}
+
+
+def _timeit(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def _trace_once(func, root, backend, focus=None):
+    run = Run(root=_get_common_root([root]), focus=FocusFilter(focus, depth=0) if focus else None)
+    backend = create_backend(name=backend, run=run, code_filter=CodeFilter(roots=[root]))
+    backend.start()
+    try:
+        func()
+    finally:
+        backend.stop()
+    return run
+
+
+def bench(workload, backend, repeat, focus=None):
+    func, root = WORKLOADS[workload]
+    traced = []
+
+    def traced_func():
+        traced.append(_trace_once(func=func, root=root, backend=backend, focus=focus))
+
+    untraced_time = _timeit(func, repeat=repeat)
+    traced_time = _timeit(traced_func, repeat=repeat)
+    return {
+        'workload': workload,
+        'backend': backend,
+        'untraced': untraced_time,
+        'traced': traced_time,
+        'slowdown': traced_time / untraced_time,
+        'calls': len(traced[-1]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='compares tracing backends.')
+    parser.add_argument('--workloads', nargs='+', default=list(WORKLOADS), choices=list(WORKLOADS))
+    parser.add_argument('--backends', nargs='+', default=get_available_backends(), choices=BACKENDS)
+    parser.add_argument('--repeat', type=int, default=3)
+    # only the functions matching these get their lines and values captured, the rest are only timed.
+    parser.add_argument('--focus', nargs='+', default=None)
+    args = parser.parse_args()
+
+    print(f'{"workload":<12}{"backend":<12}{"untraced, s":>14}{"traced, s":>14}{"slowdown":>10}{"calls":>10}')
+    for workload in args.workloads:
+        for backend in args.backends:
+            res = bench(workload=workload, backend=backend, repeat=args.repeat, focus=args.focus)
+            print(
+                f'{res["workload"]:<12}{res["backend"]:<12}{res["untraced"]:>14.5f}'
+                f'{res["traced"]:>14.5f}{res["slowdown"]:>9.1f}x{res["calls"]:>10}'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import os
+import sys
+import argparse
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracer.core import Run, _get_common_root
+from tracer.filters import CodeFilter
+from tracer.backends import create_backend, get_default_backend_name
+from tracer.storage import TraceWriter, TraceReader
+from tracer.collector import connect, ON_FULL
+from bench_backends import WORKLOADS
+
+
+def _time(func, target, root, backend):
+    backend = create_backend(name=backend, run=target, code_filter=CodeFilter(roots=[root]))
+    start = perf_counter()
+    backend.start()
+    try:
+        func()
+    finally:
+        backend.stop()
+    return perf_counter() - start
+
+
+# cost of the traced process only: the collector works on in its own process after the traced code is done.
+def bench(workload, backend, on_full, tmp_dir):
+    func, root = WORKLOADS[workload]
+    start = perf_counter()
+    func()
+    untraced = perf_counter() - start
+
+    run = Run(root=_get_common_root([root]))
+    in_memory = _time(func, run, root, backend)
+
+    path = os.path.join(tmp_dir, f'{workload}-writer.bin')
+    run = Run(root=_get_common_root([root]), keep=False)
+    with TraceWriter(path) as run.sink:
+        streamed = _time(func, run, root, backend)
+
+    path = os.path.join(tmp_dir, f'{workload}-collector.bin')
+    client = connect(True, output=path, meta={'root': root}, on_full=on_full)
+    collected = _time(func, client, root, backend)
+    start = perf_counter()
+    client.close()
+    drained = perf_counter() - start
+    with TraceReader(path) as reader:
+        calls = len(reader.load())
+    return {
+        'workload': workload,
+        'untraced': untraced,
+        'in_memory': in_memory,
+        'streamed': streamed,
+        'collected': collected,
+        'drained': drained,
+        'events': client.sent + client.dropped,
+        'dropped': client.dropped,
+        'blocked': client.blocked,
+        'calls': calls,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='compares tracing into memory, into a trace file and into a collector.')
+    parser.add_argument('--workloads', nargs='+', default=list(WORKLOADS), choices=list(WORKLOADS))
+    parser.add_argument('--backend', default=get_default_backend_name())
+    parser.add_argument('--on-full', default='block', choices=ON_FULL)
+    args = parser.parse_args()
+
+    print(
+        f'{"workload":<12}{"untraced, s":>12}{"memory, s":>12}{"file, s":>12}{"collector, s":>14}'
+        f'{"drain, s":>10}{"ns/event":>10}{"events":>10}{"dropped":>10}{"blocked":>9}'
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for workload in args.workloads:
+            res = bench(workload, backend=args.backend, on_full=args.on_full, tmp_dir=tmp_dir)
+            per_event = (res['collected'] - res['untraced']) / res['events'] * 1e9
+            print(
+                f'{res["workload"]:<12}{res["untraced"]:>12.4f}{res["in_memory"]:>12.4f}{res["streamed"]:>12.4f}'
+                f'{res["collected"]:>14.4f}{res["drained"]:>10.4f}{per_event:>10.0f}{res["events"]:>10}'
+                f'{res["dropped"]:>10}{res["blocked"]:>9}'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import os
+import sys
+import random
+import shutil
+import argparse
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracer.core import Run, Call, CodeInfo
+from tracer.diff import diff
+from tracer.storage import TraceWriter
+
+
+# random call tree of `n` calls of `names` functions, up to `depth` deep, with times in ns.
+# with `writer` the run's events go to a trace file too, a line per call so that calls have something to decode.
+def _make_run(n, names, depth, seed, writer=None):
+    rnd = random.Random(seed)
+    infos = [CodeInfo(name=f'func_{i}') for i in range(names)]
+    calls = []
+    stack = []
+    ts = 0
+
+    def _return(i):
+        calls[i].ret_timestamp = ts
+        if writer is not None:
+            writer.write_return(i, ts, None, None)
+
+    for i in range(n):
+        while stack and (len(stack) >= depth or rnd.random() < 0.3):
+            _return(stack.pop())
+            ts += rnd.randint(1, 100)
+        info = infos[rnd.randrange(names)]
+        parent = stack[-1] if stack else None
+        calls.append(Call(id=i, info=info, name=info.name, parent=parent, call_timestamp=ts))
+        if writer is not None:
+            writer.write_call(i, parent, info.name, None, None, 0, None, ts, None)
+            writer.write_line(i, 1, ts, None)
+        stack.append(i)
+        ts += rnd.randint(1, 100)
+    while stack:
+        _return(stack.pop())
+        ts += 1
+    return Run(calls=calls)
+
+
+def _write_run(path, n, names, depth, seed):
+    with TraceWriter(path, t0=0) as writer:
+        _make_run(n, names, depth, seed, writer=writer)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='measures alignment of two runs by paths of qualified names.')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10 ** 4, 10 ** 5, 10 ** 6])
+    parser.add_argument('--names', type=int, default=50)
+    parser.add_argument('--depth', type=int, default=20)
+    parser.add_argument('--inputs', nargs='+', default=['runs', 'files'], choices=['runs', 'files'],
+                        help='diff live runs and/or trace files of the same runs, loading them included.')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        print(f'{"inputs":>8}{"calls":>10}{"paths":>10}{"align, s":>12}{"us/call":>10}{"report, s":>12}')
+        for n in args.sizes:
+            for inputs in args.inputs:
+                if inputs == 'files':
+                    before = _write_run(os.path.join(tmp, 'before.bin'), n, args.names, args.depth, seed=0)
+                    after = _write_run(os.path.join(tmp, 'after.bin'), n, args.names, args.depth, seed=1)
+                else:
+                    before = _make_run(n, args.names, args.depth, seed=0)
+                    after = _make_run(n, args.names, args.depth, seed=1)
+                start = perf_counter()
+                with diff(before, after) as d:
+                    align = perf_counter() - start
+                    start = perf_counter()
+                    d.report()
+                    report = perf_counter() - start
+                print(f'{inputs:>8}{n:>10}{len(d):>10}{align:>12.3f}{align / n / 2 * 1e6:>10.2f}{report:>12.3f}')
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import os
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PATHS = {
+    'core': 'tracer',
+    'gui': 'tracer.gui',
+}
+
+
+# `(self, cumulative)` us per module of a single cold import of `module` in a fresh interpreter.
+def _import_times(module):
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT,
+        capture_output=True,
+        text=True
+    )
+    if proc.returncode != 0:
+        return None
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or line.endswith('imported package'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description='measures cold import times of the tracer with and without the viewer.')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='number of the slowest modules reported per path.')
+    parser.add_argument('--max-core-ms', type=float, help='exit with 1 if `import tracer` takes longer.')
+    parser.add_argument('--max-gui-ms', type=float, help='exit with 1 if `import tracer.gui` takes longer.')
+    args = parser.parse_args()
+
+    limits = {'core': args.max_core_ms, 'gui': args.max_gui_ms}
+    failed = False
+    for path, module in PATHS.items():
+        # the best of several runs, the first one may still be compiling.
+        best = None
+        for _ in range(args.repeat):
+            times = _import_times(module)
+            if times is None:
+                break
+            if best is None or times[module][1] < best[module][1]:
+                best = times
+        if best is None:
+            print(f'{path}: `import {module}` failed, skipped')
+            continue
+
+        total_ms = best[module][1] / 1e3
+        print(f'{path}: `import {module}` {total_ms:.1f}ms, {len(best)} modules')
+        for name, (self_us, _) in sorted(best.items(), key=lambda item: item[1][0], reverse=True)[:args.top]:
+            print(f'  {name:<48}{self_us / 1e3:>10.2f}ms')
+        limit = limits[path]
+        if limit is not None and total_ms > limit:
+            print(f'{path}: {total_ms:.1f}ms is over the limit of {limit:.1f}ms')
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
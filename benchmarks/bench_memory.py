@@ -0,0 +1,138 @@
+import os
+import sys
+import gc
+import json
+import argparse
+import platform
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracer.core import Run, _get_common_root, __version__
+from tracer.filters import CodeFilter
+from tracer.backends import BACKENDS, create_backend
+from tracer.capture import CapturePolicy
+
+BENCH_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _leaf(x):
+    return x + 1
+
+
+def many_calls(n):
+    acc = 0
+    for i in range(n):
+        acc = _leaf(acc)
+    return acc
+
+
+def many_lines(n):
+    acc = 0
+    for i in range(n):
+        acc += i
+    return acc
+
+
+WORKLOADS = {
+    'many_calls': many_calls,
+    'many_lines': many_lines,
+}
+
+
+def _count_lines(run):
+    return sum(len(c.lines) for c in run.calls)
+
+
+def bench(workload, n, backend, capture_mode):
+    func = WORKLOADS[workload]
+    gc.collect()
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+
+    run = Run(root=_get_common_root([BENCH_ROOT]), capture=CapturePolicy(mode=capture_mode))
+    code_filter = CodeFilter(roots=[BENCH_ROOT])
+    backend = create_backend(name=backend, run=run, code_filter=code_filter)
+    backend.start()
+    try:
+        func(n)
+    finally:
+        backend.stop()
+
+    gc.collect()
+    # what stays retained by the run once tracing is done.
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    retained -= start
+    peak -= start
+
+    calls = len(run)
+    lines = _count_lines(run)
+    return {
+        'workload': workload,
+        'backend': backend.name,
+        'capture': capture_mode,
+        'n': n,
+        'calls': calls,
+        'lines': lines,
+        'retained': retained,
+        'peak': peak,
+        'bytes_per_call': retained / calls,
+        'bytes_per_line': retained / max(lines, 1),
+    }
+
+
+# bytes per call and per line against the same workload, backend and capture in a saved report, e.g. of the previous version.
+def _print_comparison(results, path):
+    with open(path) as f:
+        before = {(r['workload'], r['backend'], r['capture']): r for r in json.load(f)['results']}
+    print(f'against {path}:')
+    for res in results:
+        prev = before.get((res['workload'], res['backend'], res['capture']))
+        if prev is None:
+            continue
+        print(
+            f'  {res["workload"]:<12}'
+            f'B/call {prev["bytes_per_call"]:.0f} -> {res["bytes_per_call"]:.0f} '
+            f'({res["bytes_per_call"] / prev["bytes_per_call"] - 1:+.0%}), '
+            f'B/line {prev["bytes_per_line"]:.0f} -> {res["bytes_per_line"]:.0f} '
+            f'({res["bytes_per_line"] / prev["bytes_per_line"] - 1:+.0%}), '
+            f'peak {prev["peak"] / 2 ** 20:.2f} -> {res["peak"] / 2 ** 20:.2f} MB'
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='measures memory retained by a traced run.')
+    parser.add_argument('-n', type=int, default=100000)
+    parser.add_argument('--backend', default='settrace', choices=BACKENDS)
+    parser.add_argument('--capture', default='copy')
+    parser.add_argument('-o', '--output', help='path to save the results to as json, to compare with later.')
+    parser.add_argument('--compare', help='path of saved results to compare bytes per call and per line with.')
+    args = parser.parse_args()
+
+    results = []
+    print(f'{"workload":<12}{"calls":>10}{"lines":>10}{"retained, MB":>14}{"peak, MB":>10}{"B/call":>10}{"B/line":>10}')
+    for workload in WORKLOADS:
+        res = bench(workload=workload, n=args.n, backend=args.backend, capture_mode=args.capture)
+        results.append(res)
+        print(
+            f'{res["workload"]:<12}{res["calls"]:>10}{res["lines"]:>10}'
+            f'{res["retained"] / 2 ** 20:>14.2f}{res["peak"] / 2 ** 20:>10.2f}'
+            f'{res["bytes_per_call"]:>10.0f}{res["bytes_per_line"]:>10.0f}'
+        )
+
+    if args.compare:
+        _print_comparison(results, args.compare)
+    if args.output:
+        report = {
+            'tracer': __version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import types
+import argparse
+from pathlib import Path
+from time import perf_counter_ns
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracer import core
+from tracer.core import CodeCache, _get_code_qual_name, _get_qual_names, _read_file_lines
+
+ROOT = Path(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _iter_codes(code):
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from _iter_codes(const)
+
+
+def _get_codes(path):
+    with open(path) as f:
+        module = compile(f.read(), path, 'exec')
+    return [c for c in _iter_codes(module) if c is not module]
+
+
+def _per_name_ns(func, codes, repeat):
+    best = None
+    for _ in range(repeat):
+        start = perf_counter_ns()
+        for code in codes:
+            func(code)
+        elapsed = perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(codes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='measures the cost of naming a code object.')
+    parser.add_argument('--path', default=core.__file__)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    codes = _get_codes(args.path)
+    lines = _read_file_lines(args.path)
+    names = _get_qual_names(lines)
+    cache = CodeCache(root=ROOT)
+    for code in codes:
+        cache.get(code)
+
+    results = {
+        # the index of the module is parsed anew for every name.
+        'ast index, uncached': lambda c: _get_code_qual_name(ROOT, c, names=_get_qual_names(_read_file_lines(c.co_filename))),
+        # what pythons before 3.11 pay per new code object.
+        'ast index, cached': lambda c: _get_code_qual_name(ROOT, c, names=names),
+        'cache hit': cache.get,
+    }
+    if sys.version_info >= (3, 11):
+        results['co_qualname'] = lambda c: _get_code_qual_name(ROOT, c)
+
+    print(f'{len(codes)} code objects of `{args.path}`')
+    start = perf_counter_ns()
+    _get_qual_names(lines)
+    print(f'{"index build, per module":<28}{(perf_counter_ns() - start) / 1e3:>12.1f}us')
+    for label, func in results.items():
+        print(f'{label:<28}{_per_name_ns(func, codes, args.repeat) / 1e3:>12.2f}us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import os
+import sys
+import argparse
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracer.core import Run, _get_common_root
+from tracer.filters import CodeFilter
+from tracer.sampling import SamplingBackend
+
+BENCH_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _fib(n):
+    return n if n < 2 else _fib(n - 1) + _fib(n - 2)
+
+
+def _checksum(n):
+    total = 0
+    for i in range(n):
+        total = (total * 31 + i) % 1000003
+    return total
+
+
+def cpu_bound():
+    return _fib(27), _checksum(3000000)
+
+
+def _run_sampled(interval):
+    run = Run(root=_get_common_root([BENCH_ROOT]))
+    backend = SamplingBackend(run=run, code_filter=CodeFilter(roots=[BENCH_ROOT]), interval=interval)
+    backend.start()
+    try:
+        cpu_bound()
+    finally:
+        backend.stop()
+    return run, backend
+
+
+def _time(func):
+    start = perf_counter()
+    rv = func()
+    return perf_counter() - start, rv
+
+
+def main():
+    parser = argparse.ArgumentParser(description='measures overhead of sampling a cpu bound workload.')
+    parser.add_argument('--intervals', nargs='+', type=float, default=[0.01, 0.005, 0.001])
+    parser.add_argument('--repeat', type=int, default=7)
+    args = parser.parse_args()
+
+    # runs are interleaved and the best of each is taken, so that drifts of the machine affect all of them alike.
+    plain = float('inf')
+    sampled = {interval: (float('inf'), None) for interval in args.intervals}
+    for _ in range(args.repeat):
+        plain = min(plain, _time(cpu_bound)[0])
+        for interval in args.intervals:
+            elapsed, rv = _time(lambda: _run_sampled(interval))
+            if elapsed < sampled[interval][0]:
+                sampled[interval] = (elapsed, rv)
+
+    print(f'untraced: {plain:.3f}s')
+    print(f'{"interval, s":<14}{"time, s":>10}{"overhead":>10}{"samples":>10}{"calls":>10}')
+    for interval, (elapsed, (run, backend)) in sampled.items():
+        overhead = (elapsed - plain) / plain * 100
+        print(f'{interval:<14}{elapsed:>10.3f}{overhead:>9.1f}%{backend.samples:>10}{len(run):>10}')
+
+
+if __name__ == '__main__':
+    main()
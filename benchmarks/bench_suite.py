@@ -0,0 +1,202 @@
+import os
+import gc
+import sys
+import json
+import argparse
+import platform
+import tracemalloc
+from time import perf_counter_ns
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracer.core import Run, _get_common_root, __version__
+from tracer.filters import CodeFilter
+from tracer.backends import BACKENDS, create_backend, get_available_backends
+from tracer.capture import MODES, CapturePolicy
+from workloads import WORKLOADS
+
+BENCH_ROOT = os.path.dirname(os.path.abspath(__file__))
+EVENTS = ('call', 'line', 'return', 'yield')
+
+
+# a run timing its own handlers per event, resumes of generators are calls as far as backends are concerned.
+class _TimedRun(Run):
+
+    def __post_init__(self):
+        super().__post_init__()
+        self.counts = dict.fromkeys(EVENTS, 0)
+        self.ns = dict.fromkeys(EVENTS, 0)
+
+    def on_call(self, frame):
+        start = perf_counter_ns()
+        rv = super().on_call(frame)
+        self.ns['call'] += perf_counter_ns() - start
+        self.counts['call'] += 1
+        return rv
+
+    def on_line(self, frame):
+        start = perf_counter_ns()
+        super().on_line(frame)
+        self.ns['line'] += perf_counter_ns() - start
+        self.counts['line'] += 1
+
+    def on_return(self, frame, retval):
+        start = perf_counter_ns()
+        super().on_return(frame, retval)
+        self.ns['return'] += perf_counter_ns() - start
+        self.counts['return'] += 1
+
+    def on_yield(self, frame, value):
+        start = perf_counter_ns()
+        super().on_yield(frame, value)
+        self.ns['yield'] += perf_counter_ns() - start
+        self.counts['yield'] += 1
+
+
+def _create_run(cls, capture):
+    return cls(root=_get_common_root([BENCH_ROOT]), capture=CapturePolicy(mode=capture))
+
+
+# only the workloads are traced, not the runner living next to them.
+def _trace(func, scale, backend, run):
+    code_filter = CodeFilter(roots=[BENCH_ROOT], include=['*/workloads.py'])
+    backend = create_backend(name=backend, run=run, code_filter=code_filter)
+    start = perf_counter_ns()
+    backend.start()
+    try:
+        func(scale)
+    finally:
+        backend.stop()
+    return perf_counter_ns() - start
+
+
+def _best_ns(func, repeat):
+    best = None
+    for _ in range(repeat):
+        elapsed = func()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _time_untraced(func, scale):
+    start = perf_counter_ns()
+    func(scale)
+    return perf_counter_ns() - start
+
+
+# peak of memory allocated while running `func`, the run included when traced.
+def _peak_bytes(func):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def bench(workload, backend, capture='copy', scale=1, repeat=3):
+    func = WORKLOADS[workload]
+    untraced = _best_ns(lambda: _time_untraced(func, scale), repeat)
+    traced = _best_ns(lambda: _trace(func, scale, backend, _create_run(Run, capture)), repeat)
+
+    # handlers are timed in a pass of their own, so that timing them doesn't add to the wall times.
+    timed = _create_run(_TimedRun, capture)
+    _trace(func, scale, backend, timed)
+    events = sum(timed.counts.values())
+    handlers = sum(timed.ns.values())
+
+    untraced_peak = _peak_bytes(lambda: func(scale))
+    traced_peak = _peak_bytes(lambda: _trace(func, scale, backend, _create_run(Run, capture)))
+
+    return {
+        'workload': workload,
+        'backend': backend,
+        'capture': capture,
+        'scale': scale,
+        'untraced_s': untraced / 1e9,
+        'traced_s': traced / 1e9,
+        'slowdown': traced / untraced if untraced else None,
+        'events': events,
+        'event_counts': timed.counts,
+        'events_per_s': events / (traced / 1e9) if traced else None,
+        # all the time tracing adds per event, spent in the interpreter, the backend and the run.
+        'overhead_ns_per_event': (traced - untraced) / events if events else None,
+        # of that, the time spent in the run's handler of each kind of event.
+        'handler_ns_per_event': {e: timed.ns[e] / n for e, n in timed.counts.items() if n},
+        # the rest, dispatching events to the handlers.
+        'dispatch_ns_per_event': max(traced - untraced - handlers, 0) / events if events else None,
+        'calls': len(timed.calls),
+        'peak_bytes': traced_peak,
+        'peak_mb_per_1m_events': max(traced_peak - untraced_peak, 0) / events * 1e6 / 2 ** 20 if events else None,
+    }
+
+
+def _print_table(results):
+    print(
+        f'{"workload":<14}{"backend":<12}{"slowdown":>10}{"events":>10}{"events/s":>12}'
+        f'{"call ns":>10}{"line ns":>10}{"return ns":>11}{"MB/1M ev":>10}',
+        file=sys.stderr
+    )
+    for res in results:
+        handlers = res['handler_ns_per_event']
+        print(
+            f'{res["workload"]:<14}{res["backend"]:<12}{res["slowdown"]:>9.1f}x{res["events"]:>10}'
+            f'{res["events_per_s"]:>12.0f}{handlers.get("call", 0):>10.0f}{handlers.get("line", 0):>10.0f}'
+            f'{handlers.get("return", 0):>11.0f}{res["peak_mb_per_1m_events"]:>10.1f}',
+            file=sys.stderr
+        )
+
+
+# slowdowns of the same workloads and backends in a previous report, i.e. of another version.
+def _print_comparison(results, path):
+    with open(path) as f:
+        before = {(r['workload'], r['backend'], r['capture'], r['scale']): r for r in json.load(f)['results']}
+    print(f'slowdown against {path}:', file=sys.stderr)
+    for res in results:
+        prev = before.get((res['workload'], res['backend'], res['capture'], res['scale']))
+        if prev is None:
+            continue
+        print(
+            f'  {res["workload"]:<14}{res["backend"]:<12}{prev["slowdown"]:>8.1f}x -> {res["slowdown"]:.1f}x'
+            f'  ({res["slowdown"] / prev["slowdown"] - 1:+.0%})',
+            file=sys.stderr
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='measures the overhead of tracing synthetic workloads, as json.')
+    parser.add_argument('--workloads', nargs='+', default=list(WORKLOADS), choices=list(WORKLOADS))
+    parser.add_argument('--backends', nargs='+', default=get_available_backends(), choices=BACKENDS)
+    parser.add_argument('--capture', default='copy', choices=MODES)
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('-o', '--output', help='path of the json report, printed if not set.')
+    parser.add_argument('--compare', help='path of a json report to compare slowdowns with.')
+    args = parser.parse_args()
+
+    results = []
+    for workload in args.workloads:
+        for backend in args.backends:
+            results.append(bench(workload, backend, capture=args.capture, scale=args.scale, repeat=args.repeat))
+    report = {
+        'tracer': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+    # the table goes to stderr so that stdout stays valid json.
+    _print_table(results)
+    if args.compare:
+        _print_comparison(results, args.compare)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
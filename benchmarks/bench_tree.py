@@ -0,0 +1,99 @@
+import os
+import sys
+import argparse
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracer.core import Run, _get_common_root
+from tracer.filters import CodeFilter
+from tracer.backends import BACKENDS, create_backend
+from tracer.capture import CapturePolicy
+
+BENCH_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _recurse(n):
+    if n == 0:
+        return 0
+    return _recurse(n - 1) + 1
+
+
+def _leaf():
+    return 0
+
+
+def deep(n):
+    return _recurse(n)
+
+
+def wide(n):
+    for _ in range(n):
+        _leaf()
+
+
+WORKLOADS = {
+    'deep': deep,
+    'wide': wide,
+}
+
+
+def _trace(func, n, backend):
+    run = Run(root=_get_common_root([BENCH_ROOT]), capture=CapturePolicy(mode='ref'))
+    backend = create_backend(name=backend, run=run, code_filter=CodeFilter(roots=[BENCH_ROOT]))
+    backend.start()
+    try:
+        func(n)
+    finally:
+        backend.stop()
+    return run
+
+
+def _timeit(func):
+    start = perf_counter()
+    rv = func()
+    return perf_counter() - start, rv
+
+
+def bench(workload, n, backend):
+    func = WORKLOADS[workload]
+    trace_time, run = _timeit(lambda: _trace(func=func, n=n, backend=backend))
+    walk_time, max_depth = _timeit(lambda: max(d for d, _ in run.walk()))
+    post_time, _ = _timeit(lambda: sum(1 for _ in run.walk_post_order()))
+    index_time, _ = _timeit(run.get_index)
+    return {
+        'workload': workload,
+        'n': n,
+        'calls': len(run),
+        'depth': max_depth,
+        'trace': trace_time,
+        'walk': walk_time,
+        'walk_post_order': post_time,
+        'index': index_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='measures call tree construction and traversal on deep and wide runs.')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10 ** 3, 10 ** 4, 10 ** 5])
+    parser.add_argument('--backend', default='settrace', choices=BACKENDS)
+    args = parser.parse_args()
+    sys.setrecursionlimit(max(args.sizes) + 1000)
+
+    print(
+        f'{"workload":<10}{"calls":>10}{"depth":>10}{"trace, s":>10}'
+        f'{"walk, ns/call":>16}{"post, ns/call":>16}{"index, ns/call":>16}'
+    )
+    for workload in WORKLOADS:
+        for n in args.sizes:
+            res = bench(workload=workload, n=n, backend=args.backend)
+            calls = res['calls']
+            print(
+                f'{res["workload"]:<10}{calls:>10}{res["depth"]:>10}{res["trace"]:>10.3f}'
+                f'{res["walk"] / calls * 1e9:>16.0f}{res["walk_post_order"] / calls * 1e9:>16.0f}'
+                f'{res["index"] / calls * 1e9:>16.0f}'
+            )
+
+
+if __name__ == '__main__':
+    main()
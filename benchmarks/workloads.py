@@ -0,0 +1,138 @@
+# synthetic workloads of `bench_suite.py`, each stressing one kind of event.
+# every workload takes `scale`, roughly how many times its basic unit of work is repeated.
+
+
+def _down(n):
+    if n == 0:
+        return 0
+    return _down(n - 1) + 1
+
+
+# mostly calls and returns, each one level deeper than the previous.
+def recursion(scale=1):
+    total = 0
+    for _ in range(50 * scale):
+        total += _down(400)
+    return total
+
+
+def _leaf(x):
+    return x
+
+
+def _branch(x, width):
+    total = 0
+    for i in range(width):
+        total += _leaf(x + i)
+    return total
+
+
+# many short calls of the same caller, i.e. a flat and very wide tree.
+def fan_out(scale=1):
+    total = 0
+    for i in range(20 * scale):
+        total += _branch(i, 500)
+    return total
+
+
+# lines only, with a couple of locals changing on every one of them.
+def loops(scale=1):
+    acc = 0
+    x = 1.0
+    for i in range(50000 * scale):
+        acc = (acc * 31 + i) % 1000003
+        x = x * 0.5 + i
+    return acc, x
+
+
+def _source(n):
+    for i in range(n):
+        yield i
+
+
+def _square(items):
+    for x in items:
+        yield x * x
+
+
+def _evens(items):
+    for x in items:
+        if x % 2 == 0:
+            yield x
+
+
+# suspensions and resumptions of a chain of generators.
+def generators(scale=1):
+    return sum(_evens(_square(_source(10000 * scale))))
+
+
+def _fill(n):
+    rows = []
+    index = {}
+    for i in range(n):
+        row = {'id': i, 'name': f'row-{i}', 'tags': [i, i + 1, i + 2]}
+        rows.append(row)
+        index[row['name']] = row
+    return rows, index
+
+
+# locals holding big containers, which get captured on every line they change on.
+def large_locals(scale=1):
+    total = 0
+    for _ in range(10 * scale):
+        rows, index = _fill(200)
+        total += len(rows) + len(index)
+    return total
+
+
+class Shape:
+
+    def __init__(self, size):
+        self.size = size
+
+    @property
+    def area(self):
+        return self.size * self.size
+
+    def scaled(self, k):
+        return type(self)(self.size * k)
+
+    def __add__(self, other):
+        return type(self)(self.size + other.size)
+
+
+class Square(Shape):
+
+    def describe(self):
+        return f'square of {self.area}'
+
+
+class Circle(Shape):
+
+    @property
+    def area(self):
+        return 3 * super().area
+
+    def describe(self):
+        return f'circle of {self.area}'
+
+
+# constructors, properties, dunder methods and `super` calls of a small class hierarchy.
+def oop(scale=1):
+    total = Square(0)
+    names = 0
+    for i in range(2000 * scale):
+        shape = Square(i) if i % 2 else Circle(i)
+        total = total + shape.scaled(2)
+        names += len(shape.describe())
+    return total.size, names
+
+
+WORKLOADS = {
+    'recursion': recursion,
+    'fan_out': fan_out,
+    'loops': loops,
+    'generators': generators,
+    'large_locals': large_locals,
+    'oop': oop,
+}
@@ -11,4 +11,8 @@ setup(
     url='https://github.com/akv17/tracer',
     packages=find_packages(exclude=('tests',)),
     python_requires='>=3.6',
+    # the tracer itself only needs the standard library, the viewer is an extra.
+    extras_require={
+        'gui': ['PySide2', 'QDarkStyle'],
+    },
 )
@@ -0,0 +1,108 @@
+import os
+import sys
+import unittest
+
+from tracer.core import Run, _get_common_root
+from tracer.filters import CodeFilter
+from tracer.backends import SetTraceBackend, create_backend, get_default_backend_name, _get_tool_ids
+from tests.test_proj.main import main
+from tests.test_proj.workers import reenter
+
+TEST_PROJ_ROOT = os.path.dirname(main.__wrapped__.__code__.co_filename)
+
+
+def _trace(backend):
+    run = Run(root=_get_common_root([TEST_PROJ_ROOT]))
+    code_filter = CodeFilter(roots=[TEST_PROJ_ROOT])
+    backend = create_backend(name=backend, run=run, code_filter=code_filter)
+    backend.start()
+    try:
+        rv = main.__wrapped__(2)
+    finally:
+        backend.stop()
+    return rv, run
+
+
+class TestBackends(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.expected_names = [
+            'main',
+            'Foo.foo',
+            'bar',
+            'zzz',
+            'foo',
+            'baz.buzz',
+            'Foo.__call__',
+            'Foo.bar',
+        ]
+
+    def _check_run(self, rv, run):
+        self.assertEqual(rv, -7)
+        self.assertEqual([c.name for c in run.calls], self.expected_names)
+        self.assertEqual(run.calls[0].retval, -7)
+        self.assertEqual(sorted({ln.num for ln in run.calls[0].lines}), [11, 12, 13, 14, 15, 17, 18, 19])
+
+    def test_default_backend(self):
+        expected = 'monitoring' if hasattr(sys, 'monitoring') else 'settrace'
+        self.assertEqual(get_default_backend_name(), expected)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            create_backend(name='unknown', run=None, code_filter=None)
+
+    def test_settrace(self):
+        rv, run = _trace('settrace')
+        self._check_run(rv, run)
+
+    @unittest.skipUnless(hasattr(sys, 'monitoring'), 'requires python 3.12+')
+    def test_monitoring(self):
+        rv, run = _trace('monitoring')
+        self._check_run(rv, run)
+        # a second run must see the code disabled by the first one again.
+        rv, run = _trace('monitoring')
+        self._check_run(rv, run)
+
+    # tool ids taken by other tools, i.e. `cProfile`, are left to them.
+    @unittest.skipUnless(hasattr(sys, 'monitoring'), 'requires python 3.12+')
+    def test_monitoring_tool_ids(self):
+        monitoring = sys.monitoring
+        taken = []
+        try:
+            for tool_id in _get_tool_ids():
+                monitoring.use_tool_id(tool_id, 'other')
+                taken.append(tool_id)
+                if len(taken) < len(_get_tool_ids()):
+                    rv, run = _trace('monitoring')
+                    self._check_run(rv, run)
+                    self.assertEqual(monitoring.get_tool(tool_id), 'other')
+
+            self.assertIsInstance(create_backend(name='auto', run=None, code_filter=None), SetTraceBackend)
+            with self.assertRaisesRegex(RuntimeError, 'no free'):
+                _trace('monitoring')
+        finally:
+            for tool_id in taken:
+                monitoring.free_tool_id(tool_id)
+
+    def _check_reenter(self, name):
+        for fail in (False, True):
+            with self.subTest(fail=fail):
+                run = Run(root=_get_common_root([TEST_PROJ_ROOT]))
+                backend = create_backend(name=name, run=run, code_filter=CodeFilter(roots=[TEST_PROJ_ROOT]))
+                try:
+                    if fail:
+                        with self.assertRaises(ValueError):
+                            reenter(2, backend.start, fail=True)
+                    else:
+                        self.assertEqual(reenter(2, backend.start), 2)
+                finally:
+                    backend.stop()
+                # only the call made after the start is traced, the frames running before it are ignored.
+                self.assertEqual([(c.name, c.retval) for c in run.calls], [('reenter', 0)])
+
+    def test_settrace_reenter(self):
+        self._check_reenter('settrace')
+
+    @unittest.skipUnless(hasattr(sys, 'monitoring'), 'requires python 3.12+')
+    def test_monitoring_reenter(self):
+        self._check_reenter('monitoring')
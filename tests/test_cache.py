@@ -0,0 +1,88 @@
+import os
+import inspect
+import tempfile
+import unittest
+from pathlib import Path
+
+from tracer.core import CodeCache
+
+
+def foo():
+    return inspect.currentframe()
+
+
+class Foo:
+
+    def regular_method(self):
+        return inspect.currentframe()
+
+
+class TestCodeCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        frame = inspect.currentframe()
+        self.root = Path(frame.f_code.co_filename).parent
+        self.cache = CodeCache(root=self.root)
+
+    def test_info(self):
+        info = self.cache.get(foo.__code__)
+        self.assertEqual(info.name, 'foo')
+        self.assertTrue(info.traced)
+        self.assertEqual(info.lines[foo.__code__.co_firstlineno - 1], 'def foo():\n')
+
+        info = self.cache.get(Foo.regular_method.__code__)
+        self.assertEqual(info.name, 'Foo.regular_method')
+
+    def test_hits_misses(self):
+        for _ in range(3):
+            self.cache.get(foo.__code__)
+        self.cache.get(Foo.regular_method.__code__)
+        self.assertEqual(self.cache.misses, 2)
+        self.assertEqual(self.cache.hits, 2)
+        self.assertEqual(len(self.cache), 2)
+
+    def test_untraced(self):
+        info = self.cache.get(os.path.join.__code__)
+        self.assertFalse(info.traced)
+
+    def test_mtime_invalidation(self):
+        self.cache = CodeCache(root=self.root, check_interval=0)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'mod.py')
+            with open(path, 'w') as f:
+                f.write('def bar():\n    return 1\n')
+            with open(path) as f:
+                code = compile(f.read(), path, 'exec').co_consts[0]
+
+            info = self.cache.get(code)
+            self.assertEqual(info.lines[1], '    return 1\n')
+            self.cache.get(code)
+            self.assertEqual(self.cache.misses, 1)
+
+            with open(path, 'w') as f:
+                f.write('def bar():\n    return 2\n')
+            os.utime(path, (info.mtime + 1, info.mtime + 1))
+
+            info = self.cache.get(code)
+            self.assertEqual(info.lines[1], '    return 2\n')
+            self.assertEqual(self.cache.misses, 2)
+
+    def test_mtime_check_interval(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'mod.py')
+            with open(path, 'w') as f:
+                f.write('def bar():\n    return 1\n')
+            with open(path) as f:
+                code = compile(f.read(), path, 'exec').co_consts[0]
+
+            info = self.cache.get(code)
+            with open(path, 'w') as f:
+                f.write('def bar():\n    return 2\n')
+            os.utime(path, (info.mtime + 1, info.mtime + 1))
+
+            # the file isn't checked again within the interval.
+            self.assertIs(self.cache.get(code), info)
+            self.assertEqual(self.cache.misses, 1)
+            self.cache.check_interval = 0
+            self.assertEqual(self.cache.get(code).lines[1], '    return 2\n')
+            self.assertEqual(self.cache.misses, 2)
@@ -0,0 +1,134 @@
+import os
+import unittest
+
+from tracer.core import Run, _get_common_root
+from tracer.filters import CodeFilter
+from tracer.backends import create_backend
+from tracer.capture import CapturePolicy, DELETED, apply_delta
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def accumulate(n):
+    items = []
+    total = 0
+    for i in range(n):
+        items.append(i)
+        total += i
+    del items
+    return total
+
+
+def _trace(func, *args, capture=None):
+    run = Run(root=_get_common_root([ROOT]), capture=capture)
+    backend = create_backend(name='settrace', run=run, code_filter=CodeFilter(roots=[ROOT]))
+    backend.start()
+    try:
+        func(*args)
+    finally:
+        backend.stop()
+    return run
+
+
+# compares like arrays do, elementwise and without a truth value.
+class Array:
+    copies = 0
+
+    def __init__(self, items):
+        self.items = list(items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __eq__(self, other):
+        raise ValueError('truth value is ambiguous')
+
+    def __copy__(self):
+        type(self).copies += 1
+        return Array(self.items)
+
+
+class TestCapturePolicy(unittest.TestCase):
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            CapturePolicy(mode='unknown')
+
+    def test_repr(self):
+        policy = CapturePolicy(mode='repr', max_len=16)
+        self.assertEqual(policy.capture(1), '1')
+        captured = policy.capture('x' * 100)
+        self.assertLessEqual(len(captured), 16)
+        self.assertIn('...', captured)
+
+    def test_ref(self):
+        value = [1, 2]
+        policy = CapturePolicy(mode='ref')
+        self.assertIs(policy.capture(value), value)
+
+    def test_copy(self):
+        value = [1, 2]
+        captured = CapturePolicy(mode='copy').capture(value)
+        self.assertIsNot(captured, value)
+        self.assertEqual(captured, value)
+
+    def test_serializers(self):
+        policy = CapturePolicy(serializers={list: len})
+        self.assertEqual(policy.capture([1, 2, 3]), 3)
+        self.assertEqual(policy.capture(1.5), 1.5)
+
+    def test_budget(self):
+        policy = CapturePolicy(mode='repr', budget=200)
+        for i in range(10):
+            policy.capture('x' * 50)
+        self.assertTrue(policy.degraded)
+        self.assertEqual(policy.capture([1, 2]), '<list>')
+        self.assertGreater(policy.dropped, 0)
+
+    def test_delta(self):
+        policy = CapturePolicy()
+        state = {}
+        self.assertEqual(policy.capture_delta({'a': 1, 'b': [1]}, state), {'a': 1, 'b': [1]})
+        self.assertEqual(policy.capture_delta({'a': 1, 'b': [1]}, state), {})
+        self.assertEqual(policy.capture_delta({'a': 2, 'b': [1]}, state), {'a': 2})
+        self.assertEqual(policy.capture_delta({'a': 2}, state), {'b': DELETED})
+        self.assertEqual(apply_delta({'a': 1, 'b': 2}, {'a': 3, 'b': DELETED}), {'a': 3})
+
+    def test_delta_copies(self):
+        policy = CapturePolicy()
+        state = {}
+        items = [1]
+        arr = Array([1, 2])
+        Array.copies = 0
+        policy.capture_delta({'items': items, 'arr': arr}, state)
+        self.assertEqual(Array.copies, 1)
+        # the same objects aren't copied again while unchanged.
+        for _ in range(3):
+            self.assertEqual(policy.capture_delta({'items': items, 'arr': arr}, state), {})
+        self.assertEqual(Array.copies, 1)
+        items.append(2)
+        arr.items.append(3)
+        delta = policy.capture_delta({'items': items, 'arr': arr}, state)
+        self.assertEqual(delta['items'], [1, 2])
+        self.assertEqual(delta['arr'].items, [1, 2, 3])
+        self.assertEqual(Array.copies, 2)
+
+
+class TestRunCapture(unittest.TestCase):
+
+    def test_rebuild_locals(self):
+        run = _trace(accumulate, 3)
+        call = run.calls[0]
+        self.assertEqual(call.args, {'n': 3})
+        self.assertEqual(call.retval, 3)
+        self.assertEqual(call.locals, {'n': 3, 'total': 3, 'i': 2})
+        # state before the last execution of `total += i`.
+        self.assertEqual(call.get_line_locals(17), {'n': 3, 'items': [0, 1, 2], 'total': 1, 'i': 2})
+        self.assertTrue(all(len(ln.delta) <= 2 for ln in call.lines))
+
+    def test_rebuild_locals_repr(self):
+        run = _trace(accumulate, 3, capture=CapturePolicy(mode='repr'))
+        call = run.calls[0]
+        self.assertEqual(call.args, {'n': '3'})
+        self.assertEqual(call.retval, '3')
+        self.assertEqual(call.get_line_locals(18)['items'], '[0, 1, 2]')
@@ -0,0 +1,129 @@
+import os
+import shutil
+import signal
+import tempfile
+import unittest
+import multiprocessing
+
+from tracer import trace
+from tracer.children import load, get_child_path, _ChildTarget
+from tracer.storage import TraceReader
+from tracer.profiling import Profile, get_flame_tree
+from tests.test_proj import workers
+
+TEST_PROJ_ROOT = os.path.dirname(workers.__file__)
+
+
+def _get_methods():
+    return [m for m in ('fork', 'spawn') if m in multiprocessing.get_all_start_methods()]
+
+
+class TestChildren(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.output = os.path.join(self.tmp_dir, 'trace.bin')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _trace(self, func, *args):
+        traced = trace(func, roots=[TEST_PROJ_ROOT], output=self.output, children=True, gui=False)
+        rv = traced(*args)
+        traced.run.sink.close()
+        return rv
+
+    def _check(self, run, starter):
+        pid = os.getpid()
+        self.assertEqual([run.calls[i].name for i in run.roots], [starter])
+        top = run.calls[run.roots[0]]
+        self.assertEqual(run.get_process(top), pid)
+
+        # every worker's calls hang off the call which started its process.
+        pids = set()
+        works = []
+        for call in run.calls:
+            if call.name != 'work':
+                continue
+            works.append(call)
+            self.assertEqual(call.parent, top.id)
+            self.assertNotEqual(run.get_process(call), pid)
+            pids.add(run.get_process(call))
+            self.assertEqual([ch.name for ch in map(run.get_call, run.get_children(call.id))], ['foo'])
+            self.assertEqual(run.get_call(run.get_children(call.id)[0]).retval, str(-int(call.args['x'])))
+        self.assertEqual(sorted(int(c.args['x']) for c in works), list(range(4)))
+        self.assertTrue(pids)
+        for p in pids:
+            with TraceReader(get_child_path(self.output, p)) as reader:
+                self.assertEqual(reader.meta['ppid'], pid)
+                self.assertEqual(reader.meta['parent_call'], 0)
+        self.assertEqual(sorted(run.get_groups('process')), [f'pid {pid}'])
+        # ids stay in callers before calls order.
+        for call in run.calls:
+            self.assertTrue(call.parent is None or call.parent < call.id)
+
+    def test_pool(self):
+        for method in _get_methods():
+            with self.subTest(method=method):
+                self.assertEqual(self._trace(workers.run_processes, 4, method), [0, -1, -2, -3])
+                with load(self.output) as run:
+                    self._check(run, 'run_processes')
+
+    def test_process_pool(self):
+        for method in _get_methods():
+            with self.subTest(method=method):
+                self.assertEqual(self._trace(workers.run_process_pool, 4, method), [0, -1, -2, -3])
+                with load(self.output) as run:
+                    self._check(run, 'run_process_pool')
+
+    # workers run alongside the call which started them, their times aren't part of its own.
+    def test_profile(self):
+        for method in _get_methods():
+            with self.subTest(method=method):
+                self._trace(workers.run_nappers, 8, method, 0.1)
+                with load(self.output) as run:
+                    top = run.calls[run.roots[0]]
+                    self.assertEqual(len(run.query().name('nap')), 8)
+                    self.assertTrue(run.links)
+                    profile = Profile(run)
+                    self.assertLessEqual(profile['run_nappers'].inclusive, top.runtime)
+                    self.assertGreaterEqual(profile['nap'].inclusive, 0.8)
+                    self.assertEqual(get_flame_tree(run).children['nap'].calls, 8)
+
+    # the target gets back the wakeup fd and the SIGTERM handler it had, and asyncio works in between.
+    @unittest.skipUnless(hasattr(signal, 'pthread_sigmask'), 'requires signal.pthread_sigmask')
+    def test_signals(self):
+        config = {
+            'roots': [TEST_PROJ_ROOT], 'include': None, 'exclude': None, 'focus': None, 'focus_depth': 0,
+            'backend': 'settrace', 'capture': 'repr', 'max_len': 100, 'output': self.output,
+            'root': TEST_PROJ_ROOT, 'overhead': 0, 'trace': 'test', 'pid': os.getpid(),
+        }
+        handler = signal.getsignal(signal.SIGTERM)
+        read_fd, write_fd = os.pipe()
+        os.set_blocking(write_fd, False)
+        prev_fd = signal.set_wakeup_fd(write_fd)
+        try:
+            self.assertEqual(_ChildTarget(workers.run_tasks, config, None)(3), [0, -1, -2])
+            self.assertEqual(signal.set_wakeup_fd(prev_fd), write_fd)
+            self.assertIs(signal.getsignal(signal.SIGTERM), handler)
+        finally:
+            signal.set_wakeup_fd(prev_fd)
+            os.close(read_fd)
+            os.close(write_fd)
+        with TraceReader(get_child_path(self.output, os.getpid())) as reader:
+            self.assertEqual(reader.load().calls[0].name, 'run_tasks')
+
+    def test_without_children(self):
+        traced = trace(workers.run_pool, roots=[TEST_PROJ_ROOT], output=self.output, gui=False)
+        traced(2)
+        traced.run.sink.close()
+        with load(self.output) as run:
+            self.assertEqual(run.processes, {})
+            self.assertEqual(run.calls[run.roots[0]].name, 'run_pool')
+            self.assertEqual(sorted(run.get_groups('process')), ['process'])
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            trace(workers.run_pool, children=True)
+        with self.assertRaises(ValueError):
+            trace(workers.run_pool, children=True, output=self.output, mode='sample')
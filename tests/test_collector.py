@@ -0,0 +1,113 @@
+import os
+import socket
+import shutil
+import tempfile
+import threading
+import unittest
+
+from tracer import trace
+from tracer.core import Run, _get_common_root
+from tracer.filters import CodeFilter
+from tracer.backends import create_backend, get_available_backends
+from tracer.collector import Collector, CollectorClient, connect
+from tracer.storage import TraceReader
+from tests.test_proj.main import main
+from tests.test_proj import workers
+
+TEST_PROJ_ROOT = os.path.dirname(workers.__file__)
+
+
+def _trace(target, backend, func, *args):
+    backend = create_backend(name=backend, run=target, code_filter=CodeFilter(roots=[TEST_PROJ_ROOT]))
+    backend.start()
+    try:
+        func(*args)
+    finally:
+        backend.stop()
+    return target
+
+
+def _tree(run):
+    return [(depth, call.name, [ln.num for ln in call.lines]) for depth, call in run.walk()]
+
+
+class TestCollector(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.address = os.path.join(self.tmp_dir, 'collector.sock')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _serve(self, output):
+        collector = Collector(self.address, output=output, once=True)
+        collector.listen()
+        thread = threading.Thread(target=collector.serve)
+        thread.start()
+        return collector, thread
+
+    def test_collect(self):
+        for backend in get_available_backends():
+            with self.subTest(backend=backend):
+                collector, thread = self._serve(os.path.join(self.tmp_dir, f'{backend}-{{pid}}.bin'))
+                client = connect(self.address, meta={'root': TEST_PROJ_ROOT}, batch_size=256)
+                for func, arg in [(main.__wrapped__, 2), (workers.run_threads, 2), (workers.run_tasks, 2)]:
+                    _trace(client, backend, func, arg)
+                client.close()
+                thread.join()
+
+                run = Run(root=_get_common_root([TEST_PROJ_ROOT]))
+                for func, arg in [(main.__wrapped__, 2), (workers.run_threads, 2), (workers.run_tasks, 2)]:
+                    _trace(run, backend, func, arg)
+                session, = collector.sessions
+                self.assertEqual(session.path, os.path.join(self.tmp_dir, f'{backend}-{os.getpid()}.bin'))
+                with TraceReader(session.path) as reader:
+                    collected = reader.load()
+                    self.assertEqual(reader.meta['events'], client.sent)
+                    self.assertEqual(reader.meta['dropped'], 0)
+                    self.assertEqual(sorted(_tree(collected)), sorted(_tree(run)))
+                    self.assertEqual(sorted(collected.threads.values()), sorted(run.threads.values()))
+                    # names of unnamed tasks are numbered per process.
+                    self.assertEqual(
+                        sorted(c.task for c in collected.calls if c.task and c.task.startswith('task-')),
+                        sorted(c.task for c in run.calls if c.task and c.task.startswith('task-'))
+                    )
+                    self.assertTrue(all(c.ret_timestamp >= c.call_timestamp for c in collected.calls))
+
+    def test_drop(self):
+        # a collector which never reads.
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.address)
+        server.listen()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        sock.connect(self.address)
+        conn, _ = server.accept()
+        try:
+            client = CollectorClient(sock, batch_size=512, on_full='drop')
+            _trace(client, 'settrace', workers.burn, 0.05)
+            self.assertGreater(client.dropped, 0)
+            self.assertGreater(client.sent, 0)
+            client.close()
+            # events of a closed client are dropped too.
+            _trace(client, 'settrace', main.__wrapped__, 2)
+            self.assertGreater(client.dropped, client.sent)
+        finally:
+            conn.close()
+            server.close()
+
+    def test_trace(self):
+        path = os.path.join(self.tmp_dir, 'trace.bin')
+        traced = trace(workers.run_callback, gui=False, collector=True, output=path)
+        self.assertEqual(traced(lambda: 3), 3)
+        traced.collector.close(timeout=10)
+        self.assertEqual(traced.collector.process, None)
+        with TraceReader(path) as reader:
+            run = reader.load()
+            self.assertTrue(reader.meta['collector'])
+            self.assertEqual([c.name for c in run.calls], ['run_callback', 'nested'])
+            self.assertEqual(run.calls[1].parent, 0)
+            self.assertEqual(run.calls[1].retval, 'None')
+        with self.assertRaises(ValueError):
+            trace(workers.run_callback, collector=True, mode='sample')
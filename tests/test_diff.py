@@ -0,0 +1,113 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import contextlib
+
+from tracer import trace
+from tracer.core import Run
+from tracer.diff import diff
+from tracer.__main__ import main as cli_main
+from tests.test_profiling import _call, _run
+from tests.test_proj.main import main
+
+
+# `fib` got slower and calls `fib` twice, `leaf` is gone and `log` is new.
+def _after():
+    calls = [
+        _call(0, 'main', None, 0, 2000),
+        _call(1, 'fib', 0, 100, 1400),
+        _call(2, 'fib', 1, 200, 300),
+        _call(3, 'fib', 1, 400, 600),
+        _call(4, 'log', 0, 1500, 1600),
+    ]
+    calls[0].args = {'x': 2}
+    calls[0].retval = 4
+    return Run(calls=calls)
+
+
+class TestDiff(unittest.TestCase):
+
+    def setUp(self) -> None:
+        before = _run()
+        before.calls[0].args = {'x': 2}
+        before.calls[0].retval = 3
+        self.diff = diff(before, _after())
+
+    def test_alignment(self):
+        d = self.diff
+        self.assertEqual(len(d), 5)
+        self.assertEqual([(depth, n.name) for depth, n in d.walk()], [
+            (0, 'main'), (1, 'fib'), (2, 'fib'), (1, 'leaf'), (1, 'log')
+        ])
+        fib = d[('main', 'fib', 'fib')]
+        self.assertEqual(fib.path, ('main', 'fib', 'fib'))
+        self.assertEqual((fib.before_calls, fib.after_calls, fib.calls_delta), (1, 2, 1))
+        self.assertEqual(fib.status, 'common')
+        self.assertIsNone(d.find(('main', 'nope')))
+
+    def test_changes(self):
+        d = self.diff
+        self.assertEqual([n.path for n in d.added()], [('main', 'log')])
+        self.assertEqual([n.path for n in d.removed()], [('main', 'leaf')])
+        self.assertEqual([n.path for n in d.count_changed()], [('main', 'fib', 'fib')])
+        self.assertAlmostEqual(d.root.time_delta, 1000e-9)
+        self.assertEqual([n.path for n in d.slower_than(500e-9)], [('main',), ('main', 'fib')])
+        self.assertEqual([n.path for n in d.slower_than(0, ratio=2)], [('main', 'fib'), ('main', 'fib', 'fib'), ('main', 'log')])
+        self.assertEqual([n.path for n in d.faster_than()], [('main', 'leaf')])
+
+    def test_values(self):
+        diffs = self.diff.value_diffs()
+        self.assertEqual([(v.node.path, v.name, v.before_value, v.after_value) for v in diffs], [
+            (('main',), 'return', '3', '4'),
+        ])
+        self.assertIn('removed:', self.diff.report())
+
+
+class TestDiffFiles(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp)
+
+    def test_files(self):
+        paths = []
+        for x in (2, 3):
+            path = os.path.join(self.tmp, f'{x}.bin')
+            trace(main.__wrapped__, gui=False, output=path)(x)
+            paths.append(path)
+
+        with diff(*paths) as d:
+            self.assertEqual(len(d), 8)
+            self.assertFalse(d.added() or d.removed())
+            live = trace(main.__wrapped__, gui=False)
+            live(2)
+            with diff(paths[0], live.run) as live_diff:
+                self.assertEqual(live_diff.value_diffs(), [])
+            self.assertIn(('main',), [v.node.path for v in d.value_diffs()])
+
+        out = io.StringIO()
+        with self.assertRaises(SystemExit) as cm, contextlib.redirect_stdout(out):
+            cli_main(['diff', paths[0], paths[1], '--fail-above', '-1'])
+        self.assertEqual(cm.exception.code, 1)
+        report = out.getvalue()
+        self.assertTrue(report.startswith('calls: '))
+        self.assertIn('\n  main  calls 1 -> 1', report)
+
+    def test_lazy(self):
+        paths = []
+        for x in (2, 3):
+            path = os.path.join(self.tmp, f'{x}.bin')
+            trace(main.__wrapped__, gui=False, output=path)(x)
+            paths.append(path)
+
+        with diff(*paths) as d:
+            d.report()
+            self.assertFalse(any(call._loaded for run in (d.before, d.after) for call in run.calls))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from tracer import trace
+from tracer.export import FORMATS, export, write_folded, write_speedscope, write_chrome
+from tracer.profiling import get_flame_tree
+from tracer.storage import load
+from tests.test_profiling import _run
+from tests.test_proj.main import main
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.run = _run()
+
+    def test_flame_tree(self):
+        root = get_flame_tree(self.run)
+        self.assertEqual(root.value, 1000)
+        main = root.children['main']
+        self.assertEqual(sorted(main.children), ['fib', 'leaf'])
+        self.assertEqual(main.self_value, 300)
+        self.assertEqual(main.children['fib'].children['fib'].calls, 1)
+
+    def test_folded(self):
+        f = io.StringIO()
+        write_folded(self.run, f)
+        self.assertEqual(f.getvalue().splitlines(), [
+            'main 300',
+            'main;fib 400',
+            'main;fib;fib 100',
+            'main;leaf 200',
+        ])
+
+    def test_speedscope(self):
+        f = io.StringIO()
+        write_speedscope(self.run, f)
+        doc = json.loads(f.getvalue())
+        self.assertEqual([fr['name'] for fr in doc['shared']['frames']], ['main', 'fib', 'leaf'])
+        profile = doc['profiles'][0]
+        self.assertEqual(profile['endValue'], 1000)
+
+        events = [(e['type'], e['frame'], e['at']) for e in profile['events']]
+        self.assertEqual(events, [
+            ('O', 0, 0), ('O', 1, 100), ('O', 1, 200), ('C', 1, 300),
+            ('C', 1, 600), ('O', 2, 700), ('C', 2, 900), ('C', 0, 1000),
+        ])
+
+    def test_chrome(self):
+        calls = self.run.calls
+        # a generator suspended once.
+        calls[3].segments = [700, 750, 850, 900]
+        f = io.StringIO()
+        write_chrome(self.run, f)
+        doc = json.loads(f.getvalue())
+        events = [e for e in doc['traceEvents'] if e['ph'] == 'X']
+        self.assertEqual([e['name'] for e in events], ['main', 'fib', 'fib', 'leaf', 'leaf'])
+        self.assertEqual([(e['ts'], e['dur']) for e in events[-2:]], [(0.7, 0.05), (0.85, 0.05)])
+
+    def test_export(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = export(self.run, os.path.join(tmp, 'run.json'), format='speedscope')
+            with open(path) as f:
+                self.assertEqual(len(json.load(f)['profiles']), 1)
+            with self.assertRaises(ValueError):
+                export(self.run, path, format='unknown')
+        finally:
+            shutil.rmtree(tmp)
+
+    # exports of trace files only read what's decoded while loading them.
+    def test_export_file(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'trace.bin')
+            trace(main.__wrapped__, gui=False, output=path)(2)
+            for format in FORMATS:
+                with load(path) as run:
+                    export_path = export(run, os.path.join(tmp, f'run.{format}'), format=format)
+                    self.assertFalse(any(call._loaded for call in run.calls))
+                self.assertTrue(os.path.getsize(export_path))
+            with load(path) as run:
+                f = io.StringIO()
+                write_folded(run, f)
+                self.assertEqual(f.getvalue().splitlines()[0].split()[0], 'main')
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_folded_max_depth(self):
+        f = io.StringIO()
+        write_folded(self.run, f, max_depth=2)
+        self.assertEqual(f.getvalue().splitlines(), ['main 300', 'main;fib 500', 'main;leaf 200'])
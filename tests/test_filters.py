@@ -0,0 +1,46 @@
+import os
+import json
+import unittest
+
+from tracer.filters import CodeFilter
+from tests.test_proj import foo, bar
+from tests.test_proj.baz import baz
+
+TEST_PROJ_ROOT = os.path.dirname(foo.__file__)
+
+
+class TestCodeFilter(unittest.TestCase):
+
+    def test_roots(self):
+        code_filter = CodeFilter(roots=[os.path.dirname(baz.__file__)])
+        self.assertTrue(code_filter.accepts(baz.buzz.__code__))
+        self.assertFalse(code_filter.accepts(foo.foo.__code__))
+        self.assertFalse(code_filter.accepts(json.dumps.__code__))
+
+    def test_multiple_roots(self):
+        roots = [os.path.dirname(baz.__file__), os.path.dirname(json.__file__)]
+        code_filter = CodeFilter(roots=roots)
+        self.assertTrue(code_filter.accepts(baz.buzz.__code__))
+        self.assertTrue(code_filter.accepts(json.dumps.__code__))
+        self.assertFalse(code_filter.accepts(foo.foo.__code__))
+
+    def test_root_prefix_is_not_a_match(self):
+        code_filter = CodeFilter(roots=[os.path.join(TEST_PROJ_ROOT, 'ba')])
+        self.assertFalse(code_filter.accepts(bar.bar.__code__))
+
+    def test_include_exclude(self):
+        code_filter = CodeFilter(roots=[TEST_PROJ_ROOT], include=['*/foo.py', '*/baz/*'])
+        self.assertTrue(code_filter.accepts(foo.foo.__code__))
+        self.assertTrue(code_filter.accepts(baz.buzz.__code__))
+        self.assertFalse(code_filter.accepts(bar.bar.__code__))
+
+        code_filter = CodeFilter(roots=[TEST_PROJ_ROOT], exclude=['*/baz/*'])
+        self.assertTrue(code_filter.accepts(bar.bar.__code__))
+        self.assertFalse(code_filter.accepts(baz.buzz.__code__))
+
+    def test_memo(self):
+        code_filter = CodeFilter(roots=[TEST_PROJ_ROOT])
+        for _ in range(3):
+            code_filter.accepts(foo.foo.__code__)
+            code_filter.accepts(foo.Foo.foo.__code__)
+        self.assertEqual(len(code_filter), 2)
@@ -0,0 +1,56 @@
+import unittest
+
+from tracer import trace
+from tracer.backends import get_available_backends
+from tests.test_proj.main import main
+
+
+def _trace(backend, focus, focus_depth=None):
+    traced = trace(main.__wrapped__, gui=False, backend=backend, focus=focus, focus_depth=focus_depth)
+    rv = traced(2)
+    return traced.run, rv
+
+
+class TestFocus(unittest.TestCase):
+
+    def _check_full(self, call):
+        self.assertTrue(call.lines, call.name)
+        self.assertTrue(call.args, call.name)
+
+    def _check_timed(self, call):
+        self.assertEqual(call.lines, [], call.name)
+        self.assertEqual(call.args, {}, call.name)
+        self.assertIsNone(call.retval, call.name)
+        self.assertIsNotNone(call.ret_timestamp, call.name)
+
+    def test_focus(self):
+        for backend in get_available_backends():
+            with self.subTest(backend=backend):
+                full = trace(main.__wrapped__, gui=False, backend=backend)
+                full(2)
+                run, rv = _trace(backend, focus=['Foo.*'], focus_depth=0)
+                self.assertEqual(rv, -7)
+                self.assertEqual([c.name for c in run.calls], [c.name for c in full.run.calls])
+                for call in run.calls:
+                    if call.name.startswith('Foo.'):
+                        self._check_full(call)
+                    else:
+                        self._check_timed(call)
+
+    def test_depth(self):
+        for backend in get_available_backends():
+            with self.subTest(backend=backend):
+                run, _ = _trace(backend, focus=['main'], focus_depth=1)
+                for depth, call in run.walk():
+                    if depth <= 1:
+                        self._check_full(call)
+                    else:
+                        self._check_timed(call)
+
+                run, _ = _trace(backend, focus=['main'])
+                for _, call in run.walk():
+                    self._check_full(call)
+
+
+if __name__ == '__main__':
+    unittest.main()
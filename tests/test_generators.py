@@ -0,0 +1,102 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+from tracer.core import Run, _get_common_root, _SWEEP_AT
+from tracer.filters import CodeFilter
+from tracer.backends import create_backend, get_available_backends
+from tracer.capture import CapturePolicy
+from tracer.storage import TraceWriter, TraceReader
+from tests.test_proj import pipeline
+
+TEST_PROJ_ROOT = os.path.dirname(pipeline.__file__)
+
+
+def _trace(func, arg, backend, sink=None):
+    run = Run(root=_get_common_root([TEST_PROJ_ROOT]), sink=sink)
+    backend = create_backend(name=backend, run=run, code_filter=CodeFilter(roots=[TEST_PROJ_ROOT]))
+    backend.start()
+    try:
+        func(arg)
+    finally:
+        backend.stop()
+    return run
+
+
+class TestGenerators(unittest.TestCase):
+
+    def test_pipeline(self):
+        for backend in get_available_backends():
+            with self.subTest(backend=backend):
+                run = _trace(pipeline.run_pipeline, 3, backend)
+                self.assertEqual([c.name for c in run.calls], ['run_pipeline', 'doubled', 'numbers', 'numbers'])
+                self.assertEqual(run.calls[0].retval, 6)
+
+                doubled = run.calls[1]
+                self.assertEqual(doubled.yields, [0, 2, 4])
+                self.assertEqual(doubled.retval, 'done')
+                # three yields and the final return.
+                self.assertEqual(len(doubled.segments), 8)
+                self.assertEqual(sorted(doubled.segments), doubled.segments)
+                self.assertLessEqual(doubled.active_runtime, doubled.runtime)
+                self.assertEqual(run.get_children(doubled.id), [2])
+
+                numbers = run.calls[2]
+                self.assertEqual(numbers.parent, doubled.id)
+                self.assertEqual(numbers.yields, [0, 1, 2])
+
+                # closed after its first yield.
+                # since 3.13 closing it doesn't run it, so it ends at the yield.
+                closed = run.calls[3]
+                self.assertEqual(closed.yields, [0])
+                self.assertEqual(len(closed.segments), 2 if sys.version_info >= (3, 13) else 4)
+                self.assertEqual(closed.ret_timestamp, closed.segments[-1])
+                self.assertEqual(run._suspended, {})
+
+    # suspended calls of generators which are gone are dropped along with their frames.
+    # captured as reprs, as copies of generators are the generators themselves.
+    def test_abandoned(self):
+        for backend in get_available_backends():
+            with self.subTest(backend=backend):
+                run = Run(root=_get_common_root([TEST_PROJ_ROOT]), capture=CapturePolicy(mode='repr'))
+                backend = create_backend(name=backend, run=run, code_filter=CodeFilter(roots=[TEST_PROJ_ROOT]))
+                backend.start()
+                try:
+                    pipeline.abandon(3 * _SWEEP_AT)
+                    self.assertLessEqual(len(run._suspended), _SWEEP_AT)
+                    # still suspended once tracing stops.
+                    gen = pipeline.numbers(3)
+                    next(gen)
+                finally:
+                    backend.stop()
+                self.assertEqual(len(run.query().name('numbers')), 3 * _SWEEP_AT + 1)
+                self.assertEqual(run._suspended, {})
+                self.assertEqual(next(gen), 1)
+                gen.close()
+
+    def test_coroutine(self):
+        for backend in get_available_backends():
+            with self.subTest(backend=backend):
+                run = _trace(pipeline.run_coroutine, 0.05, backend)
+                wait = run.query().name('wait').first()
+                self.assertEqual(len(run.query().name('wait')), 1)
+                self.assertEqual(wait.retval, 0.05)
+                self.assertIsNone(wait.yields)
+                self.assertGreaterEqual(wait.runtime, 0.05)
+                self.assertLess(wait.active_runtime, 0.05)
+
+    def test_storage(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'trace.bin')
+            with TraceWriter(path) as writer:
+                run = _trace(pipeline.run_pipeline, 3, 'settrace', sink=writer)
+            with TraceReader(path) as reader:
+                loaded = reader.load()
+                for call, exp_call in zip(loaded.calls, run.calls):
+                    self.assertEqual(len(call.segments or ()), len(exp_call.segments or ()))
+                    self.assertEqual(call.yields, [str(v) for v in exp_call.yields] if exp_call.yields else None)
+        finally:
+            shutil.rmtree(tmp)
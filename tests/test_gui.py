@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tracer import trace
+from tracer.storage import load
+from tests.test_proj.main import main
+
+try:
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PySide2 import QtWidgets
+    from tracer.gui import MainWindow
+except ImportError:
+    QtWidgets = None
+
+
+def _wait(window):
+    app = QtWidgets.QApplication.instance()
+    for _ in range(100):
+        window.loader.pool.waitForDone()
+        app.processEvents()
+        if not window.loader._pending:
+            return
+
+
+@unittest.skipIf(QtWidgets is None, 'requires PySide2.')
+class TestMainWindow(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _check_window(self, run):
+        window = MainWindow()
+        window.on_trace(run)
+        _wait(window)
+        self.assertIsNotNone(window._profile_model)
+        self.assertIsNotNone(window.w_flame_graph)
+
+        call = max((c for c in run.calls if c.lines), key=lambda c: len(c.lines))
+        other = next(c for c in run.calls if c is not call)
+        inspect = window.w_call_inspect
+        window._show_call(call)
+        self.assertEqual(inspect._w_code.toPlainText(), 'loading...')
+        _wait(window)
+        self.assertIn(call.name.split('.')[-1], inspect._w_code.toPlainText())
+        self.assertEqual(inspect._w_info.item(0, 1).text(), call.uname)
+
+        line = call.lines[-1]
+        block_num = next(b for b, n in inspect._w_code._line_num_map.items() if n == line.num)
+        inspect.on_line_double_click(block_num, line.num)
+        _wait(window)
+        self.assertTrue(inspect._w_vars.isVisibleTo(window))
+        tabs = [inspect._w_vars.tabText(i) for i in range(inspect._w_vars.count())]
+        self.assertEqual(tabs[:3], ['locals', 'args', 'retval'])
+        self.assertEqual(inspect._w_vars.widget(0).topLevelItemCount(), len(call.get_line_locals(line.num)))
+
+        # widgets are refilled, results are served from the cache once prepared.
+        window._show_call(other)
+        window._show_call(call)
+        self.assertIs(window.w_call_inspect, inspect)
+        self.assertIn(call.name.split('.')[-1], inspect._w_code.toPlainText())
+        self.assertFalse(inspect._w_vars.isVisibleTo(window))
+        _wait(window)
+        self.assertEqual(inspect._w_info.item(0, 1).text(), call.uname)
+        self.assertIn(('vars', call.id, line.num), window.loader._cache)
+        window.close()
+
+    def test_live(self):
+        traced = trace(main.__wrapped__, gui=False)
+        traced(2)
+        self._check_window(traced.run)
+
+    def test_file(self):
+        path = os.path.join(self.tmp_dir, 'trace.bin')
+        traced = trace(main.__wrapped__, gui=False, output=path)
+        traced(2)
+        with load(path) as run:
+            self._check_window(run)
@@ -0,0 +1,71 @@
+import os
+import sys
+import subprocess
+import importlib.util
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# names of modules imported by running `code` in a fresh interpreter, as reported by `-X importtime`.
+def _get_imported(code):
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    names = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or line.endswith('imported package'):
+            continue
+        names.append(line.rpartition('|')[2].strip())
+    return names
+
+
+def _has_pyside():
+    try:
+        import PySide2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class TestImports(unittest.TestCase):
+
+    @unittest.skipIf(not hasattr(sys, 'stdlib_module_names'), 'requires python 3.10+')
+    def test_core(self):
+        code = 'import tracer, tracer.storage, tracer.export, tracer.diff, tracer.tail, tracer.children'
+        names = _get_imported(code)
+        self.assertIn('tracer.core', names)
+        # nothing but the standard library, qt only comes with the viewer.
+        # whatever the interpreter imports on its own, i.e. with `site`, doesn't count.
+        # imports the standard library only tries, i.e. `org` of jython by `pickle`, don't either.
+        packages = {name.partition('.')[0] for name in set(names) - set(_get_imported('pass'))}
+        packages = {p for p in packages - set(sys.stdlib_module_names) if importlib.util.find_spec(p) is not None}
+        self.assertEqual(packages, {'tracer'})
+        self.assertNotIn('tracer.gui', names)
+
+    def test_headless(self):
+        code = (
+            'import sys\n'
+            'sys.modules["PySide2"] = None\n'
+            'from tracer import trace\n'
+            'from tests.test_proj.workers import work\n'
+            'traced = trace(work, gui=False)\n'
+            'assert traced(2) == -2 and len(traced.run) == 2\n'
+            'try:\n'
+            '    import tracer.gui\n'
+            'except ImportError as e:\n'
+            '    assert "tracer[gui]" in str(e)\n'
+            'else:\n'
+            '    raise AssertionError\n'
+        )
+        subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True)
+
+    @unittest.skipIf(not _has_pyside(), 'requires PySide2')
+    def test_gui(self):
+        names = _get_imported('import tracer.gui')
+        self.assertIn('PySide2', names)
+        self.assertIn('tracer.gui', names)
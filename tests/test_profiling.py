@@ -0,0 +1,82 @@
+import unittest
+
+from tracer.core import Run, Call, Line, CodeInfo
+from tracer.profiling import calibrate
+
+
+def _call(id, name, parent, start, end, lines=()):
+    call = Call(
+        id=id,
+        info=CodeInfo(name=name),
+        name=name,
+        parent=parent,
+        call_timestamp=start,
+        ret_timestamp=end
+    )
+    for num in lines:
+        call.add_line(Line(num=num))
+    return call
+
+
+# times are in ns.
+def _run(overhead=0):
+    calls = [
+        _call(0, 'main', None, 0, 1000, lines=[1, 2, 3]),
+        _call(1, 'fib', 0, 100, 600, lines=[10, 11]),
+        _call(2, 'fib', 1, 200, 300, lines=[10]),
+        _call(3, 'leaf', 0, 700, 900, lines=[20, 20, 20]),
+    ]
+    return Run(calls=calls, overhead=overhead)
+
+
+class TestProfiling(unittest.TestCase):
+
+    def test_aggregates(self):
+        profile = _run().profile()
+        self.assertEqual(len(profile), 3)
+
+        main = profile['main']
+        self.assertEqual(main.calls, 1)
+        self.assertAlmostEqual(main.inclusive, 1000e-9)
+        self.assertAlmostEqual(main.exclusive, 300e-9)
+        self.assertEqual(main.line_hits, {1: 1, 2: 1, 3: 1})
+
+        # the recursive call is only a part of the outer one's inclusive time.
+        fib = profile['fib']
+        self.assertEqual(fib.calls, 2)
+        self.assertAlmostEqual(fib.inclusive, 500e-9)
+        self.assertAlmostEqual(fib.exclusive, 500e-9)
+        self.assertAlmostEqual(fib.per_call, 250e-9)
+        self.assertEqual(fib.line_hits, {10: 2, 11: 1})
+
+        self.assertEqual(profile['leaf'].line_hits, {20: 3})
+        self.assertEqual([st.name for st in profile.sorted('exclusive')], ['fib', 'main', 'leaf'])
+        self.assertEqual([st.name for st in profile.top(1, key='calls')], ['fib'])
+        with self.assertRaises(ValueError):
+            profile.sorted('unknown')
+
+    def test_overhead(self):
+        profile = _run(overhead=10).profile()
+        # main: 3 lines, its own call and return and 2 children.
+        self.assertAlmostEqual(profile['main'].exclusive, (300 - 10 * 6) * 1e-9)
+        # leaf: 3 lines and its own call and return.
+        self.assertAlmostEqual(profile['leaf'].exclusive, (200 - 10 * 4) * 1e-9)
+        self.assertAlmostEqual(
+            profile['main'].inclusive,
+            profile['main'].exclusive + profile['fib'].inclusive + profile['leaf'].inclusive
+        )
+
+    def test_line_times(self):
+        run = _run(overhead=10)
+        for call, times in zip(run.calls, ([100, 500, 400], [200, 300], [100], [50, 50, 100])):
+            for ln, time in zip(call.lines, times):
+                ln.time = time
+
+        self.assertEqual(run.calls[3].get_line_times(), {20: (3, 200)})
+        self.assertEqual(run.calls[3].get_line_times(overhead=10), {20: (3, 170)})
+        profile = run.profile()
+        self.assertAlmostEqual(profile['fib'].line_times[10], (190 + 90) * 1e-9)
+        self.assertAlmostEqual(profile['leaf'].line_times[20], 170e-9)
+
+    def test_calibrate(self):
+        self.assertGreater(calibrate(backend='settrace'), 0)
@@ -0,0 +1,40 @@
+import asyncio
+
+
+def numbers(n):
+    for i in range(n):
+        yield i
+
+
+def doubled(xs):
+    for x in xs:
+        yield x * 2
+    return 'done'
+
+
+def run_pipeline(n):
+    total = 0
+    for x in doubled(numbers(n)):
+        total += x
+    gen = numbers(n)
+    next(gen)
+    gen.close()
+    return total
+
+
+# starts `n` generators and drops each of them after its first yield.
+def abandon(n):
+    total = 0
+    for _ in range(n):
+        gen = numbers(3)
+        total += next(gen)
+    return total
+
+
+async def wait(seconds):
+    await asyncio.sleep(seconds)
+    return seconds
+
+
+def run_coroutine(seconds):
+    return asyncio.run(wait(seconds))
@@ -0,0 +1,138 @@
+import asyncio
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from tests.test_proj.foo import foo
+
+
+def work(x):
+    return foo(x)
+
+
+def run_threads(n):
+    threads = [threading.Thread(target=work, args=(i,), name=f'worker-{i}') for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+# starts a thread which does its work only once `go` is set, i.e. after the call returned.
+def start_late_worker(n, go):
+    thread = threading.Thread(target=_work_late, args=(n, go), name='late-worker')
+    thread.start()
+    return thread
+
+
+def _work_late(n, go):
+    go.wait()
+    return [work(i) for i in range(n)]
+
+
+def run_pool(n):
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        return list(pool.map(work, range(n)))
+
+
+def run_processes(n, method):
+    with multiprocessing.get_context(method).Pool(2) as pool:
+        return pool.map(work, range(n))
+
+
+def nap(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def run_nappers(n, method, seconds):
+    with multiprocessing.get_context(method).Pool(4) as pool:
+        return pool.map(nap, [seconds] * n)
+
+
+def run_process_pool(n, method):
+    with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context(method)) as pool:
+        return list(pool.map(work, range(n)))
+
+
+async def step(x):
+    await asyncio.sleep(0)
+    return work(x)
+
+
+def run_tasks(n):
+    async def _main():
+        tasks = [asyncio.create_task(step(i), name=f'task-{i}') for i in range(n)]
+        return await asyncio.gather(*tasks)
+
+    return asyncio.run(_main())
+
+
+def burn(seconds):
+    end = time.perf_counter() + seconds
+    x = 0
+    while time.perf_counter() < end:
+        x += 1
+    return x
+
+
+def spin(seconds):
+    return burn(seconds / 2) + burn(seconds / 2)
+
+
+def run_spinners(seconds):
+    threads = [threading.Thread(target=spin, args=(seconds,), name=f'spinner-{i}') for i in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def nested(callback):
+    return callback()
+
+
+def run_callback(callback):
+    return nested(callback)
+
+
+def fail(x):
+    raise ValueError(x)
+
+
+def check(x):
+    try:
+        fail(x)
+    except ValueError:
+        return False
+    return True
+
+
+def run_checks(n):
+    results = []
+    for i in range(n):
+        results.append(check(i))
+    fail(n)
+    return results
+
+
+def run_mixed(n):
+    results = []
+    for i in range(n):
+        results.append(work(i))
+    spin(0.02)
+    return results
+
+
+# starts tracing with `start` inside of its own deepest frame, the frames above it return or raise while traced.
+def reenter(n, start, fail=False):
+    if n == 0:
+        start()
+        return reenter(-1, start)
+    if n < 0:
+        return 0
+    rv = reenter(n - 1, start, fail) + 1
+    if fail:
+        raise ValueError(rv)
+    return rv
@@ -1,9 +1,11 @@
+import sys
+import types
 import unittest
 import inspect
 from abc import abstractmethod
 from pathlib import Path
 
-from tracer.core import _get_frame_qual_name
+from tracer.core import _get_frame_qual_name, _get_qual_names, _read_file_lines
 
 
 def foo():
@@ -28,6 +30,39 @@ class Foo:
     def double_deco_static_method():
         return inspect.currentframe()
 
+    class Nested:
+
+        def method(
+            self,
+            x=None,
+        ):
+            return inspect.currentframe()
+
+
+class Bar(Foo):
+
+    def no_self_method(this):
+        return inspect.currentframe()
+
+
+def outer():
+    def inner():
+        return inspect.currentframe()
+
+    return inner()
+
+
+def comprehensions():
+    key = lambda x: -x
+    return sorted([x for x in range(3)], key=key), set(x for x in range(3)), {x: x for x in range(3)}
+
+
+def _iter_codes(code):
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from _iter_codes(const)
+
 
 class TestQualNames(unittest.TestCase):
 
@@ -60,3 +95,30 @@ class TestQualNames(unittest.TestCase):
         frame = self.obj.double_deco_static_method()
         qn = _get_frame_qual_name(root=self.root, frame=frame)
         self.assertEqual(qn, 'Foo.double_deco_static_method')
+
+    def test_nested_class(self):
+        frame = Foo.Nested().method()
+        qn = _get_frame_qual_name(root=self.root, frame=frame)
+        self.assertEqual(qn, 'Foo.Nested.method')
+
+    def test_subclass_method(self):
+        frame = Bar().no_self_method()
+        qn = _get_frame_qual_name(root=self.root, frame=frame)
+        self.assertEqual(qn, 'Bar.no_self_method')
+
+    def test_nested_func(self):
+        frame = outer()
+        qn = _get_frame_qual_name(root=self.root, frame=frame)
+        self.assertEqual(qn, 'outer.<locals>.inner')
+
+    # the index used by pythons without `co_qualname` must agree with it.
+    @unittest.skipIf(sys.version_info < (3, 11), 'requires `co_qualname`.')
+    def test_index(self):
+        path = inspect.currentframe().f_code.co_filename
+        names = _get_qual_names(_read_file_lines(path))
+        with open(path) as f:
+            module = compile(f.read(), path, 'exec')
+        codes = [c for c in _iter_codes(module) if c is not module]
+        self.assertTrue(codes)
+        for code in codes:
+            self.assertEqual(names[(code.co_firstlineno, code.co_name)], code.co_qualname)
@@ -0,0 +1,135 @@
+import os
+import sys
+import signal
+import shutil
+import tempfile
+import unittest
+
+from tracer import trace
+from tracer.core import Run, _get_common_root, _SWEEP_AT
+from tracer.capture import CapturePolicy
+from tracer.filters import CodeFilter
+from tracer.backends import create_backend
+from tracer.recorder import FlightRecorder
+from tracer.storage import TraceReader
+from tests.test_proj.main import main
+from tests.test_proj import workers, pipeline
+
+TEST_PROJ_ROOT = os.path.dirname(workers.__file__)
+
+
+def _trace(func, *args, sink=None, repeat=1):
+    run = Run(root=_get_common_root([TEST_PROJ_ROOT]), sink=sink, keep=sink is None)
+    backend = create_backend(name='settrace', run=run, code_filter=CodeFilter(roots=[TEST_PROJ_ROOT]))
+    backend.start()
+    try:
+        for _ in range(repeat):
+            func(*args)
+    finally:
+        backend.stop()
+    return run
+
+
+class TestRecorder(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'dump-{n}.bin')
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp)
+
+    def _load(self, path):
+        with TraceReader(path) as reader:
+            run = reader.load()
+            self.assertEqual([c.id for c in run.calls], list(range(len(run))))
+            for call in run.calls:
+                if call.parent is not None:
+                    self.assertLess(call.parent, call.id)
+                # lines and values are decoded while the file is open.
+                call.lines
+            return run
+
+    def test_dump(self):
+        expected = _trace(main.__wrapped__, 2)
+        recorder = FlightRecorder(capacity=1000, path=self.path)
+        _trace(main.__wrapped__, 2, sink=recorder)
+        run = self._load(recorder.dump())
+        self.assertEqual(len(run), len(expected))
+        for call, exp_call in zip(run.calls, expected.calls):
+            self.assertEqual(call.name, exp_call.name)
+            self.assertEqual(call.parent, exp_call.parent)
+            self.assertEqual(call.retval, repr(exp_call.retval))
+            self.assertEqual([ln.num for ln in call.lines], [ln.num for ln in exp_call.lines])
+
+    def test_abandoned(self):
+        recorder = FlightRecorder(capacity=100, path=self.path)
+        run = Run(root=_get_common_root([TEST_PROJ_ROOT]), sink=recorder, keep=False, capture=CapturePolicy(mode='repr'))
+        backend = create_backend(name='settrace', run=run, code_filter=CodeFilter(roots=[TEST_PROJ_ROOT]))
+        backend.start()
+        try:
+            pipeline.abandon(3 * _SWEEP_AT)
+            # records of abandoned generators go once they're swept, and there are never more than `capacity` of them.
+            self.assertLessEqual(len(recorder._open), 100)
+            gen = pipeline.numbers(3)
+            next(gen)
+        finally:
+            backend.stop()
+        self.assertEqual(recorder._open, {})
+        gen.close()
+        run = self._load(recorder.dump())
+        self.assertEqual(run.calls[-1].name, 'numbers')
+
+    def test_ring(self):
+        expected = _trace(main.__wrapped__, 2, repeat=50)
+        recorder = FlightRecorder(capacity=20, path=self.path)
+        _trace(main.__wrapped__, 2, sink=recorder, repeat=50)
+        self.assertEqual(len(recorder), 20)
+        run = self._load(recorder.dump())
+        # calls of the last `main` which have any of their events recorded, with `main` still being their caller.
+        names = [c.name for c in run.calls]
+        last = [c.name for c in expected.calls[-8:]]
+        self.assertEqual(names, [n for n in last if n in names])
+        self.assertEqual(names[-4:], last[-4:])
+        self.assertEqual([c.parent for c in run.calls], [None] + [0] * (len(run) - 1))
+        self.assertTrue(all(c.ret_timestamp is not None for c in run.calls))
+
+    def test_running_calls(self):
+        recorder = FlightRecorder(capacity=2, path=self.path)
+        paths = []
+        _trace(workers.run_callback, lambda: paths.append(recorder.dump()), sink=recorder)
+        run = self._load(paths[0])
+        self.assertEqual([c.name for c in run.calls], ['run_callback', 'nested'])
+        self.assertEqual(run.calls[1].parent, 0)
+        self.assertTrue(all(c.ret_timestamp is None for c in run.calls))
+
+    @unittest.skipIf(not hasattr(signal, 'SIGUSR1'), 'requires SIGUSR1.')
+    def test_hooks(self):
+        excepthook = sys.excepthook
+        sys.excepthook = lambda *args: None
+        recorder = FlightRecorder(capacity=100, path=self.path)
+        try:
+            recorder.install(signum=signal.SIGUSR1)
+            _trace(main.__wrapped__, 2, sink=recorder)
+            os.kill(os.getpid(), signal.SIGUSR1)
+            sys.excepthook(ValueError, ValueError(), None)
+            recorder.uninstall()
+        finally:
+            sys.excepthook = excepthook
+        self.assertEqual(recorder.dumps, 2)
+        for n in range(2):
+            self.assertEqual(len(self._load(self.path.format(n=n))), 8)
+
+    def test_trace(self):
+        traced = trace(main.__wrapped__, gui=False, record=1000, output=self.path)
+        traced.recorder.uninstall()
+        for _ in range(3):
+            traced(2)
+        self.assertEqual(len(traced.run), 0)
+        run = self._load(traced.recorder.dump())
+        self.assertEqual(len(run), 24)
+        self.assertEqual(len(run.roots), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import sys
+import unittest
+
+from tracer.core import Run, _get_common_root
+from tracer.filters import CodeFilter
+from tracer.profiling import Profile
+from tracer.sampling import SamplingBackend
+from tests.test_proj import workers
+
+TEST_PROJ_ROOT = os.path.dirname(workers.__file__)
+
+
+def _sample(func, *args, interval=0.001):
+    run = Run(root=_get_common_root([TEST_PROJ_ROOT]))
+    backend = SamplingBackend(run=run, code_filter=CodeFilter(roots=[TEST_PROJ_ROOT]), interval=interval)
+    backend.start()
+    try:
+        func(*args)
+    finally:
+        backend.stop()
+    return run, backend
+
+
+class TestSampling(unittest.TestCase):
+
+    def _check_run(self, run):
+        self.assertEqual([c.id for c in run.calls], list(range(len(run))))
+        for call in run.calls:
+            self.assertIsNotNone(call.ret_timestamp)
+            self.assertGreaterEqual(call.ret_timestamp, call.call_timestamp)
+            if call.parent is not None:
+                parent = run.get_call(call.parent)
+                self.assertLessEqual(parent.call_timestamp, call.call_timestamp)
+                self.assertGreaterEqual(parent.ret_timestamp, call.ret_timestamp)
+
+    def test_sample(self):
+        run, backend = _sample(workers.spin, 0.2)
+        self._check_run(run)
+        self.assertGreater(backend.samples, 0)
+        spin = run.query().name('spin').calls
+        self.assertEqual(len(spin), 1)
+        burn = run.query().name('burn').calls
+        self.assertGreaterEqual(len(burn), 1)
+        self.assertLessEqual(len(burn), 2)
+        for call in burn:
+            self.assertEqual(call.parent, spin[0].id)
+            self.assertTrue(call.lines)
+            # a frame sampled right as it starts is still on its `def` line.
+            self.assertTrue(all(ln.num >= call.info.first_lineno for ln in call.lines))
+
+        profile = Profile(run)
+        self.assertGreater(profile['spin'].inclusive, 0.05)
+        self.assertGreaterEqual(profile['spin'].inclusive, profile['burn'].inclusive - 1e-9)
+
+    def test_interval(self):
+        switch_interval = sys.getswitchinterval()
+        _, backend = _sample(workers.spin, 0.3)
+        self.assertEqual(sys.getswitchinterval(), switch_interval)
+        # at most one sample per switch interval would be ~60.
+        self.assertGreater(backend.samples, 100)
+
+    def test_threads(self):
+        run, _ = _sample(workers.run_spinners, 0.2)
+        self._check_run(run)
+        groups = run.get_groups('thread')
+        for i in range(2):
+            calls = [run.get_call(c) for c in groups[f'spinner-{i}']]
+            self.assertEqual([c.name for c in calls], ['spin'])
+
+
+if __name__ == '__main__':
+    unittest.main()
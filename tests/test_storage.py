@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tracer.core import Run, _get_common_root
+from tracer.filters import CodeFilter
+from tracer.backends import create_backend
+from tracer.capture import CapturePolicy
+from tracer.storage import TraceWriter, TraceReader, TraceFormatError, load
+from tests.test_proj.main import main
+
+TEST_PROJ_ROOT = os.path.dirname(main.__wrapped__.__code__.co_filename)
+
+
+def _trace(sink=None, keep=True):
+    run = Run(root=_get_common_root([TEST_PROJ_ROOT]), sink=sink, keep=keep)
+    backend = create_backend(name='settrace', run=run, code_filter=CodeFilter(roots=[TEST_PROJ_ROOT]))
+    backend.start()
+    try:
+        main.__wrapped__(2)
+    finally:
+        backend.stop()
+    return run
+
+
+class TestStorage(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'trace.bin')
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp)
+
+    def test_round_trip(self):
+        expected = _trace()
+        with TraceWriter(self.path, meta={'root': TEST_PROJ_ROOT}) as writer:
+            run = _trace(sink=writer, keep=False)
+        self.assertEqual(len(run), 0)
+
+        with TraceReader(self.path) as reader:
+            loaded = reader.load()
+            self.assertEqual(reader.meta['root'], TEST_PROJ_ROOT)
+            self.assertFalse(reader.truncated)
+            self.assertEqual(len(loaded), len(expected))
+
+            for call, exp_call in zip(loaded.calls, expected.calls):
+                self.assertEqual(call.id, exp_call.id)
+                self.assertEqual(call.name, exp_call.name)
+                self.assertEqual(call.parent, exp_call.parent)
+                self.assertLessEqual(call.call_timestamp, call.ret_timestamp)
+                self.assertFalse(call._loaded)
+
+                self.assertEqual(call.retval, str(exp_call.retval))
+                self.assertTrue(call._loaded)
+                self.assertEqual(call.args.keys(), exp_call.args.keys())
+                self.assertEqual([ln.num for ln in call.lines], [ln.num for ln in exp_call.lines])
+                self.assertEqual(call.locals.keys(), exp_call.locals.keys())
+
+            main_call = loaded.calls[0]
+            self.assertEqual(main_call.args, {'x': '2', 'y': '-1', 'z': '(None,)'})
+            self.assertEqual(main_call.get_line_locals(19)['unused'], '0')
+            self.assertIn('def main(', main_call.info.get_source())
+
+    def test_repr_values_are_not_quoted_twice(self):
+        with TraceWriter(self.path) as writer:
+            run = Run(root=_get_common_root([TEST_PROJ_ROOT]), sink=writer, capture=CapturePolicy(mode='repr'))
+            backend = create_backend(name='settrace', run=run, code_filter=CodeFilter(roots=[TEST_PROJ_ROOT]))
+            backend.start()
+            main.__wrapped__(2)
+            backend.stop()
+
+        with TraceReader(self.path) as reader:
+            self.assertEqual(reader.load().calls[0].retval, '-7')
+
+    def test_line_times(self):
+        with TraceWriter(self.path) as writer:
+            run = _trace(sink=writer)
+
+        with TraceReader(self.path) as reader:
+            loaded = reader.load()
+            for call, exp_call in zip(loaded.calls, run.calls):
+                self.assertEqual([ln.time for ln in call.lines], [ln.time for ln in exp_call.lines])
+                self.assertTrue(all(ln.time is not None for ln in call.lines))
+
+    def test_truncated(self):
+        with TraceWriter(self.path, chunk_size=64) as writer:
+            _trace(sink=writer, keep=False)
+
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        with open(self.path, 'wb') as f:
+            f.write(data[:len(data) * 2 // 3])
+
+        with TraceReader(self.path) as reader:
+            loaded = reader.load()
+            self.assertTrue(reader.truncated)
+            self.assertGreater(len(loaded), 0)
+            self.assertEqual(loaded.calls[0].name, 'main')
+            self.assertIsNone(loaded.calls[0].ret_timestamp)
+            self.assertEqual(loaded.calls[0].lines[0].num, 11)
+
+    def test_close(self):
+        with TraceWriter(self.path) as writer:
+            _trace(sink=writer, keep=False)
+        with load(self.path) as run:
+            reader = run._readers[0]
+            self.assertEqual(run.calls[0].lines[0].num, 11)
+        self.assertTrue(reader._file.closed)
+        # closing twice is fine.
+        run.close()
+
+    # profiles of trace files are built from counts and timestamps of lines, without decoding calls one by one.
+    def test_profile(self):
+        with TraceWriter(self.path, meta={'root': TEST_PROJ_ROOT}) as writer:
+            run = _trace(sink=writer)
+        with load(self.path) as loaded:
+            profile = loaded.profile()
+            self.assertFalse(any(call._loaded for call in loaded.calls))
+            self.assertEqual([c.num_lines for c in loaded.calls], [c.num_lines for c in run.calls])
+            expected = run.profile()
+            for st in expected:
+                self.assertEqual(profile[st.name].line_hits, st.line_hits)
+                self.assertEqual(sorted(profile[st.name].line_times), sorted(st.line_times))
+            self.assertEqual(
+                [ln.time for c in loaded.calls for ln in c.lines],
+                [ns for _, _, ns in sorted(loaded.iter_line_times(), key=lambda item: item[0].id)]
+            )
+
+    def test_not_a_trace(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a trace')
+        with self.assertRaises(TraceFormatError):
+            TraceReader(self.path)
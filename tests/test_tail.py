@@ -0,0 +1,110 @@
+import gc
+import unittest
+from collections import Counter
+
+from tracer import trace, EqualsMatcher
+from tracer.backends import get_available_backends
+from tracer.core import Call
+from tracer.tail import TailPolicy
+from tests.test_proj import workers
+from tests.test_proj.main import main
+
+
+def _trace(backend, func, *args, tail=None):
+    traced = trace(func, gui=False, backend=backend, tail=tail)
+    try:
+        traced(*args)
+    except ValueError:
+        pass
+    return traced.run
+
+
+class TestTail(unittest.TestCase):
+
+    def _check_tree(self, run):
+        self.assertEqual(run.roots, [0])
+        for call in run.calls:
+            self.assertTrue(call.parent is None or call.parent < call.id)
+            self.assertIsNone(call._caller)
+
+    def test_exceptions(self):
+        for backend in get_available_backends():
+            with self.subTest(backend=backend):
+                run = _trace(backend, workers.run_checks, 2)
+                self.assertEqual(
+                    [(c.name, c.exception) for c in run.calls],
+                    [
+                        ('run_checks', 'ValueError(2)'),
+                        ('check', None),
+                        ('fail', 'ValueError(0)'),
+                        ('check', None),
+                        ('fail', 'ValueError(1)'),
+                        ('fail', 'ValueError(2)'),
+                    ]
+                )
+                self.assertEqual(run.calls[1].retval, False)
+
+    def test_errors(self):
+        for backend in get_available_backends():
+            with self.subTest(backend=backend):
+                tail = TailPolicy()
+                run = _trace(backend, workers.run_checks, 3, tail=tail)
+                self._check_tree(run)
+                # checks catching the exceptions are only kept as callers of the failing calls.
+                self.assertEqual(
+                    [(depth, c.name) for depth, c in run.walk()],
+                    [(0, 'run_checks'), (1, 'check'), (2, 'fail'), (1, 'check'), (2, 'fail'),
+                     (1, 'check'), (2, 'fail'), (1, 'fail')]
+                )
+                self.assertEqual(tail.kept, len(run.calls))
+                self.assertEqual(tail.dropped, {})
+
+    def test_slow(self):
+        for backend in get_available_backends():
+            with self.subTest(backend=backend):
+                # `spin` runs for at least 0.02s, its two `burn` calls for about half of that each.
+                tail = TailPolicy(slower_than=0.019)
+                run = _trace(backend, workers.run_mixed, 3, tail=tail)
+                self._check_tree(run)
+                # calls under kept calls are decided on by themselves, fast ones are dropped as they return.
+                self.assertEqual([c.name for c in run.calls], ['run_mixed', 'spin'])
+                # the lines of kept calls are there as usual.
+                self.assertTrue(run.calls[0].lines)
+                self.assertEqual(sorted(tail.dropped), ['burn', 'foo', 'work'])
+                self.assertEqual(tail.dropped['work'][0], 3)
+                self.assertEqual(tail.dropped['burn'][0], 2)
+                self.assertEqual(tail.dropped_calls, 8)
+                self.assertGreater(tail.dropped['burn'][1], 0)
+
+    def test_memory(self):
+        def serve(n):
+            for i in range(n):
+                workers.work(i)
+            return Counter(map(type, gc.get_objects()))[Call]
+
+        for backend in get_available_backends():
+            with self.subTest(backend=backend):
+                tail = TailPolicy(slower_than=1)
+                # dropped calls aren't held on to until the call running them returns.
+                self.assertLess(trace(serve, gui=False, backend=backend, tail=tail)(1000), 100)
+                self.assertEqual(tail.dropped['test_proj.work'][0], 1000)
+
+    def test_matchers(self):
+        for backend in get_available_backends():
+            with self.subTest(backend=backend):
+                tail = TailPolicy(matchers=[EqualsMatcher([-8])])
+                run = _trace(backend, main.__wrapped__, 2, tail=tail)
+                self._check_tree(run)
+                # `main` is only kept as the caller of the calls returning and taking -8.
+                self.assertEqual(
+                    [(depth, c.name) for depth, c in run.walk()],
+                    [(0, 'main'), (1, 'baz.buzz'), (1, 'Foo.__call__')]
+                )
+                self.assertEqual(run.calls[0].retval, -7)
+                self.assertEqual(len(run.calls) + tail.dropped_calls, len(_trace(backend, main.__wrapped__, 2).calls))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            trace(main.__wrapped__, tail=TailPolicy(), output='trace.bin')
+        with self.assertRaises(ValueError):
+            trace(main.__wrapped__, tail=TailPolicy(), mode='sample')
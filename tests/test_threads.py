@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+import unittest
+import threading
+
+from tracer.core import Run, _get_common_root
+from tracer.filters import CodeFilter
+from tracer.backends import create_backend, get_available_backends
+from tracer.storage import TraceWriter, TraceReader
+from tests.test_proj import workers
+
+TEST_PROJ_ROOT = os.path.dirname(workers.__file__)
+
+
+def _trace(func, n, backend, sink=None):
+    run = Run(root=_get_common_root([TEST_PROJ_ROOT]), sink=sink)
+    backend = create_backend(name=backend, run=run, code_filter=CodeFilter(roots=[TEST_PROJ_ROOT]))
+    backend.start()
+    try:
+        func(n)
+    finally:
+        backend.stop()
+    return run
+
+
+class TestThreads(unittest.TestCase):
+
+    def _check_ids(self, run):
+        self.assertEqual([c.id for c in run.calls], list(range(len(run))))
+
+    def test_threads(self):
+        for backend in get_available_backends():
+            with self.subTest(backend=backend):
+                run = _trace(workers.run_threads, 4, backend)
+                self._check_ids(run)
+                self.assertEqual(len(run.query().name('work')), 4)
+                self.assertEqual(len(run.query().name('foo')), 4)
+
+                groups = run.get_groups('thread')
+                self.assertEqual(sorted(groups)[1:], [f'worker-{i}' for i in range(4)])
+                for i in range(4):
+                    calls = [run.get_call(c) for c in groups[f'worker-{i}']]
+                    self.assertEqual([c.name for c in calls], ['work'])
+                    self.assertEqual([c.name for _, c in run.walk(calls[0].id)], ['foo'])
+                    self.assertEqual(run.get_thread_name(calls[0].thread), f'worker-{i}')
+                self.assertEqual(len(run.query().thread('worker-*').name('work')), 4)
+
+    # threads started while tracing stop being traced along with the thread which started them.
+    def test_outliving(self):
+        for backend in get_available_backends():
+            with self.subTest(backend=backend):
+                go = threading.Event()
+                threads = []
+                run = _trace(lambda n: threads.append(workers.start_late_worker(n, go)), 1000, backend)
+                go.set()
+                threads[0].join()
+                run.merge()
+                self.assertEqual(sum(len(state.calls) for state in run._states), 0)
+                # the worker's call might've started before tracing stopped, the calls it makes after never are.
+                self.assertLessEqual({c.name for c in run.calls}, {'start_late_worker', '_work_late'})
+
+    # threads registering at once still get distinct ids.
+    def test_thread_ids(self):
+        run = Run(root=_get_common_root([TEST_PROJ_ROOT]))
+        barrier = threading.Barrier(8)
+
+        def register():
+            barrier.wait()
+            run._get_state()
+
+        threads = [threading.Thread(target=register) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(sorted(run.threads), list(range(8)))
+        self.assertEqual(sorted(s.id for s in run._states), list(range(8)))
+
+    def test_pool(self):
+        for backend in get_available_backends():
+            with self.subTest(backend=backend):
+                run = _trace(workers.run_pool, 8, backend)
+                self._check_ids(run)
+                work = run.query().name('work').calls
+                self.assertEqual(sorted(c.args['x'] for c in work), list(range(8)))
+                main_thread = run.calls[0].thread
+                self.assertTrue(all(c.thread != main_thread for c in work))
+                for c in work:
+                    self.assertEqual([ch.thread for _, ch in run.walk(c.id)], [c.thread])
+
+    def test_tasks(self):
+        for backend in get_available_backends():
+            with self.subTest(backend=backend):
+                run = _trace(workers.run_tasks, 3, backend)
+                self._check_ids(run)
+                for i in range(3):
+                    calls = run.query().task(f'task-{i}').name('work').calls
+                    self.assertEqual([c.args['x'] for c in calls], [i])
+                self.assertIsNone(run.calls[0].task)
+                groups = run.get_groups('task')
+                for i in range(3):
+                    self.assertIn(f'task-{i}', groups)
+
+    def test_storage(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'trace.bin')
+            with TraceWriter(path) as writer:
+                run = _trace(workers.run_threads, 2, 'settrace', sink=writer)
+            with TraceReader(path) as reader:
+                loaded = reader.load()
+                self.assertEqual(loaded.threads, run.threads)
+                self.assertEqual([c.thread for c in loaded.calls], [c.thread for c in run.calls])
+                self.assertEqual(sorted(loaded.get_groups('thread')), sorted(run.get_groups('thread')))
+        finally:
+            shutil.rmtree(tmp)
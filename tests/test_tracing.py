@@ -1,8 +1,28 @@
+import os
+import sys
 import unittest
+import importlib.util
 
 from tracer import trace, EqualsMatcher
 from tests.test_proj.main import main
 
+TEST_PROJ_ROOT = os.path.dirname(sys.modules[main.__module__].__file__)
+
+
+def _get_module(call):
+    for name, module in list(sys.modules.items()):
+        if getattr(module, '__file__', None) == call.info.path:
+            return name
+    return None
+
+
+# module qualified name of the traced function, i.e. `tests.test_proj.foo.Foo.foo`.
+# names of calls are qualified by the directories of their modules under the root instead, i.e. `baz.buzz`.
+def _get_full_name(call):
+    dirs = os.path.relpath(os.path.dirname(call.info.path), TEST_PROJ_ROOT)
+    prefix = '' if dirs == os.curdir else dirs.replace(os.sep, '.') + '.'
+    return f'{_get_module(call)}.{call.name[len(prefix):]}'
+
 
 class TestTracing(unittest.TestCase):
 
@@ -37,25 +57,81 @@ class TestTracing(unittest.TestCase):
             {'target': 2, 'func': 'tests.test_proj.main.main', 'where': 'kwargs'},
             {'target': -7, 'func': 'tests.test_proj.main.main', 'where': 'return'},
         ]
+        # every function under the root is traced, not only the ones imported by the traced modules.
+        self.unwrapped = ['tests.test_proj.bar.zzz']
+        self.expected_names = sorted(['foo', 'Foo.__call__', 'Foo.foo', 'Foo.bar', 'bar', 'zzz', 'baz.buzz', 'main'])
+        traced = trace(main, gui=False)
+        self.rv = traced(2)
+        self.run = traced.run
 
     def test_tracing(self):
-        tracer = trace(
-            func=main,
-            args=(2,),
-            kwargs={},
-            matchers=[EqualsMatcher(self.targets)],
-            do_report=False,
-            debug=True
-        )
-
-        imported = sorted(tracer.tree._imported)
+        self.assertEqual(self.rv, -7)
+        calls = [c for c in self.run.calls if _get_full_name(c) not in self.unwrapped]
+
+        imported = sorted({_get_module(c) for c in calls})
         self.assertEqual(imported, self.expected_imported)
 
-        wrapped = sorted(tracer._wrapped)
+        wrapped = sorted({_get_full_name(c) for c in calls})
         self.assertEqual(wrapped, self.expected_wrapped)
 
-        matches = tracer.matches
+        matches = [m for m in self.run.query().match([EqualsMatcher(self.targets)]) if m.call in calls]
         self.assertEqual(len(self.expected_matches), len(matches))
         for match, exp_match in zip(matches, self.expected_matches):
-            for field in exp_match:
+            self.assertEqual(exp_match['func'], _get_full_name(match.call))
+            for field in ('target', 'where'):
                 self.assertEqual(exp_match[field], getattr(match, field))
+
+    # calls are named by their qualified names and their code by paths of the source files.
+    # without qt the call's result and its run aren't lost, there's just nothing shown.
+    @unittest.skipIf(importlib.util.find_spec('PySide2') is not None, 'requires PySide2 not to be installed')
+    def test_no_gui(self):
+        traced = trace(main.__wrapped__)
+        with self.assertWarnsRegex(UserWarning, 'gui=False'):
+            self.assertEqual(traced(2), -7)
+        self.assertEqual(traced.run.calls[0].name, 'main')
+
+    def test_names(self):
+        self.assertEqual(sorted({c.name for c in self.run.calls}), self.expected_names)
+        self.assertEqual(sorted({os.path.relpath(c.info.path, TEST_PROJ_ROOT) for c in self.run.calls}), sorted([
+            'main.py', 'foo.py', 'bar.py', os.path.join('baz', 'baz.py')
+        ]))
+        matches = self.run.query().match([EqualsMatcher(self.targets)])
+        self.assertEqual([(m.target, m.func, m.where) for m in matches[2:4]], [(-2, 'zzz', 'kwargs'), (-2, 'zzz', 'return')])
+
+    def test_query(self):
+        query = self.run.query()
+        self.assertEqual(len(query), len(self.run))
+        self.assertEqual([c.name for c in query.name('Foo.*')], ['Foo.foo', 'Foo.__call__', 'Foo.bar'])
+        self.assertEqual([c.name for c in query.callers_of('zzz')], ['bar'])
+        self.assertEqual([c.name for c in query.callees_of('bar')], ['zzz'])
+        self.assertEqual(len(query.callees_of('main')), 6)
+        self.assertEqual([c.name for c in query.name('Foo.*').where_arg('x', lambda x: x < 0)], ['Foo.__call__'])
+        self.assertEqual([c.name for c in query.where_retval(lambda rv: rv == 4)], ['bar'])
+        self.assertEqual(len(query.slower_than(0)), len(self.run))
+        self.assertEqual(len(query.slower_than(3600)), 0)
+        self.assertEqual(query.name('main').first().retval, -7)
+
+    def test_profile(self):
+        profile = self.run.profile()
+        self.assertEqual(sorted(st.name for st in profile), self.expected_names)
+        self.assertEqual(profile['main'].calls, 1)
+        self.assertGreaterEqual(profile['main'].inclusive, profile['main'].exclusive)
+        self.assertEqual(sorted(profile['main'].line_hits), [11, 12, 13, 14, 15, 17, 18, 19])
+        self.assertGreaterEqual(self.run.overhead, 0)
+
+    def test_query_narrowing(self):
+        query = self.run.query().name('Foo.*')
+        self.assertEqual([c.name for c in query.callees_of('main')], ['Foo.foo', 'Foo.__call__', 'Foo.bar'])
+        matches = query.match([EqualsMatcher([-7])])
+        self.assertEqual([(m.func, m.where) for m in matches], [('Foo.__call__', 'return')])
+
+    def test_walk(self):
+        walked = list(self.run.walk())
+        self.assertEqual([c.id for _, c in walked], [c.id for c in self.run.calls])
+        self.assertEqual(walked[0], (0, self.run.calls[0]))
+        for depth, call in walked[1:]:
+            self.assertEqual(depth, 1 + next(d for d, c in walked if c.id == call.parent))
+        post_order = [c.name for c in self.run.walk_post_order()]
+        self.assertEqual(post_order[-1], 'main')
+        self.assertLess(post_order.index('zzz'), post_order.index('bar'))
+        self.assertEqual(len(self.run.get_children(self.run.calls[0].id)), 6)
@@ -1,3 +1,4 @@
 from .core import trace
+from .matchers import EqualsMatcher, PredicateMatcher
 
-__all__ = ['trace']
+__all__ = ['trace', 'EqualsMatcher', 'PredicateMatcher']
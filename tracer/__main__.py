@@ -0,0 +1,94 @@
+import sys
+import argparse
+
+from .export import FORMATS
+
+
+# files of processes started by the traced call, if it was traced with `children`, are merged into the run.
+def _view(args):
+    from .children import load
+    from .gui import TracerApp
+
+    with load(args.path) as run:
+        TracerApp(run).exec()
+
+
+def _export(args):
+    from .children import load
+    from .export import export, SUFFIXES
+
+    output = args.output or args.path + SUFFIXES[args.format]
+    with load(args.path) as run:
+        export(run, output, format=args.format)
+    print(output)
+
+
+# with `--fail-above` exits with 1 if any path got slower by more than that many seconds, i.e. for CI.
+def _diff(args):
+    from .diff import diff
+
+    with diff(args.before, args.after) as run_diff:
+        print(run_diff.report(n=args.top))
+        if args.gui:
+            from .gui import DiffApp
+            DiffApp(run_diff).exec()
+        slower = args.fail_above is not None and run_diff.slower_than(args.fail_above)
+    if slower:
+        sys.exit(1)
+
+
+# serves traced processes started with `trace(collector=...)` until interrupted, or until the first one is done with `--once`.
+def _collect(args):
+    from .collector import Collector
+
+    def on_session(session):
+        if args.quiet:
+            return
+        stats = session.stats
+        print(
+            f'{session.path}: {stats.get("events", 0)} events, {stats.get("dropped", 0)} dropped, '
+            f'{stats.get("blocked", 0)} batches waited for the collector'
+        )
+
+    collector = Collector(args.socket, output=args.output, once=args.once)
+    try:
+        collector.serve(on_session=on_session)
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m tracer')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    view = commands.add_parser('view', help='open a trace file in the viewer.')
+    view.add_argument('path', help='path to a trace file written with `trace(output=...)`.')
+    view.set_defaults(func=_view)
+
+    export = commands.add_parser('export', help='convert a trace file for flame graph viewers.')
+    export.add_argument('path', help='path to a trace file written with `trace(output=...)`.')
+    export.add_argument('-f', '--format', default='speedscope', choices=FORMATS)
+    export.add_argument('-o', '--output', help='path of the exported file, next to the trace file by default.')
+    export.set_defaults(func=_export)
+
+    diff = commands.add_parser('diff', help='compare two trace files.')
+    diff.add_argument('before', help='path to the trace file of the baseline run.')
+    diff.add_argument('after', help='path to the trace file of the run to compare.')
+    diff.add_argument('-n', '--top', type=int, default=10, help='number of paths reported per kind of change.')
+    diff.add_argument('--fail-above', type=float, help='exit with 1 if any path is slower by more seconds.')
+    diff.add_argument('--gui', action='store_true', help='show both runs side by side.')
+    diff.set_defaults(func=_diff)
+
+    collect = commands.add_parser('collect', help='write trace files of processes traced with `trace(collector=...)`.')
+    collect.add_argument('socket', help='path of the unix socket to listen on.')
+    collect.add_argument('-o', '--output', default='tracer-{pid}.bin', help='path of trace files, `{pid}` is the traced process.')
+    collect.add_argument('--once', action='store_true', help='exit once the first traced process is done.')
+    collect.add_argument('--quiet', action='store_true', help='do not report finished trace files.')
+    collect.set_defaults(func=_collect)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+import sys
+import dis
+import inspect
+import threading
+
+BACKENDS = ('settrace', 'monitoring')
+
+# code of frames that get suspended and resumed, i.e. generators and coroutines.
+_SUSPENDABLE_FLAGS = (
+    inspect.CO_GENERATOR
+    | inspect.CO_COROUTINE
+    | inspect.CO_ASYNC_GENERATOR
+    | inspect.CO_ITERABLE_COROUTINE
+)
+_YIELD_VALUE = dis.opmap['YIELD_VALUE']
+# before 3.11 `await` and `yield from` suspend on the instruction preceding `YIELD_FROM`.
+_YIELD_FROM = dis.opmap.get('YIELD_FROM')
+# since 3.13 a suspended frame points past its yield at a `RESUME` with a non-zero oparg.
+_RESUME = dis.opmap.get('RESUME') if sys.version_info >= (3, 13) else None
+
+
+_RETURN_OPS = frozenset(dis.opmap[name] for name in ('RETURN_VALUE', 'RETURN_CONST') if name in dis.opmap)
+
+
+# `sys.settrace` reports frames unwound by an exception as returns of `None`,
+# which are told apart by the frame being stopped anywhere but at a return.
+def _is_returning(frame):
+    code = frame.f_code.co_code
+    i = frame.f_lasti
+    return 0 <= i < len(code) and code[i] in _RETURN_OPS
+
+
+# `sys.settrace` reports yields as returns, so they are told apart by the instruction the frame is stopped at.
+def _is_suspending(frame):
+    code = frame.f_code.co_code
+    i = frame.f_lasti
+    if i < 0 or i >= len(code):
+        return False
+    op = code[i]
+    if op == _YIELD_VALUE:
+        return True
+    if _RESUME is not None:
+        return op == _RESUME and code[i + 1] != 0
+    return _YIELD_FROM is not None and i + 2 < len(code) and code[i + 2] == _YIELD_FROM
+
+
+class SetTraceBackend:
+    name = 'settrace'
+
+    def __init__(self, run, code_filter):
+        self.run = run
+        self.code_filter = code_filter
+        # frame -> exception last raised in it, which the frame might be unwound by.
+        # suspendable frames raising an exception, i.e. `GeneratorExit` thrown in by `close()`,
+        # have a final return even though they're stopped at a yield.
+        self._raising = {}
+        # before python 3.12 `stop` can only turn off tracing of its own thread,
+        # other threads which were started while tracing turn it off themselves at their next event.
+        self._active = False
+
+    def _return(self, frame, arg):
+        exception = self._raising.pop(frame, None)
+        if exception is not None and arg is None and not _is_returning(frame):
+            self.run.on_unwind(frame=frame, exception=exception)
+        else:
+            self.run.on_return(frame=frame, retval=arg)
+
+    def _local_tracer(self, frame, event, arg):
+        if not self._active:
+            sys.settrace(None)
+            return None
+        if event == 'line':
+            self.run.on_line(frame)
+        elif event == 'return':
+            if self._raising:
+                self._return(frame, arg)
+            else:
+                self.run.on_return(frame=frame, retval=arg)
+        elif event == 'exception':
+            self._raising[frame] = arg[1]
+        return self._local_tracer
+
+    def _suspendable_local_tracer(self, frame, event, arg):
+        if not self._active:
+            sys.settrace(None)
+            return None
+        if event == 'line':
+            self._raising.pop(frame, None)
+            self.run.on_line(frame)
+        elif event == 'exception':
+            self._raising[frame] = arg[1]
+        elif event == 'return':
+            if frame in self._raising:
+                self._return(frame, arg)
+            elif _is_suspending(frame):
+                self.run.on_yield(frame=frame, value=arg)
+            else:
+                self.run.on_return(frame=frame, retval=arg)
+        return self._suspendable_local_tracer
+
+    # called by the interpreter on `call` events only:
+    # returning `None` for rejected frames turns off their local tracing.
+    # frames out of focus still need their returns, so only their line events are turned off.
+    def _tracer(self, frame, event, arg):
+        if not self._active:
+            sys.settrace(None)
+            return None
+        if not self.code_filter.accepts(frame.f_code):
+            return None
+        if not self.run.on_call(frame):
+            frame.f_trace_lines = False
+        if frame.f_code.co_flags & _SUSPENDABLE_FLAGS:
+            return self._suspendable_local_tracer
+        return self._local_tracer
+
+    # threads started while tracing are traced through `threading.settrace`,
+    # already running ones only on python 3.12+ which can set the tracer in all the threads.
+    def start(self):
+        self._active = True
+        threading.settrace(self._tracer)
+        if hasattr(threading, 'settrace_all_threads'):
+            threading.settrace_all_threads(self._tracer)
+        else:
+            sys.settrace(self._tracer)
+
+    def stop(self):
+        self._active = False
+        threading.settrace(None)
+        if hasattr(threading, 'settrace_all_threads'):
+            threading.settrace_all_threads(None)
+        else:
+            sys.settrace(None)
+        self._raising.clear()
+        self.run.release_suspended()
+        self.run.merge()
+
+
+# tool ids tried in order when none is given, the ones of coverage tools and optimizers are left alone.
+def _get_tool_ids():
+    monitoring = sys.monitoring
+    return (monitoring.PROFILER_ID, monitoring.DEBUGGER_ID, 3, 4)
+
+
+# the first tool id which no other tool, i.e. `cProfile` or a debugger, is using.
+def _get_free_tool_id():
+    for tool_id in _get_tool_ids():
+        if sys.monitoring.get_tool(tool_id) is None:
+            return tool_id
+    return None
+
+
+class MonitoringBackend:
+    name = 'monitoring'
+    tool_name = 'tracer'
+
+    def __init__(self, run, code_filter, tool_id=None):
+        if not hasattr(sys, 'monitoring'):
+            msg = f'`{self.name}` backend requires python 3.12+.'
+            raise RuntimeError(msg)
+
+        self.run = run
+        self.code_filter = code_filter
+        # a free one is picked once started, when not given.
+        self.tool_id = tool_id
+        self._requested_tool_id = tool_id
+        self._codes = set()
+
+    @property
+    def _local_events(self):
+        events = sys.monitoring.events
+        return events.PY_RESUME | events.PY_RETURN | events.PY_YIELD | events.LINE
+
+    # local events are set per code rather than per frame, so `LINE` can only be left out
+    # for code out of focus when nothing below focus calls is captured, i.e. it'd never be in focus.
+    def _get_local_events(self, code):
+        events = self._local_events
+        focus = self.run.focus
+        if focus is not None and focus.depth == 0 and not focus.matches(self.run.cache.get(code).name):
+            events &= ~sys.monitoring.events.LINE
+        return events
+
+    @property
+    def _callbacks(self):
+        events = sys.monitoring.events
+        return {
+            events.PY_START: self._on_start,
+            events.PY_RESUME: self._on_resume,
+            events.PY_RETURN: self._on_return,
+            events.PY_YIELD: self._on_yield,
+            events.PY_THROW: self._on_throw,
+            events.PY_UNWIND: self._on_unwind,
+            events.LINE: self._on_line,
+        }
+
+    # all the monitored frames are entered through `PY_START`:
+    # rejected code objects get disabled right away and never have their local events set,
+    # so neither `LINE` nor any other local event is ever reported for them.
+    # events are process-wide, so all the threads are monitored without any extra setup.
+    def _on_start(self, code, offset):
+        if code not in self._codes:
+            if not self.code_filter.accepts(code):
+                return sys.monitoring.DISABLE
+            sys.monitoring.set_local_events(self.tool_id, code, self._get_local_events(code))
+            self._codes.add(code)
+        self.run.on_call(sys._getframe(1))
+
+    def _on_resume(self, code, offset):
+        self.run.on_call(sys._getframe(1))
+
+    def _on_return(self, code, offset, retval):
+        self.run.on_return(frame=sys._getframe(1), retval=retval)
+
+    def _on_yield(self, code, offset, value):
+        self.run.on_yield(frame=sys._getframe(1), value=value)
+
+    # `PY_THROW` and `PY_UNWIND` can only be set globally, so they have to be filtered by hand.
+    def _on_throw(self, code, offset, exception):
+        if code in self._codes:
+            self.run.on_call(sys._getframe(1))
+
+    def _on_unwind(self, code, offset, exception):
+        if code in self._codes:
+            self.run.on_unwind(frame=sys._getframe(1), exception=exception)
+
+    def _on_line(self, code, line_number):
+        self.run.on_line(sys._getframe(1))
+
+    def start(self):
+        monitoring = sys.monitoring
+        events = monitoring.events
+        tool_id = self._requested_tool_id
+        if tool_id is None:
+            tool_id = _get_free_tool_id()
+            if tool_id is None:
+                used = ', '.join(f'{i} ({monitoring.get_tool(i)})' for i in _get_tool_ids())
+                msg = f'`{self.name}` backend found no free `sys.monitoring` tool id, used: {used}.'
+                raise RuntimeError(msg)
+        monitoring.use_tool_id(tool_id, self.tool_name)
+        self.tool_id = tool_id
+        for event, callback in self._callbacks.items():
+            monitoring.register_callback(self.tool_id, event, callback)
+        monitoring.set_events(self.tool_id, events.PY_START | events.PY_THROW | events.PY_UNWIND)
+        # code disabled by previous runs must be reported again.
+        monitoring.restart_events()
+
+    def stop(self):
+        monitoring = sys.monitoring
+        monitoring.set_events(self.tool_id, monitoring.events.NO_EVENTS)
+        for code in self._codes:
+            monitoring.set_local_events(self.tool_id, code, monitoring.events.NO_EVENTS)
+        for event in self._callbacks:
+            monitoring.register_callback(self.tool_id, event, None)
+        monitoring.free_tool_id(self.tool_id)
+        self._codes.clear()
+        self.run.release_suspended()
+        self.run.merge()
+
+
+def get_default_backend_name():
+    return 'monitoring' if hasattr(sys, 'monitoring') else 'settrace'
+
+
+# backends which can run on this python, `monitoring` needs 3.12+.
+def get_available_backends():
+    return [b for b in BACKENDS if b != 'monitoring' or hasattr(sys, 'monitoring')]
+
+
+# `monitoring` is only picked automatically while there's a tool id left for it, other tools might be using them all.
+def create_backend(name, run, code_filter):
+    if name is None or name == 'auto':
+        name = get_default_backend_name()
+        if name == 'monitoring' and _get_free_tool_id() is None:
+            name = 'settrace'
+
+    if name == 'settrace':
+        return SetTraceBackend(run=run, code_filter=code_filter)
+    elif name == 'monitoring':
+        return MonitoringBackend(run=run, code_filter=code_filter)
+    else:
+        msg = f'unknown backend `{name}`, expected one of: {", ".join(BACKENDS)}.'
+        raise ValueError(msg)
@@ -0,0 +1,184 @@
+import sys
+import reprlib
+from copy import copy
+from itertools import chain
+
+MODES = ('copy', 'repr', 'ref')
+
+# values of these types are never mutated in place,
+# so the same object bound to the same name means the same captured value.
+_IMMUTABLE_TYPES = frozenset([
+    type(None), bool, int, float, complex, str, bytes, range, frozenset, type
+])
+
+
+class _Deleted:
+
+    def __repr__(self):
+        return '<deleted>'
+
+
+# marks names deleted from locals in a delta.
+DELETED = _Deleted()
+
+
+def _safe_copy(value):
+    try:
+        return copy(value)
+    except Exception:
+        return value
+
+
+# `None` when the comparison can't be told, i.e. `==` of arrays which raises or doesn't give a bool.
+def _safe_equals(a, b):
+    try:
+        return bool(a == b)
+    except Exception:
+        return None
+
+
+# cheap to take and changed by most in place mutations which matter, i.e. appends and removals.
+def _fingerprint(value):
+    if not hasattr(type(value), '__len__'):
+        return None
+    try:
+        return len(value)
+    except Exception:
+        return None
+
+
+class CapturePolicy:
+
+    def __init__(self, mode='copy', max_len=256, serializers=None, budget=None):
+        if mode not in MODES:
+            msg = f'unknown capture mode `{mode}`, expected one of: {", ".join(MODES)}.'
+            raise ValueError(msg)
+
+        self.mode = mode
+        self.max_len = max_len
+        self.serializers = dict(serializers or {})
+        self.budget = budget
+        self.used = 0
+        self.dropped = 0
+        self._serializers_cache = {}
+        self._repr = reprlib.Repr()
+        self._repr.maxstring = max_len
+        self._repr.maxother = max_len
+
+    @property
+    def degraded(self):
+        return self.budget is not None and self.used > self.budget
+
+    def _get_serializer(self, tp):
+        try:
+            return self._serializers_cache[tp]
+        except KeyError:
+            serializer = None
+            for base in tp.__mro__:
+                if base in self.serializers:
+                    serializer = self.serializers[base]
+                    break
+            self._serializers_cache[tp] = serializer
+            return serializer
+
+    def _to_repr(self, value):
+        try:
+            rv = self._repr.repr(value)
+        except Exception:
+            return f'<unrepresentable {type(value).__name__}>'
+        if len(rv) > self.max_len:
+            rv = rv[:self.max_len - 3] + '...'
+        return rv
+
+    def capture(self, value):
+        if self.degraded:
+            self.dropped += 1
+            return f'<{type(value).__name__}>'
+
+        serializer = self._get_serializer(type(value)) if self.serializers else None
+        if serializer is not None:
+            captured = serializer(value)
+        elif self.mode == 'ref':
+            captured = value
+        elif self.mode == 'repr':
+            captured = self._to_repr(value)
+        else:
+            captured = _safe_copy(value)
+
+        if self.budget is not None and self.mode != 'ref':
+            self.used += sys.getsizeof(captured, 0)
+        return captured
+
+    # in `copy` mode the same object is compared with its previous copy first, so that it's only copied once changed.
+    # objects which can't be compared are taken as unchanged for as long as their fingerprint is.
+    def _is_unchanged(self, prev, value):
+        if prev[0] is not value:
+            return False
+        if self.mode == 'ref' or type(value) in _IMMUTABLE_TYPES:
+            return True
+        if self.mode != 'copy' or self.degraded or (self.serializers and self._get_serializer(type(value))):
+            return False
+        if _fingerprint(value) != prev[2]:
+            return False
+        return _safe_equals(prev[1], value) is not False
+
+    def capture_args(self, f_locals, names):
+        state = {}
+        args = {}
+        for name in names:
+            if name in f_locals:
+                value = f_locals[name]
+                captured = self.capture(value)
+                state[name] = (value, captured, _fingerprint(value))
+                args[name] = captured
+        return args, state
+
+    # captures only names bound to new values since the previous capture done with the same `state`.
+    # `state` keeps raw values of the previous capture along with their fingerprints and is updated in place.
+    def capture_delta(self, f_locals, state):
+        delta = {}
+        for name, value in f_locals.items():
+            prev = state.get(name)
+            if prev is not None and self._is_unchanged(prev, value):
+                continue
+
+            captured = self.capture(value)
+            fingerprint = _fingerprint(value)
+            if prev is not None and self.mode != 'ref' and _safe_equals(prev[1], captured):
+                state[name] = (value, prev[1], fingerprint)
+                continue
+
+            state[name] = (value, captured, fingerprint)
+            delta[name] = captured
+
+        if len(state) > len(f_locals):
+            for name in [n for n in state if n not in f_locals]:
+                del state[name]
+                delta[name] = DELETED
+
+        return delta
+
+
+def apply_delta(values, delta):
+    if not delta:
+        return values
+    for name, value in delta.items():
+        if value is DELETED:
+            values.pop(name, None)
+        else:
+            values[name] = value
+    return values
+
+
+# deltas are kept as flat `(name, value, name, value, ...)` tuples:
+# those are several times smaller than dicts of the same content.
+def pack_delta(delta):
+    if not delta:
+        return None
+    return tuple(chain.from_iterable(delta.items()))
+
+
+def unpack_delta(packed):
+    if not packed:
+        return {}
+    return dict(zip(packed[::2], packed[1::2]))
@@ -0,0 +1,241 @@
+import os
+import signal
+import threading
+import multiprocessing.process
+from collections import deque
+from pathlib import Path
+
+from .core import Run
+from .filters import CodeFilter, FocusFilter
+from .capture import CapturePolicy
+from .backends import create_backend
+from .storage import TraceWriter, TraceReader
+
+# `(run, backend, config)` of the traced call whose processes get traced too, if any.
+_active = None
+_patched = False
+# SIGTERM is only handled where it can be blocked, there's none to handle on windows anyway.
+_SIGMASK = hasattr(signal, 'pthread_sigmask')
+
+
+def get_child_path(output, pid):
+    path = Path(output)
+    return path.with_name(f'{path.stem}-{pid}{path.suffix}')
+
+
+def _get_parent_call(run):
+    state = getattr(run._local, 'state', None)
+    if state is None or not state.stack:
+        return None
+    return state.stack[-1][1].id
+
+
+# wraps the target of every process started while active, so that the process traces itself.
+# processes overriding `run` have no target and are left as they are.
+# `BaseProcess.start` is patched by the first activation and stays patched for good,
+# it just starts processes as they are while nothing is active.
+def _start(self, _start=multiprocessing.process.BaseProcess.start):
+    active = _active
+    if active is not None and self._target is not None and not isinstance(self._target, _ChildTarget):
+        run, _, config = active
+        self._target = _ChildTarget(self._target, config, _get_parent_call(run))
+    return _start(self)
+
+
+def activate(run, backend, config):
+    global _active, _patched
+    if not _patched:
+        multiprocessing.process.BaseProcess.start = _start
+        _patched = True
+    _active = (run, backend, config)
+
+
+def deactivate():
+    global _active
+    _active = None
+
+
+# `config` is made of plain values only, so that it's fine to pickle for spawned processes:
+# roots, include, exclude, focus, focus_depth, backend, capture, max_len, output, root, overhead and trace,
+# an id shared by files of all the processes, and pid of the process which started this one.
+class _ChildTarget:
+
+    def __init__(self, target, config, parent_call):
+        self.target = target
+        self.config = config
+        self.parent_call = parent_call
+        self._sink = None
+
+    # `Pool.terminate` kills its workers with SIGTERM, which then still get to write their events.
+    # the python handler only runs once the main thread gets back to python code, which a worker blocked on its queue
+    # might never do, so the signal is also taken from the wakeup fd by a thread of its own.
+    # raising from the handler could cut an event short, so the file is closed once the event being written is complete.
+    # returns what `_restore_sigterm` needs to put back the wakeup fd and the handler the target had before.
+    def _handle_sigterm(self):
+        read_fd, write_fd = os.pipe()
+        os.set_blocking(write_fd, False)
+        prev_fd = signal.set_wakeup_fd(write_fd)
+        prev_handler = signal.signal(signal.SIGTERM, self._on_sigterm)
+        threading.Thread(target=self._wait_sigterm, args=(read_fd,), name='tracer-sigterm', daemon=True).start()
+        return prev_fd, prev_handler, write_fd
+
+    # closing the write end ends the thread waiting on the read end.
+    def _restore_sigterm(self, state):
+        prev_fd, prev_handler, write_fd = state
+        signal.signal(signal.SIGTERM, prev_handler)
+        signal.set_wakeup_fd(prev_fd)
+        os.close(write_fd)
+
+    def _wait_sigterm(self, read_fd):
+        try:
+            while True:
+                data = os.read(read_fd, 64)
+                if not data:
+                    return
+                if signal.SIGTERM in data:
+                    self._terminate()
+        finally:
+            os.close(read_fd)
+
+    def _on_sigterm(self, signum, frame):
+        threading.Thread(target=self._terminate, daemon=True).start()
+
+    def _terminate(self):
+        self._sink.close()
+        os._exit(128 + signal.SIGTERM)
+
+    def __call__(self, *args, **kwargs):
+        config = self.config
+        # forked processes inherit the tracing of the thread which started them, their writers are detached already.
+        if _active is not None:
+            _active[1].stop()
+            deactivate()
+
+        # until the handler is there, SIGTERM would kill the process with its file half written.
+        sigterm = None
+        if _SIGMASK:
+            signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGTERM})
+        try:
+            focus = config['focus']
+            run = Run(
+                root=Path(config['root']),
+                capture=CapturePolicy(mode=config['capture'], max_len=config['max_len']),
+                keep=False,
+                overhead=config['overhead'],
+                focus=FocusFilter(focus, depth=config['focus_depth']) if focus else None
+            )
+            run.sink = self._sink = TraceWriter(
+                get_child_path(config['output'], os.getpid()),
+                meta={
+                    'root': config['root'],
+                    'overhead': config['overhead'],
+                    'trace': config['trace'],
+                    'ppid': config['pid'],
+                    'parent_call': self.parent_call,
+                }
+            )
+            code_filter = CodeFilter(roots=config['roots'], include=config['include'], exclude=config['exclude'])
+            backend = create_backend(name=config['backend'], run=run, code_filter=code_filter)
+            if _SIGMASK:
+                sigterm = self._handle_sigterm()
+        finally:
+            if _SIGMASK:
+                signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGTERM})
+        activate(run, backend, {**config, 'pid': os.getpid()})
+        backend.start()
+        try:
+            return self.target(*args, **kwargs)
+        finally:
+            backend.stop()
+            deactivate()
+            run.sink.close()
+            if sigterm is not None:
+                self._restore_sigterm(sigterm)
+
+
+# readers of files written by processes started while tracing into `path`, including their own processes.
+def _open_children(path, trace_id):
+    path = Path(path)
+    readers = []
+    try:
+        for child in sorted(path.parent.glob(f'{path.stem}-*{path.suffix}')):
+            if not child.stem[len(path.stem) + 1:].isdigit():
+                continue
+            reader = TraceReader(child)
+            if reader.meta.get('trace') == trace_id:
+                readers.append(reader)
+            else:
+                reader.close()
+    except BaseException:
+        for reader in readers:
+            reader.close()
+        raise
+    return readers
+
+
+# a single run of the trace file at `path` and the files of all the processes it started.
+# calls and threads of every process are numbered after the ones of processes which started them,
+# and the top most calls of a process become calls of the call which started that process.
+# every event is read once and every call is renumbered once, so it takes time linear in the number of events.
+# the run keeps all the files open until it's closed, i.e. with `with load(path) as run:`.
+def load(path):
+    top = TraceReader(path)
+    readers = {top.meta.get('pid'): top}
+    try:
+        trace_id = top.meta.get('trace')
+        if trace_id is None:
+            return top.load()
+        return _merge(top, readers, _open_children(path, trace_id))
+    except BaseException:
+        for reader in readers.values():
+            reader.close()
+        raise
+
+
+def _merge(top, readers, children):
+    started = {}
+    for reader in children:
+        pid = reader.meta['pid']
+        readers[pid] = reader
+        started.setdefault(reader.meta['ppid'], []).append(pid)
+
+    calls = []
+    threads = {}
+    processes = {}
+    links = set()
+    # first call id of each process, processes are merged after the ones which started them.
+    offsets = {}
+    queue = deque([top.meta['pid']])
+    while queue:
+        pid = queue.popleft()
+        queue.extend(started.get(pid, ()))
+        reader = readers[pid]
+        run = reader.load()
+        offset = offsets[pid] = len(calls)
+        thread_offset = len(threads)
+        ppid = reader.meta.get('ppid')
+        parent_call = reader.meta.get('parent_call')
+        link = offsets[ppid] + parent_call if ppid in offsets and parent_call is not None else None
+        for call in run.calls:
+            call.id += offset
+            if call.parent is not None:
+                call.parent += offset
+            elif link is not None:
+                call.parent = link
+                links.add(call.id)
+            call.thread += thread_offset
+            calls.append(call)
+        for tid, name in run.threads.items():
+            threads[tid + thread_offset] = name
+            processes[tid + thread_offset] = pid
+
+    root = top.meta.get('root')
+    return Run(
+        root=Path(root) if root is not None else None,
+        calls=calls,
+        threads=threads,
+        processes=processes,
+        links=links,
+        overhead=top.meta.get('overhead', 0),
+        _readers=list(readers.values())
+    )
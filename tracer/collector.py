@@ -0,0 +1,506 @@
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import subprocess
+from itertools import count
+from pathlib import Path
+from time import time_ns, perf_counter_ns
+
+from .core import CodeCache, _get_current_task_name, _get_abandoned, _SWEEP_AT
+from .backends import _SUSPENDABLE_FLAGS
+from .storage import TraceWriter
+from .capture import DELETED
+
+# what a client does with a batch once the collector falls behind: wait for it or drop the batch.
+ON_FULL = ('block', 'drop')
+
+# fixed-size records of events: tag, thread, call id, parent id + 1 of calls or line number, code id, task id + 1, timestamp.
+RECORD = struct.Struct('<BIIIIIQ')
+# definitions of codes, threads and tasks are sent once, before the first record referring to them:
+# tag and length of a json payload.
+DEFINITION = struct.Struct('<BI')
+
+RECORD_CALL = 1
+RECORD_LINE = 2
+RECORD_RETURN = 3
+RECORD_RESUME = 4
+RECORD_YIELD = 5
+DEFINE_HELLO = 16
+DEFINE_CODE = 17
+DEFINE_THREAD = 18
+DEFINE_TASK = 19
+DEFINE_STATS = 20
+
+_PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _ThreadState:
+    __slots__ = ('id', 'stack', 'buf')
+
+    def __init__(self, id):
+        self.id = id
+        # `(frame, call id, task)` of the currently executing calls.
+        self.stack = []
+        # records not sent yet.
+        self.buf = bytearray()
+
+
+# stands in for `Run` of the traced process: backends drive it the same way,
+# but every event is only packed into a record of its thread's batch, which is sent to a collector once full.
+# names, sources and the trace file are left to the collector, values are never captured.
+class CollectorClient:
+
+    def __init__(self, sock, batch_size=1 << 16, on_full='block', send_timeout=1.0, meta=None, process=None, tmp_dir=None):
+        if on_full not in ON_FULL:
+            msg = f'unknown `on_full` policy `{on_full}`, expected one of: {", ".join(ON_FULL)}.'
+            raise ValueError(msg)
+
+        self.batch_size = batch_size
+        self.on_full = on_full
+        self.send_timeout = send_timeout
+        # collector started for this client only, waited for on close, and the directory of its socket.
+        self.process = process
+        self._tmp_dir = tmp_dir
+        # events handed over to the collector, events dropped as it fell behind and batches which had to wait for it.
+        self.sent = 0
+        self.dropped = 0
+        self.blocked = 0
+        # backends check for focus, lines are always of interest here.
+        self.focus = None
+        self._socket = sock
+        self._socket.setblocking(False)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._states = []
+        self._codes = {}
+        self._code_ids = count()
+        self._tasks = {}
+        self._task_ids = count(1)
+        # frame -> `(call id, thread state, task)` of suspended generators and coroutines.
+        self._suspended = {}
+        self._sweep_at = _SWEEP_AT
+        self._ids = count()
+        self._epoch = time_ns() - perf_counter_ns()
+        self._pack = RECORD.pack
+        self._define(DEFINE_HELLO, {'pid': os.getpid(), 't0': time_ns(), **(meta or {})})
+
+    @property
+    def closed(self):
+        return self._socket is None
+
+    # returns whether the data was sent.
+    def _send(self, data, events):
+        with self._lock:
+            sock = self._socket
+            if sock is None:
+                self.dropped += events
+                return False
+            try:
+                try:
+                    sent = sock.send(data)
+                except BlockingIOError:
+                    sent = 0
+                if sent < len(data):
+                    if sent == 0 and self.on_full == 'drop':
+                        self.dropped += events
+                        return False
+                    # a record which is partly sent has to be finished for the stream to stay readable,
+                    # when dropping the collector only gets `send_timeout` to take it.
+                    self.blocked += 1
+                    sock.settimeout(self.send_timeout if self.on_full == 'drop' else None)
+                    sock.sendall(memoryview(data)[sent:])
+                    sock.setblocking(False)
+            # the traced process goes on without a collector.
+            except OSError:
+                self._socket = None
+                sock.close()
+                self.dropped += events
+                return False
+            self.sent += events
+            return True
+
+    def _define(self, tag, payload):
+        data = json.dumps(payload).encode('utf-8')
+        return self._send(DEFINITION.pack(tag, len(data)) + data, events=0)
+
+    def _get_state(self):
+        state = getattr(self._local, 'state', None)
+        if state is None:
+            with self._lock:
+                state = self._local.state = _ThreadState(id=len(self._states))
+                self._states.append(state)
+            self._define(DEFINE_THREAD, {'id': state.id, 'name': threading.current_thread().name})
+        return state
+
+    def _get_code_id(self, code):
+        code_id = self._codes.get(code)
+        if code_id is None:
+            code_id = next(self._code_ids)
+            defined = self._define(DEFINE_CODE, {
+                'id': code_id,
+                'filename': code.co_filename,
+                'firstlineno': code.co_firstlineno,
+                'name': code.co_name,
+                'qualname': getattr(code, 'co_qualname', None),
+                'flags': code.co_flags,
+            })
+            # a dropped definition is sent again with the next call of the code, unless there's no collector anymore.
+            if defined or self._socket is None:
+                self._codes[code] = code_id
+        return code_id
+
+    def _get_task_id(self, task):
+        if task is None:
+            return 0
+        task_id = self._tasks.get(task)
+        if task_id is None:
+            task_id = next(self._task_ids)
+            if self._define(DEFINE_TASK, {'id': task_id, 'name': task}) or self._socket is None:
+                self._tasks[task] = task_id
+        return task_id
+
+    def _flush_state(self, state):
+        buf = state.buf
+        # the thread may still append while being flushed by another one.
+        n = len(buf)
+        if n:
+            data = bytes(buf[:n])
+            del buf[:n]
+            self._send(data, events=n // RECORD.size)
+
+    def _append(self, state, tag, call_id, arg, code_id, task_id, ts):
+        buf = state.buf
+        buf += self._pack(tag, state.id, call_id, arg, code_id, task_id, ts)
+        if len(buf) >= self.batch_size:
+            self._flush_state(state)
+
+    def _find_call(self, stack, frame):
+        for idx in range(len(stack) - 1, -1, -1):
+            if stack[idx][0] is frame:
+                return idx
+        return None
+
+    def on_call(self, frame):
+        code = frame.f_code
+        state = self._get_state()
+        if code.co_flags & _SUSPENDABLE_FLAGS:
+            suspended = self._suspended.pop(frame, None)
+            if suspended is not None:
+                call_id, owner, task = suspended
+                # the call's own records have to reach the collector before the ones of calls it makes here.
+                if owner is not state:
+                    self._flush_state(owner)
+                state.stack.append((frame, call_id, task))
+                self._append(state, RECORD_RESUME, call_id, 0, 0, 0, perf_counter_ns() + self._epoch)
+                return True
+
+        code_id = self._get_code_id(code)
+        task = _get_current_task_name()
+        stack = state.stack
+        parent = stack[-1][1] + 1 if stack and stack[-1][2] == task else 0
+        call_id = next(self._ids)
+        stack.append((frame, call_id, task))
+        self._append(state, RECORD_CALL, call_id, parent, code_id, self._get_task_id(task), perf_counter_ns() + self._epoch)
+        return True
+
+    def on_line(self, frame):
+        ts = perf_counter_ns() + self._epoch
+        state = self._get_state()
+        stack = state.stack
+        if stack and stack[-1][0] is frame:
+            call_id = stack[-1][1]
+        else:
+            idx = self._find_call(stack, frame)
+            if idx is None:
+                return
+            call_id = stack[idx][1]
+        self._append(state, RECORD_LINE, call_id, frame.f_lineno, 0, 0, ts)
+
+    def _pop_call(self, state, frame):
+        stack = state.stack
+        idx = self._find_call(stack, frame)
+        if idx is None:
+            return None
+        entry = stack[idx]
+        del stack[idx:]
+        return entry
+
+    def on_return(self, frame, retval):
+        ts = perf_counter_ns() + self._epoch
+        state = self._get_state()
+        entry = self._pop_call(state, frame)
+        if entry is not None:
+            self._append(state, RECORD_RETURN, entry[1], 0, 0, 0, ts)
+
+    # exceptions aren't sent, a call raising one just returns.
+    def on_unwind(self, frame, exception):
+        self.on_return(frame, None)
+
+    def on_yield(self, frame, value):
+        ts = perf_counter_ns() + self._epoch
+        state = self._get_state()
+        entry = self._pop_call(state, frame)
+        if entry is not None:
+            suspended = self._suspended
+            suspended[frame] = (entry[1], state, entry[2])
+            if len(suspended) >= self._sweep_at:
+                for abandoned in _get_abandoned(suspended):
+                    del suspended[abandoned]
+                self._sweep_at = max(_SWEEP_AT, 2 * len(suspended))
+            self._append(state, RECORD_YIELD, entry[1], 0, 0, 0, ts)
+
+    def release_suspended(self):
+        self._suspended.clear()
+        self._sweep_at = _SWEEP_AT
+
+    # sends the batches of all the threads, backends call it once they stop.
+    def merge(self):
+        for state in list(self._states):
+            self._flush_state(state)
+
+    def flush(self):
+        self.merge()
+
+    def stats(self):
+        return {'events': self.sent, 'dropped': self.dropped, 'blocked': self.blocked}
+
+    # with a collector of its own, waits for it to finish the trace file.
+    def close(self, timeout=None):
+        if self._socket is not None:
+            self.merge()
+            self._define(DEFINE_STATS, self.stats())
+            with self._lock:
+                sock, self._socket = self._socket, None
+            if sock is not None:
+                sock.close()
+        if self.process is not None:
+            process, self.process = self.process, None
+            process.wait(timeout=timeout)
+        if self._tmp_dir is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._tmp_dir = None
+
+
+# code object of the traced process as far as `CodeCache` is concerned.
+# `co_qualname` is left unset for pythons which have none, so that the cache indexes the source for names.
+class _RemoteCode:
+    __slots__ = ('co_filename', 'co_firstlineno', 'co_name', 'co_flags', 'co_qualname')
+    co_argcount = 0
+    co_kwonlyargcount = 0
+    co_varnames = ()
+
+    def __init__(self, filename, firstlineno, name, flags, qualname=None):
+        self.co_filename = filename
+        self.co_firstlineno = firstlineno
+        self.co_name = name
+        self.co_flags = flags
+        if qualname is not None:
+            self.co_qualname = qualname
+
+
+# decodes the stream of a single client into a trace file.
+# calls are given contiguous ids in the order they arrive, calls whose records or code were dropped are left out
+# and calls whose caller was dropped become roots, as with dumps of a flight recorder.
+class _Session:
+
+    def __init__(self, output):
+        self.output = output
+        self.path = None
+        self.meta = {}
+        self.stats = {}
+        self._writer = None
+        self._cache = None
+        self._buf = bytearray()
+        self._infos = {}
+        self._tasks = {}
+        # client call id -> call id in the trace file.
+        self._ids = {}
+
+    def feed(self, data):
+        buf = self._buf
+        buf += data
+        n = len(buf)
+        pos = 0
+        while pos < n:
+            if buf[pos] < DEFINE_HELLO:
+                if pos + RECORD.size > n:
+                    break
+                self._on_record(*RECORD.unpack_from(buf, pos))
+                pos += RECORD.size
+            else:
+                if pos + DEFINITION.size > n:
+                    break
+                tag, length = DEFINITION.unpack_from(buf, pos)
+                start = pos + DEFINITION.size
+                if start + length > n:
+                    break
+                self._on_definition(tag, json.loads(bytes(buf[start:start + length]).decode('utf-8')))
+                pos = start + length
+        del buf[:pos]
+
+    def _on_record(self, tag, thread, call_id, arg, code_id, task_id, ts):
+        writer = self._writer
+        if tag == RECORD_CALL:
+            info = self._infos.get(code_id)
+            if info is None:
+                return
+            new_id = len(self._ids)
+            self._ids[call_id] = new_id
+            parent = self._ids.get(arg - 1) if arg else None
+            task = self._tasks.get(task_id) if task_id else None
+            writer.write_call(new_id, parent, info.name, info.path, info.first_lineno, thread, task, ts, ())
+            return
+
+        new_id = self._ids.get(call_id)
+        if new_id is None:
+            return
+        if tag == RECORD_LINE:
+            writer.write_line(new_id, arg, ts, ())
+        elif tag == RECORD_RETURN:
+            writer.write_return(new_id, ts, None, ())
+        elif tag == RECORD_RESUME:
+            writer.write_resume(new_id, ts)
+        elif tag == RECORD_YIELD:
+            writer.write_yield(new_id, ts, DELETED)
+
+    def _on_definition(self, tag, payload):
+        if tag == DEFINE_HELLO:
+            self.meta = payload
+            root = payload.get('root')
+            self._cache = CodeCache(root=Path(root) if root is not None else None)
+            self.path = self.output.format(pid=payload.get('pid'))
+            meta = {k: v for k, v in payload.items() if k != 't0'}
+            self._writer = TraceWriter(self.path, meta={**meta, 'collector': True}, t0=payload.get('t0'))
+        elif tag == DEFINE_CODE:
+            code = _RemoteCode(
+                filename=payload['filename'],
+                firstlineno=payload['firstlineno'],
+                name=payload['name'],
+                flags=payload['flags'],
+                qualname=payload['qualname']
+            )
+            self._infos[payload['id']] = self._cache.get(code)
+        elif tag == DEFINE_THREAD:
+            self._writer.write_thread(payload['id'], payload['name'])
+        elif tag == DEFINE_TASK:
+            self._tasks[payload['id']] = payload['name']
+        elif tag == DEFINE_STATS:
+            self.stats = payload
+            self._writer.update_meta(**payload)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+# receives events of traced processes over a unix socket, names their calls and writes a trace file per process.
+# `output` may refer to `{pid}` of the traced process. with `once` it stops after the first client is done.
+class Collector:
+
+    def __init__(self, address, output='tracer-{pid}.bin', once=False, recv_size=1 << 20):
+        self.address = address
+        self.output = output
+        self.once = once
+        self.recv_size = recv_size
+        # `_Session` of every client served so far.
+        self.sessions = []
+        self._server = None
+
+    def _collect(self, conn, on_session=None):
+        session = _Session(self.output)
+        self.sessions.append(session)
+        try:
+            with conn:
+                while True:
+                    data = conn.recv(self.recv_size)
+                    if not data:
+                        break
+                    session.feed(data)
+        finally:
+            session.close()
+        if on_session is not None:
+            on_session(session)
+        return session
+
+    def listen(self):
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.address)
+        self._server.listen()
+
+    # clients are served each on a thread of its own, `on_session` is called with every finished one.
+    def serve(self, on_session=None):
+        if self._server is None:
+            self.listen()
+        threads = []
+        try:
+            while True:
+                conn, _ = self._server.accept()
+                if self.once:
+                    self._collect(conn, on_session)
+                    break
+                thread = threading.Thread(target=self._collect, args=(conn, on_session), daemon=True)
+                thread.start()
+                threads.append(thread)
+        finally:
+            self.close()
+            for thread in threads:
+                thread.join()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+
+
+def _connect(address, timeout, process=None):
+    deadline = time.monotonic() + timeout
+    while True:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(address)
+            return sock
+        except (FileNotFoundError, ConnectionRefusedError):
+            sock.close()
+            if process is not None and process.poll() is not None:
+                msg = f'collector exited with {process.returncode}.'
+                raise RuntimeError(msg)
+            if time.monotonic() > deadline:
+                msg = f'no collector at `{address}` after {timeout}s.'
+                raise TimeoutError(msg)
+            time.sleep(0.01)
+
+
+# collector started for this process alone, its socket lives in a temporary directory.
+def _spawn(output):
+    tmp_dir = tempfile.mkdtemp(prefix='tracer-')
+    address = os.path.join(tmp_dir, 'collector.sock')
+    python_path = os.environ.get('PYTHONPATH')
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join([_PACKAGE_ROOT, python_path] if python_path else [_PACKAGE_ROOT])}
+    cmd = [sys.executable, '-m', 'tracer', 'collect', address, '--output', output, '--once', '--quiet']
+    process = subprocess.Popen(cmd, env=env)
+    return address, process, tmp_dir
+
+
+# `address` is a socket of a running `python -m tracer collect`, or `True` to start a collector writing to `output`.
+# a client connected before, i.e. with options of its own, is taken as is.
+def connect(address, output=None, meta=None, timeout=10, **kwargs):
+    if isinstance(address, CollectorClient):
+        return address
+    process = tmp_dir = None
+    if address is True:
+        if output is None:
+            msg = 'a collector of its own requires `output`.'
+            raise ValueError(msg)
+        address, process, tmp_dir = _spawn(output)
+    sock = _connect(address, timeout=timeout, process=process)
+    return CollectorClient(sock, meta=meta, process=process, tmp_dir=tmp_dir, **kwargs)
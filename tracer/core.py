@@ -1,23 +1,25 @@
 import os
 import sys
+import atexit
+import signal
+import ast
 import inspect
-import re
+import warnings
 from dataclasses import dataclass, field
 from typing import Any
 from pathlib import Path
-from copy import copy
-from time import time
+from time import time_ns, perf_counter_ns, monotonic
 from datetime import datetime
-from collections import defaultdict
-from functools import wraps
+from functools import wraps, partial
+from threading import local, current_thread, main_thread
+from itertools import count
 
-from .gui import TracerApp
+from .filters import CodeFilter, FocusFilter
+from .capture import CapturePolicy, apply_delta, pack_delta, unpack_delta
+from .backends import create_backend, _SUSPENDABLE_FLAGS
 
 __version__ = '1.0.1'
 
-CLASS_NAME_REGEXP = re.compile(r'class\s+([\w_\d]+):')
-SELF_ARG_REGEXP = re.compile(r'\(\s*self[\s,)]+')
-
 
 def _get_root_path(path):
     if not os.path.exists(path):
@@ -28,79 +30,140 @@ def _get_root_path(path):
     return Path(root)
 
 
-def _matches_root(root, path):
-    return path.startswith(root.as_posix())
+def _get_common_root(roots):
+    for r in roots:
+        if not os.path.exists(r):
+            raise FileNotFoundError(r)
 
+    roots = [os.path.abspath(r) for r in roots]
+    return Path(os.path.commonpath(roots))
 
-def _recognize_frame(root, frame):
-    path = _get_frame_path(frame)
-    return _matches_root(root, path)
+
+def _matches_root(root, path):
+    return path.startswith(root.as_posix())
 
 
 def _get_frame_path(frame):
     return os.path.abspath(frame.f_code.co_filename)
 
 
-def _get_frame_locals(frame):
-    return copy(frame.f_locals)
-
-
-def _get_frame_args(frame):
-    args = copy(inspect.getargvalues(frame))
-    args = {name: copy(args.locals[name]) for name in args.args}
-    return args
-
-
-def _find_method_class_name(lines):
-    for ln in reversed(lines):
-        if ln.strip().startswith('class'):
-            match = CLASS_NAME_REGEXP.search(ln)
-            if match is not None:
-                cn = match.group(1)
-                return cn
-
+def _get_code_arg_names(code):
+    num = code.co_argcount + code.co_kwonlyargcount
+    if code.co_flags & inspect.CO_VARARGS:
+        num += 1
+    if code.co_flags & inspect.CO_VARKEYWORDS:
+        num += 1
+    return code.co_varnames[:num]
 
-def _is_any_method(first_lineno, lines):
-    if not lines:
-        return False
-
-    first_line = lines[first_lineno]
-    if SELF_ARG_REGEXP.search(first_line) is not None:
-        return True
-    for ln in lines[first_lineno:]:
-        ln = ln.strip()
-        if ln.startswith('@staticmethod') or ln.startswith('@classmethod'):
-            return True
-        elif not ln.startswith('@'):
-            return False
 
+def _get_file_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
 
-def _get_frame_local_name(frame):
-    fp = frame.f_code.co_filename
-    with open(fp, 'r') as f:
-        lines = f.readlines()
 
-    frame_name = frame.f_code.co_name
-    first_lineno = frame.f_code.co_firstlineno - 1
+def _read_file_lines(path):
+    try:
+        with open(path, 'r') as f:
+            return f.readlines()
+    except (OSError, UnicodeDecodeError):
+        return []
+
+
+# maps `(first line, name)` of every function, class, lambda and comprehension of a module to its qualified name,
+# for pythons before 3.11 which have no `co_qualname`.
+class _QualNameVisitor(ast.NodeVisitor):
+
+    def __init__(self):
+        self.names = {}
+        self._prefix = ''
+
+    def _add(self, lineno, name):
+        qual_name = f'{self._prefix}.{name}' if self._prefix else name
+        self.names.setdefault((lineno, name), qual_name)
+        return qual_name
+
+    def _visit_body(self, prefix, nodes):
+        outer = self._prefix
+        self._prefix = prefix
+        for node in nodes:
+            self.visit(node)
+        self._prefix = outer
+
+    # code of decorated definitions starts at the first decorator.
+    def _get_first_lineno(self, node):
+        return min([node.lineno] + [d.lineno for d in node.decorator_list])
+
+    # decorators, defaults and bases are evaluated in the enclosing scope, bodies in a scope of their own.
+    def visit_FunctionDef(self, node):
+        qual_name = self._add(self._get_first_lineno(node), node.name)
+        for d in node.decorator_list:
+            self.visit(d)
+        self.visit(node.args)
+        self._visit_body(f'{qual_name}.<locals>', node.body)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        qual_name = self._add(self._get_first_lineno(node), node.name)
+        for child in node.decorator_list + node.bases + node.keywords:
+            self.visit(child)
+        self._visit_body(qual_name, node.body)
+
+    def visit_Lambda(self, node):
+        qual_name = self._add(node.lineno, '<lambda>')
+        self.visit(node.args)
+        self._visit_body(f'{qual_name}.<locals>', [node.body])
+
+    # the first iterable of a comprehension is evaluated in the enclosing scope,
+    # and unlike functions comprehensions add no `<locals>` to the names of their nested code.
+    def _visit_comprehension(self, node, name):
+        qual_name = self._add(node.lineno, name)
+        first, *rest = node.generators
+        self.visit(first.iter)
+        elts = [node.key, node.value] if isinstance(node, ast.DictComp) else [node.elt]
+        self._visit_body(qual_name, [first.target, *first.ifs, *rest, *elts])
+
+    def visit_ListComp(self, node):
+        self._visit_comprehension(node, '<listcomp>')
+
+    def visit_SetComp(self, node):
+        self._visit_comprehension(node, '<setcomp>')
+
+    def visit_DictComp(self, node):
+        self._visit_comprehension(node, '<dictcomp>')
+
+    def visit_GeneratorExp(self, node):
+        self._visit_comprehension(node, '<genexpr>')
+
+
+def _get_qual_names(lines):
+    try:
+        tree = ast.parse(''.join(lines))
+    except (SyntaxError, ValueError):
+        return {}
+    visitor = _QualNameVisitor()
+    visitor.visit(tree)
+    return visitor.names
 
-    if _is_any_method(first_lineno=first_lineno, lines=lines):
-        lines = lines[:first_lineno]
-        cls_name = _find_method_class_name(lines)
-        if cls_name is None:
-            msg = f'could not find class name of method frame `{frame}`.'
-            raise Exception(msg)
-        frame_name = f'{cls_name}.{frame_name}'
 
-    return frame_name
+# `names` is the index of `_get_qual_names` of the code's module, only built when there's no `co_qualname`.
+def _get_code_local_name(code, names=None):
+    qual_name = getattr(code, 'co_qualname', None)
+    if qual_name is not None:
+        return qual_name
+    if names is None:
+        names = _get_qual_names(_read_file_lines(code.co_filename))
+    return names.get((code.co_firstlineno, code.co_name), code.co_name)
 
 
-def _get_frame_qual_name(root, frame):
-    if not os.path.exists(frame.f_code.co_filename):
-        return frame.f_code.co_filename
+def _get_code_qual_name(root, code, names=None):
+    if not os.path.exists(code.co_filename):
+        return code.co_filename
 
-    frame_name = _get_frame_local_name(frame)
-    path = _get_frame_path(frame)
-    path = Path(path)
+    frame_name = _get_code_local_name(code=code, names=names)
+    path = Path(os.path.abspath(code.co_filename))
 
     # when this func is used to get caller's name,
     # sometimes caller might not be located under the `root`
@@ -116,178 +179,939 @@ def _get_frame_qual_name(root, frame):
     return frame_name
 
 
+def _get_frame_local_name(frame):
+    return _get_code_local_name(code=frame.f_code)
+
+
+def _get_frame_qual_name(root, frame):
+    return _get_code_qual_name(root=root, code=frame.f_code)
+
+
 @dataclass
+class CodeInfo:
+    name: Any = None
+    path: Any = None
+    traced: Any = False
+    first_lineno: Any = None
+    arg_names: Any = field(default=(), repr=False)
+    lines: Any = field(default_factory=list, repr=False)
+    mtime: Any = field(default=None, repr=False)
+    suspendable: Any = False
+    # only values yielded by plain generators are data, coroutines yield event loop internals.
+    generator: Any = False
+
+    def get_source(self):
+        if not self.lines or not self.first_lineno:
+            return ''
+        return ''.join(inspect.getblock(self.lines[self.first_lineno - 1:]))
+
+
+# entries are keyed on code objects and get dropped once mtime of their source file changes.
+# mtime of a file is checked at most once per `check_interval` seconds, so that lookups on call events cost no syscall.
+class CodeCache:
+
+    def __init__(self, root, check_interval=1.0):
+        self.root = root
+        self.check_interval = check_interval
+        self.hits = 0
+        self.misses = 0
+        self._codes = {}
+        self._files = {}
+        # path -> `(mtime, monotonic time it was checked at)`.
+        self._mtimes = {}
+        # path -> `(mtime, qualified names index)`, only used by pythons without `co_qualname`.
+        self._names = {}
+
+    def __len__(self):
+        return len(self._codes)
+
+    def _get_file_lines(self, path, mtime):
+        entry = self._files.get(path)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+
+        lines = _read_file_lines(path)
+        self._files[path] = (mtime, lines)
+        return lines
+
+    def _get_file_names(self, path, mtime, lines):
+        entry = self._names.get(path)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+
+        names = _get_qual_names(lines)
+        self._names[path] = (mtime, names)
+        return names
+
+    def _create_info(self, code, mtime):
+        lines = self._get_file_lines(path=code.co_filename, mtime=mtime)
+        path = os.path.abspath(code.co_filename)
+        names = None
+        if not hasattr(code, 'co_qualname'):
+            names = self._get_file_names(path=code.co_filename, mtime=mtime, lines=lines)
+        return CodeInfo(
+            name=_get_code_qual_name(root=self.root, code=code, names=names),
+            path=path,
+            traced=_matches_root(self.root, path),
+            first_lineno=code.co_firstlineno,
+            arg_names=_get_code_arg_names(code),
+            lines=lines,
+            mtime=mtime,
+            suspendable=bool(code.co_flags & _SUSPENDABLE_FLAGS),
+            generator=bool(code.co_flags & inspect.CO_GENERATOR)
+        )
+
+    def _get_mtime(self, path):
+        now = monotonic()
+        entry = self._mtimes.get(path)
+        if entry is not None and now - entry[1] < self.check_interval:
+            return entry[0]
+        mtime = _get_file_mtime(path)
+        self._mtimes[path] = (mtime, now)
+        return mtime
+
+    def get(self, code):
+        mtime = self._get_mtime(code.co_filename)
+        info = self._codes.get(code)
+        if info is not None and info.mtime == mtime:
+            self.hits += 1
+            return info
+
+        self.misses += 1
+        info = self._create_info(code=code, mtime=mtime)
+        self._codes[code] = info
+        return info
+
+    def clear(self):
+        self._codes.clear()
+        self._files.clear()
+        self._names.clear()
+        self._mtimes.clear()
+        self.hits = 0
+        self.misses = 0
+
+
 class Line:
-    frame: Any = field(default=None, repr=False)
-    num: Any = None
-    src: Any = None
-    locals: Any = field(default_factory=dict, repr=False)
+    __slots__ = ('num', 'src', 'time', '_delta')
+
+    def __init__(self, num=None, src=None, delta=None, time=None):
+        self.num = num
+        self.src = src
+        # ns until the next event of the same call, including the time of calls made by the line.
+        self.time = time
+        # only the locals changed since the previous line of the same call.
+        self._delta = pack_delta(delta)
+
+    def __repr__(self):
+        return f'Line(num={self.num!r}, src={self.src!r})'
+
+    @property
+    def delta(self):
+        return unpack_delta(self._delta)
 
 
-@dataclass
 class Call:
-    frame: Any = field(default=None, repr=False)
-    name: Any = None
-    args: Any = None
-    locals: Any = field(default_factory=dict, repr=False)
-    retval: Any = None
-    caller: Any = None
-    num: Any = None
-    call_timestamp: Any = field(default=None, repr=False)
-    ret_timestamp: Any = field(default=None, repr=False)
-    lines: Any = field(default_factory=dict, repr=False)
+    __slots__ = (
+        'id',
+        'info',
+        'name',
+        'parent',
+        'args',
+        'retval',
+        'call_timestamp',
+        'ret_timestamp',
+        'thread',
+        'task',
+        'segments',
+        'yields',
+        'lines',
+        'exception',
+        '_ret_delta',
+        '_capture_state',
+        '_line_timestamp',
+        '_focus',
+        '_caller',
+    )
+
+    def __init__(
+        self,
+        id=None,
+        info=None,
+        name=None,
+        parent=None,
+        args=None,
+        retval=None,
+        call_timestamp=None,
+        ret_timestamp=None,
+        thread=None,
+        task=None,
+        _capture_state=None
+    ):
+        self.id = id
+        self.info = info
+        self.name = name
+        self.parent = parent
+        self.args = args
+        self.retval = retval
+        self.call_timestamp = call_timestamp
+        self.ret_timestamp = ret_timestamp
+        self.thread = thread
+        self.task = task
+        # `[resumed, suspended, resumed, ...]` timestamps of suspendable calls.
+        self.segments = None
+        self.yields = None
+        self.lines = []
+        # repr of the exception the call raised, exceptions hold frames of their traceback so they're never kept as they are.
+        self.exception = None
+        self._ret_delta = None
+        self._capture_state = _capture_state
+        # timestamp of the last line event while the call is running.
+        self._line_timestamp = None
+        # levels below the closest focus call, `None` for calls of which only call and return are timed.
+        self._focus = 0
+        # caller of a call which gets its id only once kept by a `tail.TailPolicy`.
+        self._caller = None
+
+    def __repr__(self):
+        return f'Call(id={self.id!r}, name={self.name!r}, args={self.args!r}, retval={self.retval!r})'
 
     @property
     def calltime(self):
         if self.call_timestamp is not None:
-            return datetime.fromtimestamp(self.call_timestamp)
+            return datetime.fromtimestamp(self.call_timestamp / 1e9)
         return -1
 
     @property
     def rettime(self):
-        if self.call_timestamp is not None:
-            return datetime.fromtimestamp(self.ret_timestamp)
+        if self.ret_timestamp is not None:
+            return datetime.fromtimestamp(self.ret_timestamp / 1e9)
         return -1
 
+    # in seconds.
     @property
     def runtime(self):
         if self.call_timestamp is not None and self.ret_timestamp is not None:
-            return round(self.ret_timestamp - self.call_timestamp, 5)
+            return (self.ret_timestamp - self.call_timestamp) / 1e9
         return -1
 
+    # time spent actually running, excluding the time a generator or coroutine was suspended.
     @property
-    def id(self):
-        return id(self.frame)
+    def active_runtime(self):
+        segments = self.segments
+        if not segments:
+            return self.runtime
+        return sum(end - start for start, end in zip(segments[::2], segments[1::2])) / 1e9
 
     @property
     def uname(self):
         return f'{self.name}:{self.id}'
 
+    @property
+    def ret_delta(self):
+        return unpack_delta(self._ret_delta)
+
+    @ret_delta.setter
+    def ret_delta(self, delta):
+        self._ret_delta = pack_delta(delta)
+
+    @property
+    def locals(self):
+        values = self._rebuild_locals(len(self.lines))
+        return apply_delta(values, self.ret_delta)
+
+    def _rebuild_locals(self, stop):
+        values = dict(self.args or {})
+        for ln in self.lines[:stop]:
+            if ln._delta is not None:
+                apply_delta(values, ln.delta)
+        return values
+
+    def _find_line(self, num):
+        for idx in range(len(self.lines) - 1, -1, -1):
+            if self.lines[idx].num == num:
+                return idx
+        return None
+
     def add_line(self, line):
-        self.lines[line.num] = line
+        self.lines.append(line)
+
+    @property
+    def num_lines(self):
+        return len(self.lines)
+
+    # line num -> `(hits, ns)` summed over all the times the line was hit,
+    # less `overhead` ns of the tracer per hit.
+    def get_line_times(self, overhead=0):
+        times = {}
+        for ln in self.lines:
+            hits, total = times.get(ln.num, (0, 0))
+            times[ln.num] = (hits + 1, total + max((ln.time or 0) - overhead, 0))
+        return times
+
+    # the time since the last line event goes to the last line.
+    def _end_line(self, ts):
+        if self._line_timestamp is not None:
+            if self.lines:
+                self.lines[-1].time = ts - self._line_timestamp
+            self._line_timestamp = None
 
     def get_line(self, num):
-        return self.lines.get(num)
+        idx = self._find_line(num)
+        return self.lines[idx] if idx is not None else None
+
+    # locals as of the last time the line `num` was hit.
+    def get_line_locals(self, num):
+        idx = self._find_line(num)
+        if idx is None:
+            return {}
+        return self._rebuild_locals(idx + 1)
+
+
+def _get_call_id(call):
+    return call.id
+
+
+# name of the asyncio task running in the current thread if any.
+# asyncio is never imported here: without it being imported by the traced code there are no tasks anyway.
+def _get_current_task_name():
+    asyncio = sys.modules.get('asyncio')
+    if asyncio is None:
+        return None
+    loop = asyncio._get_running_loop()
+    if loop is None:
+        return None
+    task = asyncio.current_task(loop)
+    return task.get_name() if task is not None else None
+
+
+# everything a run tracks per thread, only ever touched by its own thread while tracing.
+class _ThreadState:
+    __slots__ = ('id', 'name', 'stack', 'calls')
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+        # `(frame, call)` of the currently executing calls.
+        self.stack = []
+        # new calls waiting to be merged into the run.
+        self.calls = []
+
+
+# groupings of root calls, `process` only tells processes apart in runs merged from several processes.
+GROUP_BY = ('thread', 'task', 'process')
+
+# size of the map of suspended calls it's first swept of abandoned generators at.
+_SWEEP_AT = 1024
+
+
+# frames of suspended calls referenced by nothing but `suspended`, i.e. whose generator or coroutine is gone.
+# generators can't be reached from their frames without scanning the heap, so they can't be watched themselves.
+# since 3.13 closing a generator suspended outside of any `try` doesn't run it, so that's all that's left of it.
+def _get_abandoned(suspended):
+    abandoned = []
+    for frame in suspended:
+        # the map, the loop and `getrefcount` itself.
+        if sys.getrefcount(frame) <= 3:
+            abandoned.append(frame)
+    return abandoned
 
 
 @dataclass
 class Run:
     root: Any = None
-    frames: Any = field(default_factory=list)
     calls: Any = field(default_factory=list)
-    _calls_frame_map: Any = field(default_factory=lambda: defaultdict(list))
-    _calls_uname_map: Any = field(default_factory=dict)
+    # ids of calls without a traced caller and parent id -> ids of child calls.
+    roots: Any = field(default_factory=list, repr=False)
+    children: Any = field(default_factory=dict, repr=False)
+    cache: Any = field(default=None, repr=False)
+    capture: Any = field(default=None, repr=False)
+    # receives every event right away, i.e. `storage.TraceWriter`.
+    sink: Any = field(default=None, repr=False)
+    # whether finished calls are kept in memory.
+    keep: Any = True
+    # tracer's own cost of a single event in ns, subtracted from times of profiles.
+    overhead: Any = 0
+    # `filters.FocusFilter` of functions captured in full, all of them are if not set.
+    focus: Any = field(default=None, repr=False)
+    # `tail.TailPolicy` deciding which calls are kept once they've returned, all of them are if not set.
+    tail: Any = field(default=None, repr=False)
+    # thread id -> thread name, ids are given by the run as os thread idents get reused.
+    threads: Any = field(default_factory=dict, repr=False)
+    # thread id -> pid of its process, only set for runs merged from several processes.
+    processes: Any = field(default_factory=dict, repr=False)
+    # ids of the top most calls of processes, whose parent is the call which started their process.
+    # they run alongside their parent rather than within it, so their times aren't part of the parent's.
+    links: Any = field(default_factory=set, repr=False)
+    # `_ThreadState` of every traced thread, calls are buffered per thread so that threads never share a list while tracing.
+    _states: Any = field(default_factory=list, repr=False)
+    _local: Any = field(default_factory=local, repr=False)
+    # merged calls waiting for calls with lower ids.
+    _pending: Any = field(default_factory=list, repr=False)
+    # frame -> call of suspended generators and coroutines, swept of abandoned ones once it doubles in size.
+    _suspended: Any = field(default_factory=dict, repr=False)
+    _sweep_at: Any = field(default=_SWEEP_AT, repr=False)
+    # timestamps are ns of `perf_counter_ns` shifted to the epoch, so they are precise and still are dates.
+    _epoch: Any = field(default_factory=lambda: time_ns() - perf_counter_ns(), repr=False)
+    _ids: Any = field(default_factory=count, repr=False)
+    # thread ids are handed out by `next`, which is atomic, as threads may start tracing at once.
+    _tids: Any = field(default_factory=count, repr=False)
+    _index: Any = field(default=None, repr=False)
+    # readers of trace files the calls of loaded runs are read from, closed along with the run.
+    _readers: Any = field(default_factory=list, repr=False)
+
+    def __post_init__(self):
+        if self.cache is None:
+            self.cache = CodeCache(root=self.root)
+        if self.capture is None:
+            self.capture = CapturePolicy()
+        if self.calls and not self.roots:
+            for call in self.calls:
+                self._link_call(call)
+            self._ids = count(len(self.calls))
 
     def __len__(self):
         return len(self.calls)
 
-    def add_call(self, call):
-        call.num = len(self)
-        self.calls.append(call)
-        self._calls_frame_map[id(call.frame)] = call
-        self._calls_uname_map[call.uname] = call
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # `(call, line num, ns)` of every line hit, trace files are read in one pass rather than call by call.
+    def iter_line_times(self):
+        if self._readers:
+            for reader in self._readers:
+                yield from reader.iter_line_times()
+            return
+        for call in self.calls:
+            for ln in call.lines:
+                yield call, ln.num, ln.time
+
+    # lines, values and yields of calls not loaded yet can't be read once closed.
+    def close(self):
+        for reader in self._readers:
+            reader.close()
+        self._readers.clear()
+
+    def now(self):
+        return perf_counter_ns() + self._epoch
+
+    def _link_call(self, call):
+        if call.parent is None:
+            self.roots.append(call.id)
+        else:
+            children = self.children.get(call.parent)
+            if children is None:
+                children = self.children[call.parent] = []
+            children.append(call.id)
 
-    def get_call_by_frame(self, frame):
-        return self._calls_frame_map.get(id(frame))
+    def add_call(self, call):
+        call.id = next(self._ids)
+        if self.keep:
+            self.calls.append(call)
+            self._link_call(call)
+
+    # moves calls buffered by the threads into `calls` in the order of their ids.
+    # ids are handed out to all the threads at once, so a call is only merged after all the lower ids are.
+    def merge(self):
+        pending = self._pending
+        for state in list(self._states):
+            calls = state.calls
+            # the thread may still append while being drained.
+            n = len(calls)
+            if n:
+                pending.extend(calls[:n])
+                del calls[:n]
+        if not pending:
+            return
+
+        pending.sort(key=_get_call_id)
+        merged = 0
+        for call in pending:
+            if call.id != len(self.calls):
+                break
+            self.calls.append(call)
+            self._link_call(call)
+            merged += 1
+        del pending[:merged]
+
+    def get_call(self, call_id):
+        if call_id is None or not 0 <= call_id < len(self.calls):
+            return None
+        return self.calls[call_id]
 
     def get_call_by_uname(self, uname):
-        return self._calls_uname_map.get(uname)
-
-    def _get_caller_call(self, frame):
-        caller_frame = frame.f_back
-        call = self.get_call_by_frame(caller_frame)
-        if call is None:
-            name = _get_frame_qual_name(root=self.root, frame=caller_frame)
-            call = Call(frame=caller_frame, name=name)
-        return call
-
+        _, _, call_id = uname.rpartition(':')
+        return self.get_call(int(call_id)) if call_id.isdigit() else None
+
+    def get_caller(self, call):
+        return self.get_call(call.parent)
+
+    def get_children(self, call_id):
+        if call_id is None:
+            return self.roots
+        return self.children.get(call_id, ())
+
+    # pre-order walk yielding `(depth, call)`, iterative so that it's fine with any depth.
+    def walk(self, call_id=None):
+        stack = [(0, i) for i in reversed(self.get_children(call_id))]
+        while stack:
+            depth, i = stack.pop()
+            yield depth, self.calls[i]
+            children = self.children.get(i)
+            if children:
+                stack.extend((depth + 1, ch) for ch in reversed(children))
+
+    # post-order walk, i.e. calls in the order they returned.
+    def walk_post_order(self, call_id=None):
+        stack = [(i, False) for i in reversed(self.get_children(call_id))]
+        while stack:
+            i, visited = stack.pop()
+            if visited:
+                yield self.calls[i]
+                continue
+            stack.append((i, True))
+            children = self.children.get(i)
+            if children:
+                stack.extend((ch, False) for ch in reversed(children))
+
+    def get_index(self):
+        if self._index is None or self._index.size != len(self):
+            from .query import CallIndex
+            self._index = CallIndex(self)
+        return self._index
+
+    def query(self):
+        from .query import Query
+        return Query(self)
+
+    def profile(self):
+        from .profiling import Profile
+        return Profile(self)
+
+    def _get_state(self):
+        state = getattr(self._local, 'state', None)
+        if state is None:
+            tid = next(self._tids)
+            state = self._local.state = _ThreadState(id=tid, name=current_thread().name)
+            self.threads[tid] = state.name
+            self._states.append(state)
+            if self.sink is not None:
+                self.sink.on_thread(tid, state.name)
+        return state
+
+    def get_thread_name(self, tid):
+        name = self.threads.get(tid, str(tid))
+        pid = self.processes.get(tid)
+        return f'{pid}/{name}' if pid is not None else name
+
+    def get_process(self, call):
+        return self.processes.get(call.thread)
+
+    # root calls grouped by `thread`, asyncio `task` or `process` as `{label: [call ids]}` in order of appearance.
+    # calls made outside of any task are grouped by their thread.
+    def get_groups(self, by='thread'):
+        if by not in GROUP_BY:
+            msg = f'unknown grouping `{by}`, expected one of: {", ".join(GROUP_BY)}.'
+            raise ValueError(msg)
+
+        groups = {}
+        for i in self.roots:
+            call = self.calls[i]
+            if by == 'process':
+                pid = self.get_process(call)
+                label = f'pid {pid}' if pid is not None else 'process'
+            elif by == 'task' and call.task is not None:
+                label = call.task
+            else:
+                label = self.get_thread_name(call.thread)
+            ids = groups.get(label)
+            if ids is None:
+                ids = groups[label] = []
+            ids.append(i)
+        return groups
+
+    def _find_call(self, stack, frame):
+        for idx in range(len(stack) - 1, -1, -1):
+            if stack[idx][0] is frame:
+                return idx
+        return None
+
+    # returns whether the call is captured in full, i.e. whether its lines are of any interest.
     def on_call(self, frame):
-        name = _get_frame_qual_name(self.root, frame)
-        args = _get_frame_args(frame)
-        call_timestamp = time()
-        caller_call = self._get_caller_call(frame)
+        info = self.cache.get(frame.f_code)
+        if info.suspendable:
+            call = self._suspended.pop(frame, None)
+            if call is not None:
+                self._on_resume(frame, call)
+                return call._focus is not None
+
+        thread = self._get_state()
+        stack = thread.stack
+        task = _get_current_task_name()
+        # the closest traced caller, untraced frames in between are skipped.
+        # calls of a task start a tree of their own instead of nesting under the frame running the event loop.
+        caller = None
+        if stack and stack[-1][1].task == task:
+            caller = stack[-1][1]
+        parent = caller.id if caller is not None else None
+        tail = self.tail
+        focus = 0
+        if self.focus is not None:
+            focus = self.focus.get_level(info.name, caller._focus if caller is not None else None)
+        if focus is None:
+            args, state = {}, None
+        else:
+            args, state = self.capture.capture_args(f_locals=frame.f_locals, names=info.arg_names)
+        call_timestamp = perf_counter_ns() + self._epoch
         call = Call(
-            frame=frame,
-            name=name,
+            id=next(self._ids) if tail is None else None,
+            info=info,
+            name=info.name,
+            parent=parent,
             args=args,
             call_timestamp=call_timestamp,
-            caller=caller_call
+            thread=thread.id,
+            task=task,
+            _capture_state=state
         )
-        self.add_call(call)
-
-    def on_line(self, frame):
-        locals_ = _get_frame_locals(frame)
-        num = frame.f_lineno
-        with open(frame.f_code.co_filename, 'r') as f:
-            lines = f.readlines()
-            src = lines[num - 1] if lines else ''
-
-        ln = Line(frame=frame, num=num, src=src, locals=locals_)
-        call = self.get_call_by_frame(frame)
-        call.add_line(ln)
+        call._focus = focus
+        if info.suspendable:
+            call.segments = [call_timestamp]
+        if tail is not None:
+            call._caller = caller
+        elif self.keep:
+            thread.calls.append(call)
+        stack.append((frame, call))
+        if self.sink is not None:
+            self.sink.on_call(call)
+        return focus is not None
+
+    # a resumed generator or coroutine continues its call, wherever and by whomever it's resumed.
+    def _on_resume(self, frame, call):
+        call.segments.append(perf_counter_ns() + self._epoch)
+        self._get_state().stack.append((frame, call))
+        if self.sink is not None:
+            self.sink.on_resume(call)
+
+    # frames already running when tracing started have no call, their returns are ignored.
+    def _pop_call(self, frame):
+        stack = self._get_state().stack
+        idx = self._find_call(stack, frame)
+        if idx is None:
+            return None
+
+        call = stack[idx][1]
+        # the live frames are dropped along with their call.
+        del stack[idx:]
+        return call
 
-    def on_return(self, frame, retval):
-        call = self.get_call_by_frame(frame)
+    # the call ends with each suspension until resumed again,
+    # so that generators which are never exhausted still get a sensible runtime.
+    def on_yield(self, frame, value):
+        call = self._pop_call(frame)
         if call is None:
-            msg = f'got return `{frame}` of untraced frame.'
-            raise Exception(msg)
-
-        call.locals = _get_frame_locals(frame)
-        call.ret_timestamp = time()
-        call.retval = copy(retval)
+            return
+        ts = perf_counter_ns() + self._epoch
+        call._end_line(ts)
+        call.segments.append(ts)
+        call.ret_timestamp = ts
+        if call.info.generator and call._focus is not None:
+            if call.yields is None:
+                call.yields = []
+            value = self.capture.capture(value)
+            call.yields.append(value)
+        else:
+            value = None
+        suspended = self._suspended
+        suspended[frame] = call
+        if len(suspended) >= self._sweep_at:
+            self._sweep_suspended()
+        if self.sink is not None:
+            self.sink.on_yield(call, value)
+
+    def _sweep_suspended(self):
+        suspended = self._suspended
+        for frame in _get_abandoned(suspended):
+            self._release(suspended.pop(frame))
+        self._sweep_at = max(_SWEEP_AT, 2 * len(suspended))
+
+    # calls still suspended when tracing stops end at their last yield, their frames aren't kept any longer.
+    def release_suspended(self):
+        for call in self._suspended.values():
+            self._release(call)
+        self._suspended.clear()
+        self._sweep_at = _SWEEP_AT
+
+    # the suspended call is never going to be resumed or return.
+    def _release(self, call):
+        call._capture_state = None
+        if self.sink is not None:
+            self.sink.on_release(call)
 
-    def create_tree_data(self):
-
-        def insert_level(cache, accum, name):
-            leaves = cache[name]
-            if not leaves:
-                accum[name] = {}
+    def on_line(self, frame):
+        ts = perf_counter_ns() + self._epoch
+        stack = self._get_state().stack
+        if stack and stack[-1][0] is frame:
+            call = stack[-1][1]
+        else:
+            idx = self._find_call(stack, frame)
+            if idx is None:
                 return
+            call = stack[idx][1]
+        # lines of calls out of focus are only reported by backends which can't turn them off per frame.
+        if call._focus is None:
+            return
 
-            accum[name] = {}
-            accum = accum[name]
-            for sub_name in leaves:
-                insert_level(cache=cache, accum=accum, name=sub_name)
-
-        cache = defaultdict(list)
-        for c in self.calls:
-            cache[c.caller.uname].append(c.uname)
-
-        if not cache:
-            return {}
-
-        accum = {}
-        keys = list(cache.keys())
-        root = keys[0]
-        for name in keys:
-            insert_level(cache=cache, accum=accum, name=name)
-        data = accum[root]
-        return data
-
-
-def trace(func):
-    path = func.__code__.co_filename
-    root = _get_root_path(path)
-    run = Run(root=root)
+        call._end_line(ts)
+        call._line_timestamp = ts
+        num = frame.f_lineno
+        delta = self.capture.capture_delta(f_locals=frame.f_locals, state=call._capture_state)
+        lines = call.info.lines
+        src = lines[num - 1] if num <= len(lines) else ''
+        line = Line(num=num, src=src, delta=delta)
+        if self.keep:
+            call.add_line(line)
+        if self.sink is not None:
+            self.sink.on_line(call, line)
+
+    # the call ends by raising `exception`, generators closed by `GeneratorExit` just return.
+    def on_unwind(self, frame, exception):
+        stack = self._get_state().stack
+        idx = self._find_call(stack, frame)
+        if idx is not None and not isinstance(exception, GeneratorExit):
+            stack[idx][1].exception = self.capture._to_repr(exception)
+        self.on_return(frame, None)
 
-    def tracer(frame, event, arg):
-        if _recognize_frame(root, frame):
-            if event == 'call':
-                run.on_call(frame)
-            elif event == 'line':
-                run.on_line(frame)
-            elif event == 'return':
-                run.on_return(frame=frame, retval=copy(arg))
+    def on_return(self, frame, retval):
+        call = self._pop_call(frame)
+        if call is None:
+            return
+        if call._focus is not None:
+            call.ret_delta = self.capture.capture_delta(f_locals=frame.f_locals, state=call._capture_state)
+        call.ret_timestamp = perf_counter_ns() + self._epoch
+        call._end_line(call.ret_timestamp)
+        if call.segments is not None:
+            call.segments.append(call.ret_timestamp)
+        if call._focus is not None:
+            call.retval = self.capture.capture(retval)
+        call._capture_state = None
+        if self.sink is not None:
+            self.sink.on_return(call)
+        # calls kept as callers of kept calls already have their ids.
+        if self.tail is not None and call.id is None:
+            if self.tail.accepts(call):
+                self._keep(call)
+            else:
+                self.tail.drop(call)
+
+    # gives ids to the call and to its callers which haven't been kept yet, callers first.
+    def _keep(self, call):
+        chain = []
+        while call is not None and call.id is None:
+            chain.append(call)
+            call = call._caller
+        calls = self._get_state().calls
+        for call in reversed(chain):
+            call.id = next(self._ids)
+            call.parent = call._caller.id if call._caller is not None else None
+            call._caller = None
+            if self.keep:
+                calls.append(call)
+        self.tail.kept += len(chain)
+
+
+# `trace` records every call and line, `sample` takes periodic snapshots of stacks instead.
+MODES = ('trace', 'sample')
+
+# whether a traced function is running on the thread, traced functions it calls are then part of its run.
+_running = local()
+
+
+def trace(
+    func=None,
+    *,
+    roots=None,
+    include=None,
+    exclude=None,
+    focus=None,
+    focus_depth=None,
+    backend='auto',
+    mode='trace',
+    interval=0.001,
+    capture=None,
+    output=None,
+    record=None,
+    collector=None,
+    children=False,
+    tail=None,
+    compensate=True,
+    gui=True
+):
+    if func is None:
+        return partial(
+            trace,
+            roots=roots,
+            include=include,
+            exclude=exclude,
+            focus=focus,
+            focus_depth=focus_depth,
+            backend=backend,
+            mode=mode,
+            interval=interval,
+            capture=capture,
+            output=output,
+            record=record,
+            collector=collector,
+            children=children,
+            tail=tail,
+            compensate=compensate,
+            gui=gui
+        )
 
-        return tracer
+    # roots of an already traced function are the ones of the function it wraps.
+    if roots is None:
+        path = inspect.unwrap(func).__code__.co_filename
+        roots = [_get_root_path(path)]
+    code_filter = CodeFilter(roots=roots, include=include, exclude=exclude)
+    # qualified names are given relative to the common root of all the traced roots.
+    root = _get_common_root(roots)
+    if mode not in MODES:
+        msg = f'unknown mode `{mode}`, expected one of: {", ".join(MODES)}.'
+        raise ValueError(msg)
+    if collector is not None and (mode != 'trace' or record is not None):
+        msg = '`collector` only works in `trace` mode and without `record`.'
+        raise ValueError(msg)
+    if children and (mode != 'trace' or output is None or record is not None or collector is not None):
+        msg = '`children` only works in `trace` mode with `output` and without `record` or `collector`.'
+        raise ValueError(msg)
+    # with `tail` calls are decided on once they return, so only kept calls ever get ids and nothing can be streamed.
+    if tail is not None and (mode != 'trace' or output is not None or record is not None or collector is not None):
+        msg = '`tail` only works in `trace` mode and without `output`, `record` or `collector`.'
+        raise ValueError(msg)
+
+    # with `output` the run is streamed to disk instead of being kept in memory and shown.
+    # with `compensate` the cost of an event is measured before the first traced call,
+    # samples are taken off the traced threads so they have nothing to compensate.
+    overhead = None if compensate and mode == 'trace' and collector is None else 0
+    # with `focus` only the matching functions and calls up to `focus_depth` levels below them get lines and values.
+    focus = FocusFilter(focus, depth=focus_depth) if focus else None
+    run = Run(
+        root=root,
+        capture=capture,
+        keep=output is None and record is None,
+        overhead=overhead,
+        focus=focus,
+        tail=tail
+    )
+    # with `record` only the last `record` events are kept and dumped to `output` on demand,
+    # on unhandled exceptions and on SIGUSR1 where there's one.
+    recorder = None
+    if record is not None:
+        from .recorder import FlightRecorder
+        recorder = run.sink = FlightRecorder(capacity=record, path=output, meta={'root': root.as_posix()})
+        # signal handlers can only be set from the main thread.
+        signum = getattr(signal, 'SIGUSR1', None)
+        recorder.install(signum=signum if current_thread() is main_thread() else None)
+    # with `collector` events are only packed into fixed-size records and sent to a collector process,
+    # which names the calls and writes them to a trace file. only calls and lines get timed, values aren't captured.
+    # `True` starts a collector writing to `output`, a path of a unix socket connects to `python -m tracer collect`,
+    # a `collector.CollectorClient` is used as is.
+    backend_name = backend
+    if mode == 'sample':
+        from .sampling import SamplingBackend
+        backend = SamplingBackend(run=run, code_filter=code_filter, interval=interval)
+    elif collector is None:
+        backend = create_backend(name=backend, run=run, code_filter=code_filter)
+
+    # with `children` processes started by the traced call trace themselves into files next to `output`,
+    # named after their pids and tagged with the same `trace` id, `children.load` merges them into one run.
+    trace_id = None
+    if children:
+        import uuid
+        trace_id = uuid.uuid4().hex
+
+    def _open_sink():
+        from .storage import TraceWriter
+        meta = {'root': root.as_posix(), 'overhead': run.overhead}
+        if trace_id is not None:
+            meta['trace'] = trace_id
+        run.sink = TraceWriter(output, meta=meta)
+        atexit.register(run.sink.close)
+
+    def _activate_children():
+        from .children import activate
+        config = {
+            'roots': [os.path.abspath(r) for r in roots],
+            'include': include,
+            'exclude': exclude,
+            'focus': list(focus.patterns) if focus is not None else None,
+            'focus_depth': focus_depth,
+            'backend': backend.name,
+            'capture': run.capture.mode,
+            'max_len': run.capture.max_len,
+            'output': os.path.abspath(output),
+            'root': root.as_posix(),
+            'overhead': run.overhead,
+            'trace': trace_id,
+            'pid': os.getpid(),
+        }
+        activate(run, backend, config)
+
+    def _open_collector():
+        nonlocal backend
+        from .collector import connect
+        client = wrapper.collector = connect(collector, output=output, meta={'root': root.as_posix()})
+        backend = create_backend(name=backend_name, run=client, code_filter=code_filter)
+        atexit.register(client.close)
 
     @wraps(func)
     def wrapper(*args, **kwargs):
-        sys.settrace(tracer)
-        rv = func(*args, **kwargs)
-        sys.settrace(None)
-        app = TracerApp(run)
-        app.exec()
+        if getattr(_running, 'value', False):
+            return func(*args, **kwargs)
+
+        if run.overhead is None:
+            from .profiling import calibrate
+            run.overhead = calibrate(backend=backend.name, capture=run.capture.mode)
+        if recorder is not None:
+            recorder.meta['overhead'] = run.overhead
+        if collector is not None and wrapper.collector is None:
+            _open_collector()
+        elif output is not None and run.sink is None:
+            _open_sink()
+
+        if children:
+            _activate_children()
+        _running.value = True
+        backend.start()
+        try:
+            rv = func(*args, **kwargs)
+        finally:
+            backend.stop()
+            _running.value = False
+            if children:
+                from .children import deactivate
+                deactivate()
+
+        if wrapper.collector is not None:
+            wrapper.collector.flush()
+        elif run.sink is not None:
+            run.sink.flush()
+        elif gui:
+            # the viewer is an optional extra, qt is only imported once there's a run to show.
+            # without it the call's result and the run are still there, only nothing is shown.
+            try:
+                from .gui import TracerApp
+            except ImportError as e:
+                warnings.warn(f'{e} the run is left in `.run`, pass `gui=False` not to show it.', stacklevel=2)
+            else:
+                app = TracerApp(run)
+                app.exec()
         return rv
 
+    # the run stays accessible after the traced calls, i.e. for headless querying.
+    wrapper.run = run
+    wrapper.recorder = recorder
+    wrapper.collector = None
     return wrapper
@@ -0,0 +1,262 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any
+
+from .core import Run
+from .profiling import get_call_times
+
+STATUSES = ('common', 'added', 'removed')
+SORT_KEYS = ('time_delta', 'calls_delta')
+# default reprs of objects differ between any two runs by their addresses alone.
+ADDRESS_REGEXP = re.compile(r' at 0x[0-9a-fA-F]+')
+
+
+# node of the call trees of both runs merged on paths of qualified names, as drawn by flame graphs.
+@dataclass
+class DiffNode:
+    id: Any = None
+    name: Any = None
+    parent: Any = field(default=None, repr=False)
+    # ids of calls on this path in the runs before and after, in order of their calls.
+    before_ids: Any = field(default_factory=list, repr=False)
+    after_ids: Any = field(default_factory=list, repr=False)
+    # inclusive ns summed over the calls.
+    before_time: Any = 0
+    after_time: Any = 0
+    # name -> `DiffNode`.
+    children: Any = field(default_factory=dict, repr=False)
+
+    @property
+    def before_calls(self):
+        return len(self.before_ids)
+
+    @property
+    def after_calls(self):
+        return len(self.after_ids)
+
+    @property
+    def status(self):
+        if not self.before_ids:
+            return 'added'
+        if not self.after_ids:
+            return 'removed'
+        return 'common'
+
+    @property
+    def calls_delta(self):
+        return self.after_calls - self.before_calls
+
+    # in seconds.
+    @property
+    def time_delta(self):
+        return (self.after_time - self.before_time) / 1e9
+
+    # names from the top most caller down to this node.
+    @property
+    def path(self):
+        names = []
+        node = self
+        while node.parent is not None:
+            names.append(node.name)
+            node = node.parent
+        return tuple(reversed(names))
+
+
+# argument or return value differing between the calls at the same position of a path.
+@dataclass
+class ValueDiff:
+    node: Any = None
+    before: Any = None
+    after: Any = None
+    # name of the argument or `return`.
+    name: Any = None
+    before_value: Any = None
+    after_value: Any = None
+
+
+# values of live runs are compared the way trace files store them.
+def _normalize(value):
+    if not isinstance(value, str):
+        try:
+            value = repr(value)
+        except Exception:
+            return f'<unrepresentable {type(value).__name__}>'
+    return ADDRESS_REGEXP.sub(' at 0x', value)
+
+
+# two runs, live or paths of trace files, aligned in a single pass over the calls of each.
+# runs loaded from paths are closed along with the diff, i.e. with `with diff(before, after) as d:`.
+class RunDiff:
+
+    def __init__(self, before, after):
+        self._loaded = []
+        try:
+            self.before = self._load(before)
+            self.after = self._load(after)
+            self.root = DiffNode(id=0, name='all')
+            self.nodes = [self.root]
+            self._add(self.before, after=False)
+            self._add(self.after, after=True)
+        except BaseException:
+            self.close()
+            raise
+
+    def __len__(self):
+        return len(self.nodes) - 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _load(self, run):
+        if isinstance(run, Run):
+            return run
+        from .children import load
+        run = load(run)
+        self._loaded.append(run)
+        return run
+
+    def close(self):
+        for run in self._loaded:
+            run.close()
+        self._loaded.clear()
+
+    def __getitem__(self, path):
+        node = self.find(path)
+        if node is None:
+            raise KeyError(path)
+        return node
+
+    def _add(self, run, after):
+        inclusive, _ = get_call_times(run)
+        nodes = [None] * len(run.calls)
+        # callers always come before their calls in ids order.
+        for call in run.calls:
+            parent = nodes[call.parent] if call.parent is not None else self.root
+            node = parent.children.get(call.name)
+            if node is None:
+                node = parent.children[call.name] = DiffNode(id=len(self.nodes), name=call.name, parent=parent)
+                self.nodes.append(node)
+            if after:
+                node.after_ids.append(call.id)
+                node.after_time += inclusive[call.id]
+            else:
+                node.before_ids.append(call.id)
+                node.before_time += inclusive[call.id]
+            nodes[call.id] = node
+        if after:
+            self.root.after_time = sum(ch.after_time for ch in self.root.children.values())
+        else:
+            self.root.before_time = sum(ch.before_time for ch in self.root.children.values())
+
+    # `path` is a sequence of qualified names from the top most caller.
+    def find(self, path):
+        node = self.root
+        for name in path:
+            node = node.children.get(name)
+            if node is None:
+                return None
+        return node
+
+    # pre-order walk yielding `(depth, node)`.
+    def walk(self, node=None):
+        node = node if node is not None else self.root
+        stack = [(0, ch) for ch in reversed(list(node.children.values()))]
+        while stack:
+            depth, node = stack.pop()
+            yield depth, node
+            stack.extend((depth + 1, ch) for ch in reversed(list(node.children.values())))
+
+    def _sorted(self, nodes, key):
+        if key not in SORT_KEYS:
+            msg = f'unknown sort key `{key}`, expected one of: {", ".join(SORT_KEYS)}.'
+            raise ValueError(msg)
+        return sorted(nodes, key=lambda n: abs(getattr(n, key)), reverse=True)
+
+    # queries go over the nodes in the order they were created, i.e. callers before their calls.
+    def _iter_nodes(self):
+        return iter(self.nodes[1:])
+
+    # only the top most of added or removed subtrees.
+    def added(self):
+        root = self.root
+        return [n for n in self._iter_nodes() if not n.before_ids and (n.parent is root or n.parent.before_ids)]
+
+    def removed(self):
+        root = self.root
+        return [n for n in self._iter_nodes() if not n.after_ids and (n.parent is root or n.parent.after_ids)]
+
+    # paths called in both runs whose number of calls differs.
+    def count_changed(self):
+        nodes = [n for n in self._iter_nodes() if n.status == 'common' and n.calls_delta]
+        return self._sorted(nodes, key='calls_delta')
+
+    # paths whose inclusive time grew by more than `seconds` and, with `ratio`, by more than that many times.
+    def slower_than(self, seconds=0.0, ratio=None):
+        nodes = []
+        for n in self._iter_nodes():
+            if n.time_delta <= seconds:
+                continue
+            if ratio is not None and n.before_time and n.after_time / n.before_time <= ratio:
+                continue
+            nodes.append(n)
+        return self._sorted(nodes, key='time_delta')
+
+    def faster_than(self, seconds=0.0):
+        return self._sorted([n for n in self._iter_nodes() if -n.time_delta > seconds], key='time_delta')
+
+    # calls at the same position of the same path are compared, i.e. the 3rd call of `a > b` in both runs.
+    def value_diffs(self, nodes=None, limit=None):
+        diffs = []
+        nodes = nodes if nodes is not None else self._iter_nodes()
+        for node in nodes:
+            for before_id, after_id in zip(node.before_ids, node.after_ids):
+                before = self.before.get_call(before_id)
+                after = self.after.get_call(after_id)
+                before_args = before.args or {}
+                after_args = after.args or {}
+                pairs = [(name, before_args.get(name), after_args.get(name)) for name in {**before_args, **after_args}]
+                pairs.append(('return', before.retval, after.retval))
+                for name, before_value, after_value in pairs:
+                    before_value = _normalize(before_value)
+                    after_value = _normalize(after_value)
+                    if before_value != after_value:
+                        diffs.append(ValueDiff(node, before, after, name, before_value, after_value))
+                        if limit is not None and len(diffs) >= limit:
+                            return diffs
+        return diffs
+
+    def summary(self):
+        root = self.root
+        return '\n'.join([
+            f'calls: {len(self.before)} -> {len(self.after)}',
+            f'time: {root.before_time / 1e9:.6f}s -> {root.after_time / 1e9:.6f}s ({root.time_delta:+.6f}s)',
+            f'paths: {len(self)}, added: {len(self.added())}, removed: {len(self.removed())}',
+        ])
+
+    # summary and the top `n` paths of each kind of change.
+    def report(self, n=10):
+        lines = [self.summary()]
+        sections = [
+            ('slower', self.slower_than()[:n]),
+            ('faster', self.faster_than()[:n]),
+            ('added', self.added()[:n]),
+            ('removed', self.removed()[:n]),
+            ('call counts', self.count_changed()[:n]),
+        ]
+        for title, nodes in sections:
+            if not nodes:
+                continue
+            lines.append(f'{title}:')
+            for node in nodes:
+                lines.append(
+                    f'  {" > ".join(node.path)}  calls {node.before_calls} -> {node.after_calls}, '
+                    f'time {node.time_delta:+.6f}s'
+                )
+        return '\n'.join(lines)
+
+
+def diff(before, after):
+    return RunDiff(before, after)
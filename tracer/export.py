@@ -0,0 +1,164 @@
+import json
+
+from .profiling import get_flame_tree
+
+# exporters write to the file as they go instead of building whole documents in memory.
+FORMATS = ('folded', 'speedscope', 'chrome')
+SUFFIXES = {
+    'folded': '.folded',
+    'speedscope': '.speedscope.json',
+    'chrome': '.trace.json',
+}
+
+
+# every line holds the whole stack, so stacks deeper than `max_depth` are cut off
+# with their time given to the last kept frame, to keep deep recursion from growing the file quadratically.
+# times only take timestamps and numbers of lines of calls, so calls of trace files never get decoded.
+def write_folded(run, f, max_depth=1000):
+    root = get_flame_tree(run)
+    path = []
+    stack = [(node, 0) for node in reversed(list(root.children.values()))]
+    while stack:
+        node, depth = stack.pop()
+        del path[depth:]
+        path.append(node.name)
+        cut = max_depth is not None and depth + 1 >= max_depth
+        value = round(node.value if cut else node.self_value)
+        if value:
+            f.write(f'{";".join(path)} {value}\n')
+        if not cut:
+            for child in reversed(list(node.children.values())):
+                stack.append((child, depth + 1))
+
+
+def _get_end(run):
+    end = 0
+    for call in run.calls:
+        ts = call.ret_timestamp if call.ret_timestamp is not None else call.call_timestamp
+        if ts is not None and ts > end:
+            end = ts
+    return end
+
+
+def _get_start(run):
+    return min((c.call_timestamp for c in run.calls if c.call_timestamp is not None), default=0)
+
+
+# opens and closes of the trees of `root_ids` as `(event, call id, ts)`, properly nested and in time order.
+# a call is clipped to its caller, i.e. a generator resumed after its caller returned.
+def _iter_nested(run, root_ids, end):
+    calls = run.calls
+    children = run.children
+    last = 0
+    for root_id in root_ids:
+        stack = [(root_id, end)]
+        while stack:
+            item, bound = stack.pop()
+            # closes are pushed as negative ids.
+            if item < 0:
+                last = max(last, bound)
+                yield 'C', -item - 1, last
+                continue
+
+            call = calls[item]
+            opened = max(call.call_timestamp, last)
+            closed = call.ret_timestamp if call.ret_timestamp is not None else end
+            closed = max(min(closed, bound), opened)
+            last = opened
+            yield 'O', item, opened
+            stack.append((-item - 1, closed))
+            for ch in reversed(children.get(item, ())):
+                stack.append((ch, closed))
+
+
+def write_speedscope(run, f, name='tracer'):
+    frames = {}
+    for call in run.calls:
+        info = call.info
+        key = (call.name, info.path, info.first_lineno)
+        if key not in frames:
+            frames[key] = len(frames)
+
+    start = _get_start(run)
+    end = _get_end(run)
+    f.write('{"$schema": "https://www.speedscope.app/file-format-schema.json", ')
+    f.write(f'"exporter": "tracer", "name": {json.dumps(name)}, "activeProfileIndex": 0, ')
+    f.write('"shared": {"frames": [')
+    for idx, (call_name, path, line) in enumerate(frames):
+        frame = {'name': call_name, 'file': path or '', 'line': line or 0}
+        f.write((', ' if idx else '') + json.dumps(frame))
+    f.write(']}, "profiles": [')
+
+    # evented profiles must nest, while calls of concurrent tasks of a thread overlap.
+    for idx, (label, root_ids) in enumerate(run.get_groups('task').items()):
+        f.write(', ' if idx else '')
+        f.write(f'{{"type": "evented", "name": {json.dumps(label)}, "unit": "nanoseconds", "events": [')
+        sep = ''
+        for event, call_id, ts in _iter_nested(run, root_ids, end):
+            info = run.calls[call_id].info
+            frame = frames[(run.calls[call_id].name, info.path, info.first_lineno)]
+            f.write(f'{sep}{{"type": "{event}", "frame": {frame}, "at": {ts - start}}}')
+            sep = ', '
+        f.write(f'], "startValue": 0, "endValue": {end - start}}}')
+    f.write(']}')
+
+
+def write_chrome(run, f, pid=1):
+    start = _get_start(run)
+    end = _get_end(run)
+    groups = list(run.get_groups('task').items())
+    # every call goes to the track of its tree's thread or task.
+    tids = [0] * len(run.calls)
+    for tid, (_, root_ids) in enumerate(groups):
+        for i in root_ids:
+            tids[i] = tid
+
+    f.write('{"displayTimeUnit": "ns", "traceEvents": [')
+    for tid, (label, _) in enumerate(groups):
+        meta = {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': label}}
+        f.write((', ' if tid else '') + json.dumps(meta))
+
+    sep = ', ' if groups else ''
+    for call in run.calls:
+        if call.parent is not None:
+            tids[call.id] = tids[call.parent]
+        if call.call_timestamp is None:
+            continue
+
+        ret_timestamp = call.ret_timestamp if call.ret_timestamp is not None else end
+        # suspended generators and coroutines are drawn as one slice per active segment.
+        segments = call.segments or (call.call_timestamp, ret_timestamp)
+        if len(segments) % 2:
+            segments = (*segments, ret_timestamp)
+        for seg_start, seg_end in zip(segments[::2], segments[1::2]):
+            event = {
+                'name': call.name,
+                'cat': 'call',
+                'ph': 'X',
+                'ts': (seg_start - start) / 1e3,
+                'dur': (seg_end - seg_start) / 1e3,
+                'pid': pid,
+                'tid': tids[call.id],
+                'args': {'id': call.id},
+            }
+            f.write(sep + json.dumps(event))
+            sep = ', '
+    f.write(']}')
+
+
+WRITERS = {
+    'folded': write_folded,
+    'speedscope': write_speedscope,
+    'chrome': write_chrome,
+}
+
+
+def export(run, path, format='speedscope'):
+    writer = WRITERS.get(format)
+    if writer is None:
+        msg = f'unknown export format `{format}`, expected one of: {", ".join(FORMATS)}.'
+        raise ValueError(msg)
+
+    with open(path, 'w', encoding='utf-8') as f:
+        writer(run, f)
+    return path
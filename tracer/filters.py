@@ -0,0 +1,94 @@
+import os
+import re
+import fnmatch
+from pathlib import Path
+
+
+def _normalize_root(root):
+    root = Path(os.path.abspath(root)).as_posix()
+    return root if root.endswith('/') else f'{root}/'
+
+
+# the tracer never traces itself, even if it happens to live under one of the roots.
+_TRACER_ROOT = _normalize_root(os.path.dirname(__file__))
+
+
+def _compile_patterns(patterns):
+    if not patterns:
+        return None
+    regexp = '|'.join(f'(?:{fnmatch.translate(p)})' for p in patterns)
+    return re.compile(regexp)
+
+
+class CodeFilter:
+
+    def __init__(self, roots, include=None, exclude=None):
+        self.roots = tuple(_normalize_root(r) for r in roots)
+        self.include = tuple(include or ())
+        self.exclude = tuple(exclude or ())
+        self._include_regexp = _compile_patterns(self.include)
+        self._exclude_regexp = _compile_patterns(self.exclude)
+        # verdicts are memoized per code object and per source file.
+        self._codes = {}
+        self._files = {}
+
+    def __len__(self):
+        return len(self._codes)
+
+    def _check_path(self, path):
+        path = Path(os.path.abspath(path)).as_posix()
+        if not path.startswith(self.roots) or path.startswith(_TRACER_ROOT):
+            return False
+        if self._include_regexp is not None and self._include_regexp.match(path) is None:
+            return False
+        if self._exclude_regexp is not None and self._exclude_regexp.match(path) is not None:
+            return False
+        return True
+
+    def _check_file(self, filename):
+        verdict = self._files.get(filename)
+        if verdict is None:
+            verdict = self._check_path(filename)
+            self._files[filename] = verdict
+        return verdict
+
+    def accepts(self, code):
+        try:
+            return self._codes[code]
+        except KeyError:
+            verdict = self._check_file(code.co_filename)
+            self._codes[code] = verdict
+            return verdict
+
+    def clear(self):
+        self._codes.clear()
+        self._files.clear()
+
+
+# qualified names of functions which get their lines and values captured,
+# every other accepted function only gets its call and return timed.
+# calls up to `depth` levels below a focus call are captured in full too, `None` means its whole subtree.
+class FocusFilter:
+
+    def __init__(self, patterns, depth=None):
+        self.patterns = tuple(patterns)
+        self.depth = depth
+        self._regexp = _compile_patterns(self.patterns)
+        self._names = {}
+
+    def matches(self, name):
+        try:
+            return self._names[name]
+        except KeyError:
+            verdict = self._regexp is not None and self._regexp.match(name) is not None
+            self._names[name] = verdict
+            return verdict
+
+    # levels below the closest focus call given the levels of the caller, `None` for calls out of focus.
+    def get_level(self, name, caller_level):
+        if self.matches(name):
+            return 0
+        if caller_level is None:
+            return None
+        level = caller_level + 1
+        return level if self.depth is None or level <= self.depth else None
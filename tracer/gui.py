@@ -1,8 +1,14 @@
 import sys
-import inspect
-from collections import deque
+import zlib
+from collections import deque, OrderedDict
 
-from PySide2 import QtCore, QtWidgets, QtGui
+try:
+    from PySide2 import QtCore, QtWidgets, QtGui
+except ImportError as e:
+    msg = 'the viewer requires PySide2, install it with `pip install tracer[gui]`.'
+    raise ImportError(msg) from e
+
+from .profiling import get_flame_tree
 
 
 class TreeWidget(QtWidgets.QTreeWidget):
@@ -25,34 +31,426 @@ class TreeWidget(QtWidgets.QTreeWidget):
                 q.append((ch_item, ch_leaves))
 
 
-class CallInfoWidget(QtWidgets.QTableWidget):
+# call tree over the parent -> children adjacency of a run.
+# children of a node are only loaded once it gets expanded, in batches of `batch_size`.
+# with `group_by` the root calls are put under a node per thread, asyncio task or process.
+# internal ids of nodes: `0` is the invisible root, odd ids are groups and even ids are calls.
+class CallTreeModel(QtCore.QAbstractItemModel):
 
-    def __init__(self, call, parent=None):
+    def __init__(self, run, parent=None, batch_size=1000, group_by=None):
+        super().__init__(parent)
+        self.run = run
+        self.batch_size = batch_size
+        self.group_by = group_by
+        self._groups = list(run.get_groups(group_by).items()) if group_by is not None else None
+        # root call id -> group node.
+        self._root_groups = {}
+        for k, (_, ids) in enumerate(self._groups or ()):
+            for i in ids:
+                self._root_groups[i] = k * 2 + 1
+        # number of loaded children per node.
+        self._fetched = {}
+        # row of each loaded node under its parent.
+        self._rows = {}
+
+    def _get_children(self, node):
+        if node == 0:
+            return self.run.roots if self._groups is None else self._groups
+        if node & 1:
+            return self._groups[node // 2][1]
+        return self.run.get_children(node // 2 - 1)
+
+    def _get_child_node(self, node, row):
+        if node == 0 and self._groups is not None:
+            return row * 2 + 1
+        return (self._get_children(node)[row] + 1) * 2
+
+    def _get_parent_node(self, node):
+        if node & 1:
+            return 0
+        call = self.run.get_call(node // 2 - 1)
+        if call.parent is None:
+            return self._root_groups.get(call.id, 0)
+        return (call.parent + 1) * 2
+
+    def _get_node(self, index):
+        return index.internalId() if index.isValid() else 0
+
+    def get_call_id(self, index):
+        node = self._get_node(index)
+        if node == 0 or node & 1:
+            return None
+        return node // 2 - 1
+
+    def get_call(self, index):
+        call_id = self.get_call_id(index)
+        return self.run.get_call(call_id) if call_id is not None else None
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        node = self._get_node(parent)
+        if not 0 <= row < self._fetched.get(node, 0) or column != 0:
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column, self._get_child_node(node, row))
+
+    def parent(self, index):
+        node = self._get_node(index)
+        if node == 0:
+            return QtCore.QModelIndex()
+        parent_node = self._get_parent_node(node)
+        if parent_node == 0:
+            return QtCore.QModelIndex()
+        return self.createIndex(self._rows[parent_node], 0, parent_node)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return self._fetched.get(self._get_node(parent), 0)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        return len(self._get_children(self._get_node(parent))) > 0
+
+    def canFetchMore(self, parent):
+        node = self._get_node(parent)
+        return self._fetched.get(node, 0) < len(self._get_children(node))
+
+    def fetchMore(self, parent):
+        node = self._get_node(parent)
+        count = len(self._get_children(node))
+        start = self._fetched.get(node, 0)
+        end = min(start + self.batch_size, count)
+        if start >= end:
+            return
+
+        self.beginInsertRows(parent, start, end - 1)
+        for row in range(start, end):
+            self._rows[self._get_child_node(node, row)] = row
+        self._fetched[node] = end
+        self.endInsertRows()
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        node = self._get_node(index)
+        if node & 1:
+            label, ids = self._groups[node // 2]
+            return f'{label} ({len(ids)})'
+        call = self.get_call(index)
+        if call is None:
+            return None
+        # calls made in another process than their caller's, i.e. the work of a pool's worker.
+        pid = self.run.get_process(call)
+        if pid is not None and pid != self.run.get_process(self.run.get_caller(call) or call):
+            return f'[pid {pid}] {call.uname}'
+        return call.uname
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return 'calls' if self.group_by is None else f'calls by {self.group_by}'
+        return None
+
+
+# per function aggregates of `profiling.Profile`, sorted by clicking on the header.
+class ProfileTableModel(QtCore.QAbstractTableModel):
+    COLUMNS = ('name', 'calls', 'inclusive', 'exclusive', 'per_call', 'lines')
+
+    def __init__(self, profile, parent=None):
+        super().__init__(parent)
+        self.profile = profile
+        self._rows = profile.sorted(key='exclusive')
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def _get_value(self, stats, column):
+        key = self.COLUMNS[column]
+        if key == 'lines':
+            return len(stats.line_hits)
+        return getattr(stats, key)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole or not index.isValid():
+            return None
+        value = self._get_value(self._rows[index.row()], index.column())
+        return f'{value:.6f}' if isinstance(value, float) else str(value)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return self.COLUMNS[section]
+        return None
+
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        self.layoutAboutToBeChanged.emit()
+        self._rows.sort(key=lambda st: self._get_value(st, column), reverse=order == QtCore.Qt.DescendingOrder)
+        self.layoutChanged.emit()
+
+    def get_stats(self, index):
+        return self._rows[index.row()] if index.isValid() else None
+
+
+# icicle of `profiling.FlameNode`s: callers on top, widths proportional to inclusive time.
+# clicking a node zooms into it, double clicking zooms back out to the whole run.
+class FlameGraphWidget(QtWidgets.QWidget):
+    ROW_HEIGHT = 18
+    MIN_WIDTH = 1.0
+    # rows below the active node, deeper recursion is only reachable by zooming in.
+    MAX_DEPTH = 256
+
+    def __init__(self, root, parent=None):
         super().__init__(parent=parent)
-        self.call = call
-        self._table_content = self._get_table_content(call)
+        self.root = root
+        self.active = root
+        # `(rect, node)` of the nodes drawn last, for hit testing.
+        self._rects = []
+        self.setMouseTracking(True)
+        self.setMinimumHeight(self.ROW_HEIGHT * 4)
+
+    # stable across sessions unlike `hash` of strings.
+    def _get_color(self, name):
+        h = zlib.crc32(name.encode('utf-8'))
+        return QtGui.QColor(200 + h % 55, 80 + (h >> 8) % 120, 40 + (h >> 16) % 40)
+
+    def _layout(self):
+        rects = []
+        width = self.width()
+        if not self.active.value:
+            return rects
+        scale = width / self.active.value
+        stack = [(self.active, 0.0, 0)]
+        while stack:
+            node, x, depth = stack.pop()
+            w = node.value * scale
+            if w < self.MIN_WIDTH or depth >= self.MAX_DEPTH:
+                continue
+            rects.append((QtCore.QRectF(x, depth * self.ROW_HEIGHT, max(w - 1, 1), self.ROW_HEIGHT - 1), node))
+            for child in node.children.values():
+                stack.append((child, x, depth + 1))
+                x += child.value * scale
+        return rects
+
+    def paintEvent(self, event):
+        self._rects = self._layout()
+        painter = QtGui.QPainter(self)
+        for rect, node in self._rects:
+            painter.fillRect(rect, self._get_color(node.name))
+            if rect.width() > 30:
+                painter.setPen(QtGui.QColor(0, 0, 0))
+                text = painter.fontMetrics().elidedText(node.name, QtCore.Qt.ElideRight, int(rect.width()) - 4)
+                painter.drawText(rect.adjusted(2, 0, -2, 0), QtCore.Qt.AlignVCenter, text)
+        painter.end()
+        depth = max((int(rect.y()) // self.ROW_HEIGHT for rect, _ in self._rects), default=0)
+        self.setMinimumHeight((depth + 2) * self.ROW_HEIGHT)
+
+    def get_node(self, pos):
+        for rect, node in self._rects:
+            if rect.contains(pos):
+                return node
+        return None
+
+    def mouseMoveEvent(self, event):
+        node = self.get_node(QtCore.QPointF(event.pos()))
+        if node is not None:
+            share = node.value / self.root.value * 100 if self.root.value else 0
+            text = f'{node.name}\n{node.value / 1e9:.6f}s ({share:.1f}%), {node.calls} calls'
+            QtWidgets.QToolTip.showText(event.globalPos(), text, self)
+        else:
+            QtWidgets.QToolTip.hideText()
+
+    def mousePressEvent(self, event):
+        node = self.get_node(QtCore.QPointF(event.pos()))
+        if node is not None and node is not self.active:
+            self.active = node
+            self.update()
+
+    def mouseDoubleClickEvent(self, event):
+        self.active = self.root
+        self.update()
+
+
+class _TaskSignals(QtCore.QObject):
+    done = QtCore.Signal(object, object)
+
+
+# runs `fn(*args)` on a thread of a pool, errors are handed over as results.
+class _Task(QtCore.QRunnable):
+
+    def __init__(self, key, fn, args):
+        super().__init__()
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.signals = _TaskSignals()
+        # kept alive by the loader until its result is delivered.
+        self.setAutoDelete(False)
+
+    def run(self):
+        try:
+            result = self.fn(*self.args)
+        except Exception as e:
+            result = e
+        self.signals.done.emit(self, result)
+
+
+# prepares content of widgets on a thread pool so that the gui never waits for reprs of big values or sources.
+# results are cached by key, i.e. per call and line, the `cache_size` most recently used ones.
+# callbacks get called on the gui thread, right away for cached results.
+class BackgroundLoader(QtCore.QObject):
+
+    def __init__(self, parent=None, cache_size=256, pool=None):
+        super().__init__(parent=parent)
+        self.cache_size = cache_size
+        self.pool = pool or QtCore.QThreadPool.globalInstance()
+        self._cache = OrderedDict()
+        # key -> `(task, callbacks)` of tasks still running.
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._cache)
+
+    def load(self, key, fn, args, callback):
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            callback(self._cache[key])
+            return
+        if key in self._pending:
+            self._pending[key][1].append(callback)
+            return
+        task = _Task(key, fn, args)
+        task.signals.done.connect(self._on_done)
+        self._pending[key] = (task, [callback])
+        self.pool.start(task)
+
+    @QtCore.Slot(object, object)
+    def _on_done(self, task, result):
+        # tasks started before a `clear` are dropped.
+        pending = self._pending.get(task.key)
+        if pending is None or pending[0] is not task:
+            return
+        del self._pending[task.key]
+        if not isinstance(result, Exception):
+            self._cache[task.key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        for callback in pending[1]:
+            callback(result)
+
+    def clear(self):
+        self._cache.clear()
+        self._pending.clear()
+
+    # tasks might still be reading the run, i.e. lazy calls of a trace file which is about to be closed.
+    def wait(self):
+        self.pool.waitForDone()
+
+
+# longer values are cut, a tree item of megabytes of text is as slow to draw as to format.
+MAX_VALUE_LEN = 10000
+
+
+def _format_value(value):
+    try:
+        text = str(value)
+    except Exception as e:
+        text = f'<str failed: {type(e).__name__}: {e}>'
+    if len(text) > MAX_VALUE_LEN:
+        text = f'{text[:MAX_VALUE_LEN]}... ({len(text)} chars)'
+    return f'value: {text}\ntype: {type(value)}'
+
+
+def _get_call_info(call, caller):
+    content = [
+        ['name', call.uname],
+        ['caller', caller.uname if caller is not None else ''],
+        ['runtime', str(call.runtime)],
+        ['call_time', str(call.calltime)],
+        ['return_time', str(call.rettime)],
+    ]
+    if call.exception is not None:
+        content.append(['exception', call.exception])
+    if call.segments is not None:
+        content.extend([
+            ['active_runtime', str(call.active_runtime)],
+            ['segments', str(len(call.segments) // 2)],
+            ['yields', str(len(call.yields or ()))],
+        ])
+    return content
+
+
+# text of the source with its gutter, from local zero-started nums to real src file nums,
+# and block num -> time of the line relative to the hottest line.
+def _get_source(call, stats, overhead):
+    ln_offset = call.info.first_lineno
+    src = call.info.get_source()
+    lns = src.split('\n')
+    line_times = call.get_line_times(overhead=overhead)
+    func_times = stats.line_times if stats is not None else None
+    max_time = max((t for _, t in line_times.values()), default=0)
+
+    rows = []
+    heats = {}
+    gutter = ''
+    for i, ln in enumerate(lns):
+        num = i + ln_offset
+        hits, time = line_times.get(num, (0, 0))
+        gutter = f'{num:>5} {hits or "":>6} {_format_ns(time) if hits else "":>9}'
+        if func_times is not None:
+            func_time = func_times.get(num)
+            gutter += f' {_format_ns(func_time * 1e9) if func_time is not None else "":>9}'
+        rows.append(f'{gutter} | {ln}')
+        if max_time and time:
+            heats[i] = time / max_time
+    line_num_map = {i: i + ln_offset for i in range(len(lns))}
+    return '\n'.join(rows), line_num_map, heats, len(gutter)
+
+
+def _get_call_content(call, caller, stats, overhead):
+    return _get_call_info(call, caller), _get_source(call, stats, overhead)
+
+
+# `(tab name, tree data)` of values of a call, with locals as of `line_num` when given.
+def _get_vars(call, line_num):
+    vars_names = ['locals', 'args', 'retval']
+    if call.yields:
+        vars_names.append('yields')
+    content = []
+    for which_vars in vars_names:
+        if which_vars == 'retval':
+            vars_ = {'value': call.retval}
+        elif which_vars == 'yields':
+            vars_ = {str(i): v for i, v in enumerate(call.yields)}
+        elif which_vars == 'locals':
+            if line_num is not None:
+                vars_ = call.get_line_locals(line_num)
+            else:
+                vars_ = call.locals
+        else:
+            vars_ = call.args or {}
+        tree_data = {str(k): {_format_value(v): {}} for k, v in vars_.items()}
+        content.append((which_vars, tree_data))
+    return content
+
 
-        self.setRowCount(len(self._table_content))
+class CallInfoWidget(QtWidgets.QTableWidget):
+
+    def __init__(self, parent=None):
+        super().__init__(parent=parent)
         self.setColumnCount(2)
-        self._set_table_content(self._table_content)
         self.setHorizontalHeaderLabels(['Info', ''])
-        self.setVerticalHeaderLabels([''] * self.rowCount())
-        self.resizeColumnsToContents()
 
-    def _get_table_content(self, call):
-        return [
-            ['name', call.uname],
-            ['caller', call.caller.uname],
-            ['runtime', str(call.runtime)],
-            ['call_time', str(call.calltime)],
-            ['return_time', str(call.rettime)],
-        ]
-
-    def _set_table_content(self, content):
+    def set_content(self, content):
+        self.clearContents()
+        self.setRowCount(len(content))
         for i, row in enumerate(content):
             for j, cell in enumerate(row):
                 item = QtWidgets.QTableWidgetItem(cell)
                 self.setItem(i, j, item)
+        self.setVerticalHeaderLabels([''] * self.rowCount())
+        self.resizeColumnsToContents()
 
 
 class CallSourceLineFormatHandler:
@@ -61,179 +459,462 @@ class CallSourceLineFormatHandler:
         self.color = color
 
     def apply(self, cursor, line_num):
-        for i in range(line_num + 1):
-            if i == line_num:
-                break
-            cursor.movePosition(QtGui.QTextCursor.NextBlock)
-            cursor.movePosition(QtGui.QTextCursor.EndOfBlock, QtGui.QTextCursor.KeepAnchor)
-
-        doc = cursor.document()
-        block = doc.findBlockByNumber(line_num)
+        block = cursor.document().findBlockByNumber(line_num)
+        cursor.setPosition(block.position())
         fmt = block.blockFormat()
         brush = QtGui.QBrush(QtGui.QColor(*self.color))
         fmt.setBackground(brush)
         cursor.setBlockFormat(fmt)
 
+    def clear(self, cursor, line_num):
+        block = cursor.document().findBlockByNumber(line_num)
+        if not block.isValid():
+            return
+        cursor.setPosition(block.position())
+        fmt = block.blockFormat()
+        fmt.clearBackground()
+        cursor.setBlockFormat(fmt)
 
-class CallVarsWidget(QtWidgets.QTabWidget):
 
-    def __init__(self, call, line_num, parent=None):
-        super().__init__(parent=parent)
-        self.call = call
-        self.line_num = line_num
+def _format_ns(ns):
+    if ns >= 1e9:
+        return f'{ns / 1e9:.2f}s'
+    if ns >= 1e6:
+        return f'{ns / 1e6:.2f}ms'
+    if ns >= 1e3:
+        return f'{ns / 1e3:.1f}us'
+    return f'{ns:.0f}ns'
 
-        for vars_name in ('locals', 'args', 'retval'):
-            w_vars_tree = TreeWidget(expanded=True)
-            tree_data = self._create_tree_data(which_vars=vars_name)
-            w_vars_tree.build(tree_data)
-            self.addTab(w_vars_tree, vars_name)
 
-    def _create_tree_data(self, which_vars):
-        if which_vars == 'retval':
-            vars_ = {'value': getattr(self.call, which_vars)}
-        elif which_vars == 'locals':
-            if self.line_num is not None:
-                # TODO: watch out for None line.
-                line = self.call.get_line(self.line_num)
-                vars_ = getattr(line, which_vars, {})
-            else:
-                vars_ = getattr(self.call, which_vars)
-        else:
-            vars_ = getattr(self.call, which_vars)
+# colors gutters of source lines by their share of the hottest line's time,
+# all the lines at once as extra selections instead of moving a cursor over the document per line.
+class CallSourceHeatmapHandler:
 
-        tree_data = {}
-        for k, v in vars_.items():
-            tree_data[str(k)] = {f'value: {str(v)}\ntype: {type(v)}': {}}
-        return tree_data
+    def __init__(self, color=(200, 60, 40)):
+        self.color = color
+
+    def apply(self, text_edit, heats, width):
+        doc = text_edit.document()
+        selections = []
+        block = doc.firstBlock()
+        while block.isValid():
+            heat = heats.get(block.blockNumber())
+            if heat:
+                sel = QtWidgets.QTextEdit.ExtraSelection()
+                sel.cursor = QtGui.QTextCursor(block)
+                sel.cursor.movePosition(QtGui.QTextCursor.Right, QtGui.QTextCursor.KeepAnchor, width)
+                sel.format.setBackground(QtGui.QBrush(QtGui.QColor(*self.color, int(40 + 215 * heat))))
+                selections.append(sel)
+            block = block.next()
+        text_edit.setExtraSelections(selections)
+
+
+# tabs of values of a call, the tabs and their trees are kept and refilled for every call and line.
+class CallVarsWidget(QtWidgets.QTabWidget):
 
+    def __init__(self, parent=None):
+        super().__init__(parent=parent)
+        self._trees = {}
+
+    def set_content(self, content):
+        names = {name for name, _ in content}
+        for name in [n for n in self._trees if n not in names]:
+            self.removeTab(self.indexOf(self._trees.pop(name)))
+        for name, tree_data in content:
+            w_vars_tree = self._trees.get(name)
+            if w_vars_tree is None:
+                w_vars_tree = self._trees[name] = TreeWidget(expanded=True)
+                self.addTab(w_vars_tree, name)
+            w_vars_tree.setUpdatesEnabled(False)
+            w_vars_tree.clear()
+            w_vars_tree.build(tree_data)
+            w_vars_tree.setUpdatesEnabled(True)
 
+
+# source of a call with a gutter of hits and time per line of the call,
+# and of all the calls of its function when given their `profiling.FunctionStats`.
 class CallSourceCodeWidget(QtWidgets.QTextEdit):
 
-    def __init__(self, _par_w, call, parent=None):
+    def __init__(self, _par_w, parent=None):
         super().__init__(parent=parent)
         self._par_w = _par_w
-        self.call = call
 
-        # from local zero-started nums to real src file nums.
         self.text = ''
-        self._line_num_map = None
-        self._setup_text()
+        self._line_num_map = {}
+        self._active_block_num = None
 
-        self.setText(self.text)
         self.setReadOnly(True)
+        self.setLineWrapMode(QtWidgets.QTextEdit.NoWrap)
+        self.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
         self.mouseDoubleClickEvent = self.on_double_click
-        self.layout = QtWidgets.QHBoxLayout(self)
         self._fmt = CallSourceLineFormatHandler()
+        self._heatmap = CallSourceHeatmapHandler()
 
-    def _setup_text(self):
-        ln_offset = self.call.frame.f_code.co_firstlineno
-        src = inspect.getsource(self.call.frame)
-        lns = src.split('\n')
-        self.text = '\n'.join(f'{i + ln_offset}\t| {ln}' for i, ln in enumerate(lns))
-        self._line_num_map = {i: i + ln_offset for i in range(len(lns))}
-
-    def _reset_vars_widget(self):
-        if self._w_vars is not None:
-            self._w_vars.setParent(None)
+    def set_content(self, content):
+        self.text, self._line_num_map, heats, gutter_width = content
+        self._active_block_num = None
+        self.setText(self.text)
+        self._heatmap.apply(self, heats, gutter_width)
 
-    def _add_vars_widget(self, line_num):
-        self._w_vars = CallVarsWidget(parent=self, call=self.call, line_num=line_num)
-        self.layout.addWidget(self._w_vars)
+    # placeholder until the source gets loaded, or the reason it failed to.
+    def set_message(self, text):
+        self.text = ''
+        self._line_num_map = {}
+        self._active_block_num = None
+        self.setExtraSelections([])
+        self.setText(text)
 
     def highlight_block(self, block_num):
         cursor = self.textCursor()
+        if self._active_block_num is not None:
+            self._fmt.clear(cursor, self._active_block_num)
         self._fmt.apply(cursor, block_num)
+        self._active_block_num = block_num
 
     @QtCore.Slot()
     def on_double_click(self, event):
-        # TODO: terrible hack.
-        cursor = self.textCursor()
-        block_num = cursor.blockNumber()
-        line_num = self._line_num_map[block_num]
+        block_num = self.textCursor().blockNumber()
+        line_num = self._line_num_map.get(block_num)
         if line_num is not None:
-            self._par_w.active_line_num = line_num
-            self._par_w.active_block_num = block_num
-            self._par_w._cursor = cursor
-            self._par_w.on_double_click()
+            self._par_w.on_line_double_click(block_num, line_num)
 
 
+# info, source and values of the shown call. the widgets are created once and refilled for every call,
+# their content gets prepared by `loader` and results of calls shown before the latest one are dropped.
 class CallInspectWidget(QtWidgets.QWidget):
 
-    def __init__(self, call, parent=None):
+    def __init__(self, loader, parent=None):
         super().__init__(parent=parent)
-        self.call = call
+        self.loader = loader
+        self.call = None
+        self.stats = None
+        self.overhead = 0
 
         self.active_line_num = None
         self.active_block_num = None
 
-        self._w_info = CallInfoWidget(parent=self, call=call)
-        self._w_code = CallSourceCodeWidget(_par_w=self, parent=self, call=call)
-        self._w_vars = None
+        self._w_info = CallInfoWidget(parent=self)
+        self._w_code = CallSourceCodeWidget(_par_w=self, parent=self)
+        self._w_vars = CallVarsWidget(parent=self)
+        self._w_vars.hide()
 
         self.layout = QtWidgets.QHBoxLayout(self)
         self.layout.addWidget(self._w_info)
         self.layout.addWidget(self._w_code)
+        self.layout.addWidget(self._w_vars)
 
-    def _reset_widgets(self):
-        if self._w_vars is not None:
-            self._w_vars.setParent(None)
-        self._w_code.setParent(None)
-
-    def _add_widgets(self):
-        self._w_code = CallSourceCodeWidget(_par_w=self, parent=self, call=self.call)
-        self.layout.addWidget(self._w_code)
-        if self.active_line_num is not None:
-            self._w_vars = CallVarsWidget(
-                parent=self,
-                call=self.call,
-                line_num=self.active_line_num
-            )
-            self.layout.addWidget(self._w_vars)
-
-    def on_double_click(self):
-        # TODO: terrible hack.
-        self._reset_widgets()
-        self._add_widgets()
-        if self.active_block_num is not None:
-            self._w_code.highlight_block(self.active_block_num)
+    def set_call(self, call, caller=None, stats=None, overhead=0):
+        self.call = call
+        self.stats = stats
+        self.overhead = overhead
+        self.active_line_num = None
+        self.active_block_num = None
+        self._w_vars.hide()
+        self._w_code.set_message('loading...')
+        self.loader.load(
+            ('call', call.id),
+            _get_call_content,
+            (call, caller, stats, overhead),
+            lambda content: self._on_call_content(call, content),
+        )
+
+    def _on_call_content(self, call, content):
+        if call is not self.call:
+            return
+        if isinstance(content, Exception):
+            self._w_code.set_message(f'failed to load the source: {content}')
+            return
+        info, source = content
+        self._w_info.set_content(info)
+        self._w_code.set_content(source)
+
+    def on_line_double_click(self, block_num, line_num):
+        self.active_line_num = line_num
+        self.active_block_num = block_num
+        self._w_code.highlight_block(block_num)
+        call = self.call
+        self.loader.load(
+            ('vars', call.id, line_num),
+            _get_vars,
+            (call, line_num),
+            lambda content: self._on_vars_content(call, line_num, content),
+        )
+
+    def _on_vars_content(self, call, line_num, content):
+        if call is not self.call or line_num != self.active_line_num:
+            return
+        if isinstance(content, Exception):
+            content = [('error', {f'failed to format values: {content}': {}})]
+        self._w_vars.set_content(content)
+        self._w_vars.show()
 
 
 class MainWindow(QtWidgets.QWidget):
+    GROUP_BY = ('none', 'thread', 'task', 'process')
 
     def __init__(self, size=(800, 800)):
         super().__init__()
         self.size = size
         self.resize(*size)
-        self.w_call_tree = TreeWidget(parent=self, expanded=True)
-        self.w_call_tree.itemClicked.connect(self.on_tree_click)
+        self.w_call_tree = QtWidgets.QTreeView(parent=self)
+        self.w_call_tree.setUniformRowHeights(True)
+        self.w_call_tree.clicked.connect(self.on_tree_click)
+        self.w_group_by = QtWidgets.QComboBox(parent=self)
+        self.w_group_by.addItems(self.GROUP_BY)
+        self.w_group_by.currentTextChanged.connect(self.on_group_by_change)
+        self.w_profile = QtWidgets.QTableView(parent=self)
+        self.w_profile.setSortingEnabled(True)
+        self.w_profile.clicked.connect(self.on_profile_click)
+        self.w_flame_graph = None
+        self.w_views = QtWidgets.QTabWidget(parent=self)
+        self.w_views.addTab(self.w_profile, 'profile')
+        self.w_splitter = QtWidgets.QSplitter(parent=self)
+        self.w_splitter.addWidget(self.w_call_tree)
+        self.w_splitter.addWidget(self.w_views)
+        self.loader = BackgroundLoader(parent=self)
+        self.w_call_inspect = CallInspectWidget(loader=self.loader, parent=self)
+        self.w_call_inspect.hide()
         self.layout = QtWidgets.QVBoxLayout(self)
-        self.layout.addWidget(self.w_call_tree)
+        self.layout.addWidget(self.w_group_by)
+        self.layout.addWidget(self.w_splitter)
+        self.layout.addWidget(self.w_call_inspect)
 
         self._run = None
-        self._dynamic_widgets = []
+        self._profile_model = None
 
-    def _add_dynamic_widgets(self):
-        for w in self._dynamic_widgets:
-            self.layout.addWidget(w)
-
-    def _reset_dynamic_widgets(self):
-        for w in self._dynamic_widgets:
-            w.setParent(None)
-        self._dynamic_widgets = []
+    def _set_call_tree_model(self, group_by):
+        group_by = group_by if group_by != 'none' else None
+        self._call_tree_model = CallTreeModel(self._run, parent=self, group_by=group_by)
+        self.w_call_tree.setModel(self._call_tree_model)
 
+    # the call tree shows up right away, the profile and the flame graph once they're computed on the pool.
     def on_trace(self, run):
         self._run = run
-        call_tree_data = run.create_tree_data()
-        self.w_call_tree.build(call_tree_data)
+        self._profile_model = None
+        self.loader.clear()
+        self.w_call_inspect.hide()
+        self.loader.load(('profile',), _get_profile, (run,), lambda content: self._on_profile(run, content))
+        # concurrent runs start grouped by thread, runs of several processes by process.
+        group_by = 'thread' if len(run.threads) > 1 else 'none'
+        if len(set(run.processes.values())) > 1:
+            group_by = 'process'
+        if self.w_group_by.currentText() != group_by:
+            self.w_group_by.setCurrentText(group_by)
+        else:
+            self._set_call_tree_model(group_by)
+
+    def _on_profile(self, run, content):
+        if run is not self._run or isinstance(content, Exception):
+            return
+        profile, flame_tree = content
+        self._profile_model = ProfileTableModel(profile, parent=self)
+        self.w_profile.setModel(self._profile_model)
+        self.w_profile.sortByColumn(ProfileTableModel.COLUMNS.index('exclusive'), QtCore.Qt.DescendingOrder)
+        if self.w_flame_graph is not None:
+            self.w_views.removeTab(self.w_views.indexOf(self.w_flame_graph))
+        self.w_flame_graph = FlameGraphWidget(flame_tree, parent=self)
+        self.w_views.addTab(self.w_flame_graph, 'flame graph')
+
+    @QtCore.Slot(str)
+    def on_group_by_change(self, group_by):
+        if self._run is not None:
+            self.w_call_inspect.hide()
+            self._set_call_tree_model(group_by)
+
+    # shows the slowest call of the clicked function.
+    @QtCore.Slot(QtCore.QModelIndex)
+    def on_profile_click(self, index):
+        stats = self._profile_model.get_stats(index)
+        if stats is None:
+            return
+        ids = self._run.get_index().by_name.get(stats.name)
+        if ids:
+            self._show_call(max((self._run.get_call(i) for i in ids), key=lambda c: c.runtime))
+
+    @QtCore.Slot(QtCore.QModelIndex)
+    def on_tree_click(self, index):
+        call = self._call_tree_model.get_call(index)
+        if call is None:
+            return
+        self._show_call(call)
+
+    def _show_call(self, call):
+        caller = self._run.get_caller(call)
+        stats = self._profile_model.profile.stats.get(call.name) if self._profile_model is not None else None
+        self.w_call_inspect.set_call(call, caller=caller, stats=stats, overhead=self._run.overhead or 0)
+        self.w_call_inspect.show()
+
+
+def _get_profile(run):
+    return run.profile(), get_flame_tree(run)
+
+
+# aligned tree of a `diff.RunDiff`, with the columns of both runs and the deltas.
+# children of a node are only loaded once it gets expanded, in batches of `batch_size`.
+# internal ids are ids of `diff.DiffNode`s, `0` is the invisible root.
+class DiffTreeModel(QtCore.QAbstractItemModel):
+    COLUMNS = ('name', 'calls', 'time', 'calls', 'time', 'calls delta', 'time delta')
+    BEFORE_COLUMNS = (0, 1, 2)
+    AFTER_COLUMNS = (0, 3, 4, 5, 6)
+    ADDED_COLOR = (40, 140, 60)
+    REMOVED_COLOR = (160, 50, 50)
+    SLOWER_COLOR = (200, 90, 40)
+    FASTER_COLOR = (40, 120, 160)
+
+    def __init__(self, diff, parent=None, batch_size=1000):
+        super().__init__(parent)
+        self.diff = diff
+        self.batch_size = batch_size
+        self._children = {}
+        self._fetched = {}
+        self._rows = {}
+
+    def _get_children(self, node_id):
+        children = self._children.get(node_id)
+        if children is None:
+            children = self._children[node_id] = list(self.diff.nodes[node_id].children.values())
+        return children
+
+    def _get_node_id(self, index):
+        return index.internalId() if index.isValid() else 0
+
+    def get_node(self, index):
+        node_id = self._get_node_id(index)
+        return self.diff.nodes[node_id] if node_id else None
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        node_id = self._get_node_id(parent)
+        if not 0 <= row < self._fetched.get(node_id, 0) or not 0 <= column < len(self.COLUMNS):
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column, self._get_children(node_id)[row].id)
+
+    def parent(self, index):
+        node = self.get_node(index)
+        if node is None or node.parent is None or node.parent.id == 0:
+            return QtCore.QModelIndex()
+        return self.createIndex(self._rows[node.parent.id], 0, node.parent.id)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return self._fetched.get(self._get_node_id(parent), 0)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return len(self.COLUMNS)
+
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        return len(self.diff.nodes[self._get_node_id(parent)].children) > 0
+
+    def canFetchMore(self, parent):
+        node_id = self._get_node_id(parent)
+        return self._fetched.get(node_id, 0) < len(self.diff.nodes[node_id].children)
+
+    def fetchMore(self, parent):
+        node_id = self._get_node_id(parent)
+        children = self._get_children(node_id)
+        start = self._fetched.get(node_id, 0)
+        end = min(start + self.batch_size, len(children))
+        if start >= end:
+            return
+
+        self.beginInsertRows(parent, start, end - 1)
+        for row in range(start, end):
+            self._rows[children[row].id] = row
+        self._fetched[node_id] = end
+        self.endInsertRows()
+
+    def _get_text(self, node, column):
+        if column == 0:
+            return node.name
+        # values of a run the path is missing from are left empty.
+        if column in (1, 2) and not node.before_calls or column in (3, 4) and not node.after_calls:
+            return ''
+        if column == 1:
+            return str(node.before_calls)
+        if column == 2:
+            return _format_ns(node.before_time)
+        if column == 3:
+            return str(node.after_calls)
+        if column == 4:
+            return _format_ns(node.after_time)
+        if column == 5:
+            return f'{node.calls_delta:+d}'
+        delta = node.after_time - node.before_time
+        return ('+' if delta >= 0 else '-') + _format_ns(abs(delta))
+
+    # slower and faster paths get stronger colors the bigger their share of the change is.
+    def _get_color(self, node):
+        status = node.status
+        if status == 'added':
+            return QtGui.QColor(*self.ADDED_COLOR)
+        if status == 'removed':
+            return QtGui.QColor(*self.REMOVED_COLOR)
+        delta = node.after_time - node.before_time
+        if not delta:
+            return None
+        share = min(abs(delta) / max(node.before_time, node.after_time), 1.0)
+        color = QtGui.QColor(*(self.SLOWER_COLOR if delta > 0 else self.FASTER_COLOR))
+        color.setAlpha(int(255 * share))
+        return color
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        node = self.get_node(index)
+        if node is None:
+            return None
+        if role == QtCore.Qt.DisplayRole:
+            return self._get_text(node, index.column())
+        if role == QtCore.Qt.BackgroundRole:
+            color = self._get_color(node)
+            return QtGui.QBrush(color) if color is not None else None
+        if role == QtCore.Qt.ToolTipRole:
+            return ' > '.join(node.path)
+        return None
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return self.COLUMNS[section]
+        return None
+
+
+# both runs side by side: the two trees share the model, selection, expanded nodes and scrolling,
+# so that aligned paths stay on the same rows.
+class DiffWindow(QtWidgets.QWidget):
+
+    def __init__(self, diff, size=(800, 800)):
+        super().__init__()
+        self.diff = diff
+        self.resize(*size)
+        self._model = DiffTreeModel(diff, parent=self)
+        self.w_summary = QtWidgets.QLabel(diff.summary(), parent=self)
+        self.w_before = self._create_tree(DiffTreeModel.BEFORE_COLUMNS)
+        self.w_after = self._create_tree(DiffTreeModel.AFTER_COLUMNS)
+        self.w_after.setSelectionModel(self.w_before.selectionModel())
+        for a, b in ((self.w_before, self.w_after), (self.w_after, self.w_before)):
+            a.expanded.connect(b.expand)
+            a.collapsed.connect(b.collapse)
+            a.verticalScrollBar().valueChanged.connect(b.verticalScrollBar().setValue)
+        self.w_splitter = QtWidgets.QSplitter(parent=self)
+        self.w_splitter.addWidget(self.w_before)
+        self.w_splitter.addWidget(self.w_after)
+        self.layout = QtWidgets.QVBoxLayout(self)
+        self.layout.addWidget(self.w_summary)
+        self.layout.addWidget(self.w_splitter)
 
-    @QtCore.Slot()
-    def on_tree_click(self):
-        self._reset_dynamic_widgets()
-        item = self.w_call_tree.selectedItems()[0].text(0)
-        call = self._run.get_call_by_uname(item)
-        w_call_inspect = CallInspectWidget(parent=self, call=call)
-        self._dynamic_widgets.append(w_call_inspect)
-        self._add_dynamic_widgets()
+    def _create_tree(self, columns):
+        tree = QtWidgets.QTreeView(parent=self)
+        tree.setUniformRowHeights(True)
+        tree.setModel(self._model)
+        for column in range(len(DiffTreeModel.COLUMNS)):
+            tree.setColumnHidden(column, column not in columns)
+        return tree
+
+
+def _create_app(dark_theme):
+    app = QtWidgets.QApplication(sys.argv)
+    if dark_theme:
+        import qdarkstyle
+        app.setStyleSheet(qdarkstyle.load_stylesheet(qt_api='pyside2'))
+    return app
 
 
 class TracerApp:
@@ -241,13 +922,24 @@ class TracerApp:
     def __init__(self, run, win_size=(1920, 1080), dark_theme=True):
         super().__init__()
         self.run = run
-        self._app = QtWidgets.QApplication(sys.argv)
-        if dark_theme:
-            import qdarkstyle
-            self._app.setStyleSheet(qdarkstyle.load_stylesheet(qt_api='pyside2'))
+        self._app = _create_app(dark_theme)
         self._win = MainWindow(size=win_size)
 
+    # the run is only read until this returns, so that it's fine to close it then.
     def exec(self):
         self._win.on_trace(self.run)
         self._win.show()
         self._app.exec_()
+        self._win.loader.wait()
+
+
+class DiffApp:
+
+    def __init__(self, diff, win_size=(1920, 1080), dark_theme=True):
+        self.diff = diff
+        self._app = _create_app(dark_theme)
+        self._win = DiffWindow(diff, size=win_size)
+
+    def exec(self):
+        self._win.show()
+        self._app.exec_()
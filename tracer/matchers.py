@@ -0,0 +1,55 @@
+from dataclasses import dataclass, field
+from typing import Any
+
+WHERE_ARGS = 'kwargs'
+WHERE_RETURN = 'return'
+
+
+@dataclass
+class Match:
+    target: Any = None
+    func: Any = None
+    where: Any = None
+    name: Any = None
+    call: Any = field(default=None, repr=False)
+
+
+class Matcher:
+
+    # yields targets matched by `value`.
+    def match(self, value):
+        raise NotImplementedError
+
+    def match_call(self, call):
+        for name, value in (call.args or {}).items():
+            for target in self.match(value):
+                yield Match(target=target, func=call.name, where=WHERE_ARGS, name=name, call=call)
+        for target in self.match(call.retval):
+            yield Match(target=target, func=call.name, where=WHERE_RETURN, call=call)
+
+
+class EqualsMatcher(Matcher):
+
+    def __init__(self, targets):
+        self.targets = list(targets)
+
+    def match(self, value):
+        for target in self.targets:
+            try:
+                if type(value) is type(target) and value == target:
+                    yield target
+            except Exception:
+                continue
+
+
+class PredicateMatcher(Matcher):
+
+    def __init__(self, predicate):
+        self.predicate = predicate
+
+    def match(self, value):
+        try:
+            if self.predicate(value):
+                yield value
+        except Exception:
+            return
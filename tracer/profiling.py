@@ -0,0 +1,201 @@
+import os
+from time import perf_counter_ns
+from dataclasses import dataclass, field
+from typing import Any
+from pathlib import Path
+
+SORT_KEYS = ('name', 'calls', 'inclusive', 'exclusive', 'per_call')
+
+
+@dataclass
+class FunctionStats:
+    name: Any = None
+    calls: Any = 0
+    # in seconds, recursive calls are only counted once in `inclusive`.
+    inclusive: Any = 0.0
+    exclusive: Any = 0.0
+    # line num -> number of times it was hit.
+    line_hits: Any = field(default_factory=dict, repr=False)
+    # line num -> seconds spent on it, including calls it made.
+    line_times: Any = field(default_factory=dict, repr=False)
+
+    @property
+    def per_call(self):
+        return self.inclusive / self.calls if self.calls else 0.0
+
+
+# inclusive and exclusive ns of each call less the tracer's overhead, as lists indexed by call ids.
+def get_call_times(run):
+    calls = run.calls
+    size = len(calls)
+    overhead = run.overhead or 0
+    # raw inclusive times as measured, and both times with the tracer's overhead subtracted.
+    measured = [0] * size
+    inclusive = [0] * size
+    exclusive = [0] * size
+
+    links = run.links
+    # children always get higher ids than their callers, so walking ids backwards visits children first.
+    for i in range(size - 1, -1, -1):
+        call = calls[i]
+        children = run.children.get(i)
+        if children and links:
+            children = [ch for ch in children if ch not in links]
+        if call.segments:
+            segments = call.segments
+            incl = sum(end - start for start, end in zip(segments[::2], segments[1::2]))
+        elif call.ret_timestamp is not None:
+            incl = call.ret_timestamp - call.call_timestamp
+        else:
+            incl = 0
+        measured[i] = incl
+        # events timed within the call itself: its lines, halves of its own call and return
+        # and the outer halves of call and return of each child.
+        if children:
+            excl = incl - sum([measured[ch] for ch in children])
+            excl -= overhead * (call.num_lines + 1 + len(children))
+            exclusive[i] = max(excl, 0)
+            inclusive[i] = exclusive[i] + sum([inclusive[ch] for ch in children])
+        else:
+            exclusive[i] = inclusive[i] = max(incl - overhead * (call.num_lines + 1), 0)
+    return inclusive, exclusive
+
+
+# per qualified name aggregates of a run.
+class Profile:
+
+    def __init__(self, run):
+        self.run = run
+        self.stats = {}
+        self._build()
+
+    def __len__(self):
+        return len(self.stats)
+
+    def __getitem__(self, name):
+        return self.stats[name]
+
+    def __iter__(self):
+        return iter(self.stats.values())
+
+    def _build(self):
+        inclusive, exclusive = get_call_times(self.run)
+        overhead = self.run.overhead or 0
+
+        stats = self.stats
+        # names on the path from the root, to count recursive calls once in inclusive time.
+        path = []
+        active = {}
+        for depth, call in self.run.walk():
+            while len(path) > depth:
+                active[path.pop()] -= 1
+            name = call.name
+            st = stats.get(name)
+            if st is None:
+                st = stats[name] = FunctionStats(name=name)
+            st.calls += 1
+            st.exclusive += exclusive[call.id] / 1e9
+            if not active.get(name):
+                st.inclusive += inclusive[call.id] / 1e9
+            path.append(name)
+            active[name] = active.get(name, 0) + 1
+
+        for call, num, ns in self.run.iter_line_times():
+            st = stats.get(call.name)
+            if st is None:
+                continue
+            st.line_hits[num] = st.line_hits.get(num, 0) + 1
+            if ns is not None:
+                st.line_times[num] = st.line_times.get(num, 0.0) + max(ns - overhead, 0) / 1e9
+
+    def sorted(self, key='exclusive', reverse=True):
+        if key not in SORT_KEYS:
+            msg = f'unknown sort key `{key}`, expected one of: {", ".join(SORT_KEYS)}.'
+            raise ValueError(msg)
+        return sorted(self.stats.values(), key=lambda st: getattr(st, key), reverse=reverse)
+
+    def top(self, n=10, key='exclusive'):
+        return self.sorted(key=key)[:n]
+
+
+# node of the call tree with calls on the same path of qualified names merged, as drawn by flame graphs.
+@dataclass
+class FlameNode:
+    name: Any = None
+    # inclusive ns of all the merged calls.
+    value: Any = 0
+    calls: Any = 0
+    # name -> `FlameNode`.
+    children: Any = field(default_factory=dict, repr=False)
+
+    @property
+    def self_value(self):
+        return max(self.value - sum(ch.value for ch in self.children.values()), 0)
+
+
+def get_flame_tree(run):
+    inclusive, _ = get_call_times(run)
+    root = FlameNode(name='all')
+    nodes = [None] * len(run.calls)
+    links = run.links
+    # callers always come before their calls in ids order, calls of other processes get trees of their own.
+    for call in run.calls:
+        parent = nodes[call.parent] if call.parent is not None and call.id not in links else root
+        node = parent.children.get(call.name)
+        if node is None:
+            node = parent.children[call.name] = FlameNode(name=call.name)
+        node.value += inclusive[call.id]
+        node.calls += 1
+        nodes[call.id] = node
+    root.value = sum(ch.value for ch in root.children.values())
+    root.calls = len(run.calls)
+    return root
+
+
+def _calibration_target(n):
+    x = 0
+    for i in range(n):
+        x += i
+    return x
+
+
+# accepts the calibration target only, so that nothing else gets traced while calibrating.
+class _OnlyCodeFilter:
+
+    def __init__(self, code):
+        self.code = code
+
+    def accepts(self, code):
+        return code is self.code
+
+
+def _time_ns(func, *args, repeat):
+    best = None
+    for _ in range(repeat):
+        start = perf_counter_ns()
+        func(*args)
+        elapsed = perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# measures the cost of a single traced event in ns with the given backend and capture mode,
+# as the difference of the best times of a function traced and untraced divided by its number of events.
+def calibrate(backend='auto', capture='copy', n=1000, repeat=5):
+    from .core import Run
+    from .backends import create_backend
+    from .capture import CapturePolicy
+
+    plain = _time_ns(_calibration_target, n, repeat=repeat)
+    run = Run(root=Path(os.path.dirname(__file__)), capture=CapturePolicy(mode=capture))
+    backend = create_backend(name=backend, run=run, code_filter=_OnlyCodeFilter(_calibration_target.__code__))
+    backend.start()
+    try:
+        traced = _time_ns(_calibration_target, n, repeat=repeat)
+    finally:
+        backend.stop()
+
+    if not run.calls:
+        return 0
+    events = len(run.calls[0].lines) + 2
+    return max(traced - plain, 0) / events
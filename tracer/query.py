@@ -0,0 +1,160 @@
+import re
+import fnmatch
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+
+def _compile_glob(pattern):
+    return re.compile(fnmatch.translate(pattern))
+
+
+# indexes are built once per run in a single pass over its calls,
+# queries then only look them up instead of scanning the calls.
+class CallIndex:
+
+    def __init__(self, run):
+        self.run = run
+        self.size = len(run)
+        # parent -> children adjacency is maintained by the run itself while tracing.
+        self.roots = run.roots
+        self.children = run.children
+        self.by_name = defaultdict(list)
+        self._by_runtime = None
+
+        for call in run.calls:
+            self.by_name[call.name].append(call.id)
+
+    @property
+    def by_runtime(self):
+        if self._by_runtime is None:
+            ids = []
+            runtimes = []
+            for c in self.run.calls:
+                if c.call_timestamp is not None and c.ret_timestamp is not None:
+                    ids.append(c.id)
+                    runtimes.append(c.ret_timestamp - c.call_timestamp)
+            order = sorted(range(len(ids)), key=runtimes.__getitem__)
+            self._by_runtime = ([runtimes[i] for i in order], [ids[i] for i in order])
+        return self._by_runtime
+
+    def get_names(self, pattern):
+        regexp = _compile_glob(pattern)
+        return [name for name in self.by_name if regexp.match(name) is not None]
+
+    def get_ids_by_name(self, pattern):
+        ids = set()
+        for name in self.get_names(pattern):
+            ids.update(self.by_name[name])
+        return ids
+
+    # bounds are in seconds.
+    def get_ids_by_runtime(self, low=None, high=None):
+        low = low * 1e9 if low is not None else None
+        high = high * 1e9 if high is not None else None
+        runtimes, ids = self.by_runtime
+        start = bisect_left(runtimes, low) if low is not None else 0
+        end = bisect_right(runtimes, high) if high is not None else len(runtimes)
+        return set(ids[start:end])
+
+
+class Query:
+
+    def __init__(self, run, ids=None, index=None):
+        self.run = run
+        self.index = index if index is not None else run.get_index()
+        # `None` stands for all the calls of the run.
+        self._ids = ids
+
+    def __iter__(self):
+        return iter(self.calls)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __repr__(self):
+        return f'Query(calls={len(self)})'
+
+    @property
+    def ids(self):
+        if self._ids is None:
+            return [c.id for c in self.run.calls]
+        return sorted(self._ids)
+
+    @property
+    def calls(self):
+        return [self.run.get_call(i) for i in self.ids]
+
+    def first(self):
+        ids = self.ids
+        return self.run.get_call(ids[0]) if ids else None
+
+    def _narrow(self, ids):
+        if self._ids is not None:
+            ids = ids & self._ids if len(ids) > len(self._ids) else self._ids & ids
+        return Query(run=self.run, ids=ids, index=self.index)
+
+    def _filter(self, predicate):
+        calls = self.run.calls if self._ids is None else self.calls
+        ids = set()
+        for call in calls:
+            try:
+                if predicate(call):
+                    ids.add(call.id)
+            except Exception:
+                continue
+        return Query(run=self.run, ids=ids, index=self.index)
+
+    def name(self, pattern):
+        return self._narrow(self.index.get_ids_by_name(pattern))
+
+    def callers_of(self, pattern):
+        ids = {self.run.get_call(i).parent for i in self.index.get_ids_by_name(pattern)}
+        ids.discard(None)
+        return self._narrow(ids)
+
+    def callees_of(self, pattern):
+        ids = set()
+        children = self.index.children
+        for i in self.index.get_ids_by_name(pattern):
+            ids.update(children.get(i, ()))
+        return self._narrow(ids)
+
+    def children(self, call_id):
+        return self._narrow(set(self.index.children.get(call_id, ())))
+
+    def thread(self, pattern):
+        regexp = _compile_glob(pattern)
+        names = self.run.threads
+        return self._filter(lambda c: regexp.match(names.get(c.thread, str(c.thread))) is not None)
+
+    def task(self, pattern):
+        regexp = _compile_glob(pattern)
+        return self._filter(lambda c: c.task is not None and regexp.match(c.task) is not None)
+
+    def slower_than(self, seconds):
+        return self._narrow(self.index.get_ids_by_runtime(low=seconds))
+
+    def faster_than(self, seconds):
+        return self._narrow(self.index.get_ids_by_runtime(high=seconds))
+
+    def where(self, predicate):
+        return self._filter(predicate)
+
+    def where_args(self, predicate):
+        return self._filter(lambda c: predicate(c.args or {}))
+
+    def where_arg(self, name, predicate):
+        return self._filter(lambda c: name in (c.args or {}) and predicate(c.args[name]))
+
+    def where_retval(self, predicate):
+        return self._filter(lambda c: predicate(c.retval))
+
+    # matches in the order the calls returned.
+    def match(self, matchers):
+        matches = []
+        for call in self.run.walk_post_order():
+            if self._ids is not None and call.id not in self._ids:
+                continue
+            for matcher in matchers:
+                matches.extend(matcher.match_call(call))
+        return matches
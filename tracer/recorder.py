@@ -0,0 +1,183 @@
+import os
+import sys
+import signal
+import reprlib
+import threading
+from collections import deque
+
+from .capture import DELETED
+from .storage import (
+    TraceWriter,
+    EVENT_CALL,
+    EVENT_LINE,
+    EVENT_RETURN,
+    EVENT_RESUME,
+    EVENT_YIELD,
+    _repr_value,
+)
+
+
+def _get_timestamp(record):
+    tag = record[0]
+    if tag == EVENT_CALL:
+        return record[8]
+    return record[3] if tag == EVENT_LINE else record[2]
+
+
+# keeps only the last `capacity` events of a run as compact records with values turned into short reprs,
+# so that its memory stays the same no matter how long the traced process runs.
+# it's a run's sink, with `Run(keep=False)` nothing else of finished calls is kept.
+# records are only appended to a deque and a dict, which the gil makes atomic,
+# so dumps never wait for the traced threads and are safe to take from signal handlers.
+class FlightRecorder:
+
+    def __init__(self, capacity=100000, path=None, meta=None, max_value_len=256):
+        self.capacity = capacity
+        # `{pid}` and `{n}`, the number of the dump, are filled in for every dump.
+        self.path = path or 'tracer-{pid}-{n}.bin'
+        self.meta = dict(meta or {})
+        self.max_value_len = max_value_len
+        self.dumps = 0
+        self.events = deque(maxlen=capacity)
+        self._threads = {}
+        # call id -> call record of calls which haven't returned yet,
+        # so that calls still running get dumped even when their start is long gone.
+        # at most `capacity` of them are kept, the oldest go first.
+        self._open = {}
+        self._repr = reprlib.Repr()
+        self._repr.maxstring = max_value_len
+        self._repr.maxother = max_value_len
+        self._hooks = None
+
+    def __len__(self):
+        return len(self.events)
+
+    def _value(self, value):
+        value = _repr_value(self._repr, value)
+        return value[:self.max_value_len] if value is not DELETED else value
+
+    def _values(self, items):
+        return tuple((name, self._value(value)) for name, value in items)
+
+    def on_call(self, call):
+        info = call.info
+        record = (
+            EVENT_CALL,
+            call.id,
+            call.parent,
+            call.name,
+            info.path,
+            info.first_lineno,
+            call.thread,
+            call.task,
+            call.call_timestamp,
+            self._values((call.args or {}).items()),
+        )
+        self.events.append(record)
+        opened = self._open
+        opened[call.id] = record
+        if len(opened) > self.capacity:
+            opened.pop(next(iter(opened)), None)
+
+    def on_thread(self, tid, name):
+        self._threads[tid] = name
+
+    def on_line(self, call, line):
+        delta = line._delta or ()
+        values = self._values(zip(delta[::2], delta[1::2]))
+        self.events.append((EVENT_LINE, call.id, line.num, call._line_timestamp, values))
+
+    def on_resume(self, call):
+        self.events.append((EVENT_RESUME, call.id, call.segments[-1]))
+
+    def on_yield(self, call, value):
+        value = self._value(value) if call.info.generator else DELETED
+        self.events.append((EVENT_YIELD, call.id, call.segments[-1], value))
+
+    # returns carry the record of their call, which outlives the call's own record in the buffer.
+    def on_return(self, call):
+        delta = call._ret_delta or ()
+        record = self._open.pop(call.id, None)
+        values = self._values(zip(delta[::2], delta[1::2]))
+        self.events.append((EVENT_RETURN, call.id, call.ret_timestamp, self._value(call.retval), values, record))
+
+    # suspended calls which are never resumed again, i.e. abandoned generators, are only kept by their records.
+    def on_release(self, call):
+        self._open.pop(call.id, None)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def _write(self, writer, record, ids):
+        tag = record[0]
+        call_id = ids[record[1]]
+        if tag == EVENT_CALL:
+            writer.write_call(call_id, ids.get(record[2]), *record[3:])
+        elif tag == EVENT_LINE:
+            writer.write_line(call_id, *record[2:])
+        elif tag == EVENT_RESUME:
+            writer.write_resume(call_id, record[2])
+        elif tag == EVENT_YIELD:
+            writer.write_yield(call_id, record[2], record[3])
+        elif tag == EVENT_RETURN:
+            writer.write_return(call_id, *record[2:5])
+
+    # writes the recorded events as a regular trace file which opens with `python -m tracer view`.
+    # calls are given contiguous ids and the ones without a recorded caller become roots.
+    def dump(self, path=None):
+        records = list(self.events)
+        opened = dict(self._open)
+        threads = dict(self._threads)
+
+        # records of calls whose own start was dropped from the buffer.
+        started = {r[1] for r in records if r[0] == EVENT_CALL}
+        headers = {i: r for i, r in opened.items() if i not in started}
+        for r in records:
+            if r[0] == EVENT_RETURN and r[1] not in started and r[5] is not None:
+                headers[r[1]] = r[5]
+        records = [r for r in records if r[1] in started or r[1] in headers]
+        ids = {call_id: i for i, call_id in enumerate(sorted(started | headers.keys()))}
+        t0 = min(map(_get_timestamp, [*headers.values(), *records]), default=None)
+
+        path = path or self.path.format(pid=os.getpid(), n=self.dumps)
+        self.dumps += 1
+        meta = {**self.meta, 'capacity': self.capacity}
+        with TraceWriter(path, meta=meta, max_value_len=self.max_value_len, t0=t0) as writer:
+            for tid, name in threads.items():
+                writer.write_thread(tid, name)
+            for call_id in sorted(headers):
+                self._write(writer, headers[call_id], ids)
+            for r in records:
+                self._write(writer, r, ids)
+        return path
+
+    # dumps on `signum` and on exceptions left unhandled by the main or any other thread.
+    # signal handlers can only be set from the main thread.
+    def install(self, signum=None):
+        if self._hooks is not None:
+            return
+        prev_signal = signal.signal(signum, lambda *args: self.dump()) if signum is not None else None
+        self._hooks = (signum, prev_signal, sys.excepthook, threading.excepthook)
+        prev_hook, prev_thread_hook = sys.excepthook, threading.excepthook
+
+        def excepthook(*args):
+            self.dump()
+            prev_hook(*args)
+
+        def thread_excepthook(args):
+            self.dump()
+            prev_thread_hook(args)
+
+        sys.excepthook = excepthook
+        threading.excepthook = thread_excepthook
+
+    def uninstall(self):
+        if self._hooks is None:
+            return
+        signum, prev_signal, sys.excepthook, threading.excepthook = self._hooks
+        if signum is not None:
+            signal.signal(signum, prev_signal)
+        self._hooks = None
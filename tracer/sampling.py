@@ -0,0 +1,147 @@
+import sys
+import threading
+
+from .core import Call, Line
+
+
+# statistical alternative to the tracing backends: a background thread snapshots stacks of all the other threads
+# every `interval` seconds and turns frames appearing and disappearing between snapshots into calls.
+# calls get no values, and their lines are the snapshots they were the innermost traced frame in.
+class SamplingBackend:
+    name = 'sample'
+
+    def __init__(self, run, code_filter, interval=0.001):
+        self.run = run
+        self.code_filter = code_filter
+        self.interval = interval
+        self.samples = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._switch_interval = None
+        # os thread ident -> `(thread name, thread id)` in the run.
+        self._threads = {}
+        # os thread ident -> `(frame, call)` of the traced frames of the last snapshot, outermost first.
+        self._stacks = {}
+        # code -> whether it's accepted by the filter, as the same code objects show up in every snapshot.
+        self._accepted = {}
+
+    def _get_thread_id(self, ident):
+        thread = self._threads.get(ident)
+        if thread is None:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            name = names.get(ident, str(ident))
+            tid = next(self.run._tids)
+            thread = self._threads[ident] = (name, tid)
+            self.run.threads[tid] = name
+            if self.run.sink is not None:
+                self.run.sink.on_thread(tid, name)
+        return thread[1]
+
+    def _get_frames(self, frame):
+        accepted = self._accepted
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            ok = accepted.get(code)
+            if ok is None:
+                ok = accepted[code] = self.code_filter.accepts(code)
+            if ok:
+                frames.append(frame)
+            frame = frame.f_back
+        frames.reverse()
+        return frames
+
+    def _close(self, stack, start, ts):
+        sink = self.run.sink
+        for _, call in reversed(stack[start:]):
+            call._end_line(ts)
+            call.ret_timestamp = ts
+            if sink is not None:
+                sink.on_return(call)
+        del stack[start:]
+
+    def _open(self, stack, frame, tid, ts):
+        run = self.run
+        info = run.cache.get(frame.f_code)
+        call = Call(
+            info=info,
+            name=info.name,
+            parent=stack[-1][1].id if stack else None,
+            args={},
+            call_timestamp=ts,
+            thread=tid
+        )
+        run.add_call(call)
+        stack.append((frame, call))
+        if run.sink is not None:
+            run.sink.on_call(call)
+
+    def _sample(self):
+        run = self.run
+        ts = run.now()
+        frames = sys._current_frames()
+        own = threading.get_ident()
+        for ident, frame in frames.items():
+            if ident == own:
+                continue
+            stack = self._stacks.get(ident)
+            new_frames = self._get_frames(frame)
+            if stack is None:
+                if not new_frames:
+                    continue
+                stack = self._stacks[ident] = []
+
+            # frames are kept referenced between snapshots, so the same object is the same running frame.
+            common = 0
+            for (prev, _), frame in zip(stack, new_frames):
+                if prev is not frame:
+                    break
+                common += 1
+            self._close(stack, common, ts)
+            if new_frames:
+                tid = self._get_thread_id(ident)
+                for frame in new_frames[common:]:
+                    self._open(stack, frame, tid, ts)
+                frame, call = stack[-1]
+                self._add_line(call, frame.f_lineno, ts)
+
+        for ident in list(self._stacks):
+            if ident not in frames:
+                self._close(self._stacks.pop(ident), 0, ts)
+        self.samples += 1
+
+    def _add_line(self, call, num, ts):
+        call._end_line(ts)
+        call._line_timestamp = ts
+        lines = call.info.lines
+        line = Line(num=num, src=lines[num - 1] if 0 < num <= len(lines) else '')
+        if self.run.keep:
+            call.add_line(line)
+        if self.run.sink is not None:
+            self.run.sink.on_line(call, line)
+
+    def _loop(self):
+        while not self._stop_event.wait(self.interval):
+            self._sample()
+
+    # a thread running python code holds the gil for the switch interval (5ms by default), and the sampler can't
+    # wake up more often than that, so it's lowered below the sampling interval while sampling.
+    def start(self):
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch_interval, self.interval / 2))
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name='tracer-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        try:
+            self._thread.join()
+        finally:
+            sys.setswitchinterval(self._switch_interval)
+        self._thread = None
+        ts = self.run.now()
+        for stack in self._stacks.values():
+            self._close(stack, 0, ts)
+        self._stacks.clear()
+        self._accepted.clear()
@@ -0,0 +1,605 @@
+import os
+import json
+import mmap
+import reprlib
+import weakref
+import threading
+from time import time_ns
+from pathlib import Path
+
+from .core import Run, Call, Line, CodeInfo, _read_file_lines
+from .capture import DELETED
+
+MAGIC = b'TRACER\x00'
+VERSION = 4
+
+# chunk kinds.
+CHUNK_META = 1
+CHUNK_STRINGS = 2
+CHUNK_EVENTS = 3
+
+# event tags.
+EVENT_CALL = 1
+EVENT_LINE = 2
+EVENT_RETURN = 3
+EVENT_THREAD = 4
+EVENT_RESUME = 5
+EVENT_YIELD = 6
+
+
+# ids, line numbers and lengths mostly take one or two bytes.
+def _write_varint(buf, n):
+    if n < 0x80:
+        buf.append(n)
+        return
+    if n < 0x4000:
+        buf.append((n & 0x7f) | 0x80)
+        buf.append(n >> 7)
+        return
+    while n >= 0x80:
+        buf.append((n & 0x7f) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+
+def _read_varint(data, pos):
+    n = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+class TraceFormatError(Exception):
+    pass
+
+
+# values are written as their reprs, `DELETED` is kept as is.
+def _repr_value(repr_, value):
+    if value is DELETED or type(value) is str:
+        return value
+    try:
+        return repr_.repr(value)
+    except Exception:
+        return f'<unrepresentable {type(value).__name__}>'
+
+
+class TraceWriter:
+
+    # timestamps are written relative to `t0`, which defaults to the time the writer is created.
+    def __init__(self, path, meta=None, chunk_size=1 << 16, max_value_len=1024, t0=None):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.t0 = t0 if t0 is not None else time_ns()
+        self.meta = {'version': VERSION, 't0': self.t0, 'pid': os.getpid(), **(meta or {})}
+
+        self._repr = reprlib.Repr()
+        self._repr.maxstring = max_value_len
+        self._repr.maxother = max_value_len
+        self._max_value_len = max_value_len
+        self._strings = {}
+        self._pending_strings = []
+        self._events = bytearray()
+        self._lock = threading.Lock()
+        self._file = open(path, 'wb')
+        _writers.add(self)
+        self._file.write(MAGIC)
+        self._write_chunk(CHUNK_META, json.dumps(self.meta).encode('utf-8'))
+        self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def _write_chunk(self, kind, payload):
+        header = bytearray([kind])
+        _write_varint(header, len(payload))
+        self._file.write(header)
+        self._file.write(payload)
+
+    def _intern(self, s):
+        sid = self._strings.get(s)
+        if sid is None:
+            sid = self._strings[s] = len(self._strings)
+            self._pending_strings.append(s)
+        return sid
+
+    def _write_ts(self, buf, ts):
+        _write_varint(buf, max(ts - self.t0, 0) if ts is not None else 0)
+
+    def _write_value(self, buf, value):
+        value = _repr_value(self._repr, value)
+        if value is DELETED:
+            buf.append(0)
+            return
+
+        data = value[:self._max_value_len].encode('utf-8', errors='replace')
+        _write_varint(buf, len(data) + 1)
+        buf += data
+
+    def _write_values(self, buf, items):
+        if not items:
+            buf.append(0)
+            return
+        _write_varint(buf, len(items))
+        for name, value in items:
+            _write_varint(buf, self._intern(name))
+            self._write_value(buf, value)
+
+    def _append_event(self, tag, payload):
+        self._events.append(tag)
+        _write_varint(self._events, len(payload))
+        self._events += payload
+        if len(self._events) >= self.chunk_size:
+            self._flush()
+
+    # `write_*` encode events from plain fields, `on_*` take them from calls while tracing.
+    def write_call(self, call_id, parent, name, path, first_lineno, thread, task, ts, args):
+        buf = bytearray()
+        with self._lock:
+            _write_varint(buf, call_id)
+            _write_varint(buf, parent + 1 if parent is not None else 0)
+            _write_varint(buf, self._intern(name))
+            _write_varint(buf, self._intern(path or ''))
+            _write_varint(buf, first_lineno or 0)
+            _write_varint(buf, thread or 0)
+            _write_varint(buf, self._intern(task) + 1 if task is not None else 0)
+            self._write_ts(buf, ts)
+            self._write_values(buf, args)
+            self._append_event(EVENT_CALL, buf)
+
+    def write_thread(self, tid, name):
+        buf = bytearray()
+        with self._lock:
+            _write_varint(buf, tid)
+            _write_varint(buf, self._intern(name))
+            self._append_event(EVENT_THREAD, buf)
+
+    def write_line(self, call_id, num, ts, delta):
+        buf = bytearray()
+        with self._lock:
+            _write_varint(buf, call_id)
+            _write_varint(buf, num)
+            self._write_ts(buf, ts)
+            self._write_values(buf, delta)
+            self._append_event(EVENT_LINE, buf)
+
+    def write_resume(self, call_id, ts):
+        buf = bytearray()
+        with self._lock:
+            _write_varint(buf, call_id)
+            self._write_ts(buf, ts)
+            self._append_event(EVENT_RESUME, buf)
+
+    def write_yield(self, call_id, ts, value):
+        buf = bytearray()
+        with self._lock:
+            _write_varint(buf, call_id)
+            self._write_ts(buf, ts)
+            self._write_value(buf, value)
+            self._append_event(EVENT_YIELD, buf)
+
+    def write_return(self, call_id, ts, retval, delta):
+        buf = bytearray()
+        with self._lock:
+            _write_varint(buf, call_id)
+            self._write_ts(buf, ts)
+            self._write_value(buf, retval)
+            self._write_values(buf, delta)
+            self._append_event(EVENT_RETURN, buf)
+
+    def on_call(self, call):
+        info = call.info
+        self.write_call(
+            call.id,
+            call.parent,
+            call.name,
+            info.path,
+            info.first_lineno,
+            call.thread,
+            call.task,
+            call.call_timestamp,
+            list((call.args or {}).items())
+        )
+
+    def on_thread(self, tid, name):
+        self.write_thread(tid, name)
+
+    def on_line(self, call, line):
+        delta = line._delta or ()
+        self.write_line(call.id, line.num, call._line_timestamp, list(zip(delta[::2], delta[1::2])))
+
+    def on_resume(self, call):
+        self.write_resume(call.id, call.segments[-1])
+
+    # values yielded by coroutines are never captured.
+    def on_yield(self, call, value):
+        self.write_yield(call.id, call.segments[-1], value if call.info.generator else DELETED)
+
+    def on_return(self, call):
+        delta = call._ret_delta or ()
+        self.write_return(call.id, call.ret_timestamp, call.retval, list(zip(delta[::2], delta[1::2])))
+
+    # released calls end at their last yield, which is already written.
+    def on_release(self, call):
+        pass
+
+    # strings always land on disk before the events referring to them,
+    # so any prefix of complete chunks is a readable trace.
+    def _flush(self):
+        if self._pending_strings:
+            payload = bytearray()
+            _write_varint(payload, len(self._pending_strings))
+            for s in self._pending_strings:
+                data = s.encode('utf-8', errors='replace')
+                _write_varint(payload, len(data))
+                payload += data
+            self._write_chunk(CHUNK_STRINGS, payload)
+            self._pending_strings = []
+        if self._events:
+            self._write_chunk(CHUNK_EVENTS, self._events)
+            self._events = bytearray()
+        self._file.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._file.closed:
+                self._flush()
+
+    # meta known only at the end, i.e. counters of a collector, is written as another meta chunk which replaces the first.
+    def update_meta(self, **items):
+        with self._lock:
+            self.meta.update(items)
+            if not self._file.closed:
+                self._flush()
+                self._write_chunk(CHUNK_META, json.dumps(self.meta).encode('utf-8'))
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._flush()
+                self._file.close()
+
+    # a forked copy of the writer drops what it has buffered and writes nowhere, the file is the parent's.
+    # the lock might've been held by another thread of the parent, so it isn't taken.
+    def detach(self):
+        self._lock = threading.Lock()
+        self._events = bytearray()
+        self._pending_strings = []
+        # the file object is flushed after every chunk, so closing it writes nothing.
+        if not self._file.closed:
+            self._file.close()
+        self._file = open(os.devnull, 'wb')
+
+
+_writers = weakref.WeakSet()
+
+
+def _detach_writers():
+    for writer in list(_writers):
+        writer.detach()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_detach_writers)
+
+
+def _lazy_slot(name):
+    slot = getattr(Call, name)
+
+    def fget(self):
+        if not self._loaded:
+            self._reader._load_call(self)
+        return slot.__get__(self, type(self))
+
+    def fset(self, value):
+        slot.__set__(self, value)
+
+    return property(fget, fset)
+
+
+# call decoded only up to its name, caller and timestamps,
+# values and lines get decoded from the trace file on first access.
+# ids of calls may change once loaded, i.e. by merges of several processes, `_file_id` is the one in the file.
+# the number of lines is counted while scanning the file, so that profiles never need to decode them.
+class LazyCall(Call):
+    __slots__ = ('_reader', '_call_pos', '_ret_pos', '_loaded', '_file_id', '_num_lines')
+
+    def __init__(self, reader, call_pos, **kwargs):
+        super().__init__(**kwargs)
+        self._reader = reader
+        self._call_pos = call_pos
+        self._ret_pos = None
+        self._loaded = False
+        self._file_id = self.id
+        self._num_lines = 0
+
+    @property
+    def num_lines(self):
+        return self._num_lines
+
+
+for _name in ('args', 'retval', 'yields', 'lines', '_ret_delta'):
+    setattr(LazyCall, _name, _lazy_slot(_name))
+
+
+class TraceReader:
+
+    def __init__(self, path):
+        self.path = path
+        self.meta = {}
+        self.strings = []
+        # `(start, end)` offsets of payloads of events chunks.
+        self.chunks = []
+        self.truncated = False
+
+        self._file = open(path, 'rb')
+        self._data = b''
+        self._infos = {}
+        self._file_lines = {}
+        # file call id -> call of the last `load`.
+        self._calls = {}
+        # nothing stays open if the file can't be read.
+        try:
+            if os.fstat(self._file.fileno()).st_size:
+                self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._scan()
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def _scan(self):
+        data = self._data
+        if data[:len(MAGIC)] != MAGIC:
+            raise TraceFormatError(f'`{self.path}` is not a trace file.')
+
+        pos = len(MAGIC)
+        size = len(data)
+        while pos < size:
+            kind = data[pos]
+            try:
+                length, start = _read_varint(data, pos + 1)
+            except IndexError:
+                self.truncated = True
+                break
+            end = start + length
+            if end > size:
+                # a chunk cut off by a crash of the writing process.
+                self.truncated = True
+                break
+
+            if kind == CHUNK_META:
+                self.meta = json.loads(bytes(data[start:end]).decode('utf-8'))
+            elif kind == CHUNK_STRINGS:
+                self._read_strings(start)
+            elif kind == CHUNK_EVENTS:
+                self.chunks.append((start, end))
+            else:
+                raise TraceFormatError(f'unknown chunk kind `{kind}` at {pos}.')
+            pos = end
+
+        version = self.meta.get('version')
+        if version != VERSION:
+            raise TraceFormatError(f'`{self.path}` has version `{version}`, expected `{VERSION}`.')
+
+    def _read_strings(self, pos):
+        data = self._data
+        count, pos = _read_varint(data, pos)
+        for _ in range(count):
+            length, pos = _read_varint(data, pos)
+            self.strings.append(bytes(data[pos:pos + length]).decode('utf-8'))
+            pos += length
+
+    def _read_ts(self, pos):
+        ts, pos = _read_varint(self._data, pos)
+        return self.meta.get('t0', 0) + ts, pos
+
+    def _read_value(self, pos):
+        length, pos = _read_varint(self._data, pos)
+        if length == 0:
+            return DELETED, pos
+        end = pos + length - 1
+        return bytes(self._data[pos:end]).decode('utf-8'), end
+
+    def _read_values(self, pos):
+        count, pos = _read_varint(self._data, pos)
+        values = {}
+        for _ in range(count):
+            sid, pos = _read_varint(self._data, pos)
+            values[self.strings[sid]], pos = self._read_value(pos)
+        return values, pos
+
+    def _iter_events(self, first_chunk=0, first_pos=None, last_chunk=None):
+        data = self._data
+        last_chunk = len(self.chunks) - 1 if last_chunk is None else last_chunk
+        for chunk_idx in range(first_chunk, last_chunk + 1):
+            start, end = self.chunks[chunk_idx]
+            pos = first_pos if chunk_idx == first_chunk and first_pos is not None else start
+            while pos < end:
+                tag = data[pos]
+                length, payload = _read_varint(data, pos + 1)
+                yield chunk_idx, pos, tag, payload
+                pos = payload + length
+
+    def _get_info(self, name, path, first_lineno):
+        key = (name, path, first_lineno)
+        info = self._infos.get(key)
+        if info is None:
+            lines = self._file_lines.get(path)
+            if lines is None:
+                lines = self._file_lines[path] = _read_file_lines(path) if path else []
+            info = CodeInfo(name=name, path=path, traced=True, first_lineno=first_lineno, lines=lines)
+            self._infos[key] = info
+        return info
+
+    def load(self):
+        data = self._data
+        calls = {}
+        threads = {}
+        for chunk_idx, pos, tag, payload in self._iter_events():
+            if tag == EVENT_CALL:
+                call_id, p = _read_varint(data, payload)
+                parent, p = _read_varint(data, p)
+                name_sid, p = _read_varint(data, p)
+                path_sid, p = _read_varint(data, p)
+                first_lineno, p = _read_varint(data, p)
+                thread, p = _read_varint(data, p)
+                task_sid, p = _read_varint(data, p)
+                call_timestamp, p = self._read_ts(p)
+                name = self.strings[name_sid]
+                call = LazyCall(
+                    reader=self,
+                    call_pos=(chunk_idx, pos),
+                    id=call_id,
+                    info=self._get_info(name, self.strings[path_sid], first_lineno),
+                    name=name,
+                    parent=parent - 1 if parent else None,
+                    call_timestamp=call_timestamp,
+                    thread=thread,
+                    task=self.strings[task_sid - 1] if task_sid else None
+                )
+                calls[call_id] = call
+            elif tag == EVENT_LINE:
+                call_id, p = _read_varint(data, payload)
+                calls[call_id]._num_lines += 1
+            elif tag == EVENT_RETURN:
+                call_id, p = _read_varint(data, payload)
+                call = calls[call_id]
+                call.ret_timestamp, p = self._read_ts(p)
+                call._ret_pos = (chunk_idx, pos)
+                if call.segments is not None:
+                    call.segments.append(call.ret_timestamp)
+            elif tag == EVENT_YIELD:
+                call_id, p = _read_varint(data, payload)
+                call = calls[call_id]
+                call.ret_timestamp, p = self._read_ts(p)
+                if call.segments is None:
+                    call.segments = [call.call_timestamp]
+                call.segments.append(call.ret_timestamp)
+            elif tag == EVENT_RESUME:
+                call_id, p = _read_varint(data, payload)
+                ts, p = self._read_ts(p)
+                call = calls[call_id]
+                # dumps of a flight recorder may lack the yields of calls which started long before.
+                if call.segments is None:
+                    call.segments = [call.call_timestamp, call.call_timestamp]
+                call.segments.append(ts)
+            elif tag == EVENT_THREAD:
+                tid, p = _read_varint(data, payload)
+                name_sid, p = _read_varint(data, p)
+                threads[tid] = self.strings[name_sid]
+
+        # calls of different threads might reach the file out of their ids order.
+        self._calls = calls
+        calls = [calls[call_id] for call_id in sorted(calls)]
+        root = self.meta.get('root')
+        return Run(
+            root=Path(root) if root is not None else None,
+            calls=calls,
+            threads=threads,
+            overhead=self.meta.get('overhead', 0),
+            _readers=[self]
+        )
+
+    # `(call, line num, ns)` of every line of the calls of the last `load`, timed as `_load_call` does, in one pass.
+    def iter_line_times(self):
+        data = self._data
+        calls = self._calls
+        # call id -> `(num, timestamp)` of its last line.
+        last = {}
+        for _, _, tag, payload in self._iter_events():
+            if tag == EVENT_LINE:
+                call_id, p = _read_varint(data, payload)
+                num, p = _read_varint(data, p)
+                ts, p = self._read_ts(p)
+                prev = last.get(call_id)
+                if prev is not None:
+                    yield calls[call_id], prev[0], ts - prev[1]
+                last[call_id] = (num, ts)
+            elif tag == EVENT_RETURN or tag == EVENT_YIELD:
+                call_id, p = _read_varint(data, payload)
+                prev = last.pop(call_id, None)
+                if prev is not None:
+                    ts, p = self._read_ts(p)
+                    yield calls[call_id], prev[0], ts - prev[1]
+        # lines of calls which never returned have no time.
+        for call_id, (num, _) in last.items():
+            yield calls[call_id], num, None
+
+    # may run on several threads at once, e.g. the viewer's workers, the call is marked loaded only once it is.
+    def _load_call(self, call):
+        data = self._data
+        first_chunk, first_pos = call._call_pos
+        last_chunk = call._ret_pos[0] if call._ret_pos is not None else None
+        lines = []
+        yields = []
+        # times of lines are restored from timestamps of consecutive events, as `Run` does while tracing.
+        line_ts = None
+        for chunk_idx, pos, tag, payload in self._iter_events(first_chunk, first_pos, last_chunk):
+            if tag == EVENT_THREAD:
+                continue
+            call_id, p = _read_varint(data, payload)
+            if call_id != call._file_id:
+                continue
+
+            if tag == EVENT_CALL:
+                for _ in range(6):
+                    _, p = _read_varint(data, p)
+                _, p = self._read_ts(p)
+                call.args, p = self._read_values(p)
+            elif tag == EVENT_LINE:
+                num, p = _read_varint(data, p)
+                ts, p = self._read_ts(p)
+                delta, p = self._read_values(p)
+                if line_ts is not None:
+                    lines[-1].time = ts - line_ts
+                line_ts = ts
+                info_lines = call.info.lines
+                src = info_lines[num - 1] if num <= len(info_lines) else ''
+                lines.append(Line(num=num, src=src, delta=delta))
+            elif tag == EVENT_RETURN:
+                ts, p = self._read_ts(p)
+                if line_ts is not None:
+                    lines[-1].time = ts - line_ts
+                call.retval, p = self._read_value(p)
+                delta, p = self._read_values(p)
+                call.ret_delta = delta
+                break
+            elif tag == EVENT_YIELD:
+                ts, p = self._read_ts(p)
+                if line_ts is not None:
+                    lines[-1].time = ts - line_ts
+                    line_ts = None
+                value, p = self._read_value(p)
+                if value is not DELETED:
+                    yields.append(value)
+        call.lines = lines
+        call.yields = yields or None
+        call._loaded = True
+
+
+# the run keeps the file open for its lazy calls until it's closed, i.e. with `with load(path) as run:`.
+def load(path):
+    return TraceReader(path).load()
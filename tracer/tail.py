@@ -0,0 +1,44 @@
+# ns spent running, excluding the time a generator or coroutine was suspended.
+def _get_runtime(call):
+    segments = call.segments
+    if segments:
+        return sum(end - start for start, end in zip(segments[::2], segments[1::2]))
+    return call.ret_timestamp - call.call_timestamp
+
+
+# with tail capture calls are only kept once they've returned and turned out to be of interest:
+# slower than `slower_than` seconds, raising with `errors`, or matched by any of `matchers` on their arguments or return value.
+# callers of kept calls are kept along with them, so that kept calls stay in their place in the call tree.
+# every other call is dropped as soon as it returns and only leaves counters behind, even when its caller is kept later,
+# so that nothing but kept calls and the calls still running is held on to however long the run is.
+class TailPolicy:
+
+    def __init__(self, slower_than=None, errors=True, matchers=None):
+        self.slower_than = slower_than
+        self.errors = errors
+        self.matchers = list(matchers or ())
+        self._threshold = slower_than * 1e9 if slower_than is not None else None
+        self.kept = 0
+        # name -> `[calls, ns]` of dropped calls.
+        self.dropped = {}
+
+    @property
+    def dropped_calls(self):
+        return sum(calls for calls, _ in self.dropped.values())
+
+    def accepts(self, call):
+        if self.errors and call.exception is not None:
+            return True
+        if self._threshold is not None and _get_runtime(call) >= self._threshold:
+            return True
+        for matcher in self.matchers:
+            if next(matcher.match_call(call), None) is not None:
+                return True
+        return False
+
+    def drop(self, call):
+        stats = self.dropped.get(call.name)
+        if stats is None:
+            stats = self.dropped[call.name] = [0, 0]
+        stats[0] += 1
+        stats[1] += _get_runtime(call)